@@ -1,18 +1,160 @@
-from fastapi import APIRouter
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends
+from fastapi.responses import FileResponse, JSONResponse
 
-from ..constants import LANG_CONFIG_MAP
-from ..models.code import Code
-from ..service.execution_service import execute_code
+from ..auth.jwt_handler import get_current_username
+from ..backends import state_backend
+from ..constants import EDITING_ROLES, JOB_MAX_WAIT, LANG_CONFIG_MAP, MAX_TEST_CASES
+from ..jobs import job_queue, submit_execution
+from ..jobs.base import FINISHED_STATES
+from ..models.code import Code, TestCaseBatch
+from ..service.execution_engine import ExecutionQueueFull
+from ..service.execution_service import get_error_response, get_execution_stats
+from ..service.image_cache import image_cache
+from ..service.output_capture import output_store
 
 router = APIRouter()
 
+
+"""
+Whether one of the user's sockets is in the room, with a role that may
+edit it if `editing` is set
+"""
+async def is_room_member(room: str, username: str | None, editing: bool = False) -> bool:
+    if username is None:
+        return False
+    return any(
+        member["username"] == username and (not editing or member["role"] in EDITING_ROLES)
+        for member in await state_backend.members(room)
+    )
+
+
 """
-This endpoint is used to execute user code in a sandboxed environment.
+Submit an execution job of the user, see submit_execution.
+Runs in a room (which preempt the room's runs and stream into it) are only
+accepted from an authenticated editor of the room.
+"""
+async def submit_job(code: Code, username: str | None) -> JSONResponse:
+    if code.roomId:
+        if username is None:
+            return JSONResponse({"message": "Authentication required"}, status_code=401)
+        if not await is_room_member(code.roomId, username, editing=True):
+            return JSONResponse({"message": "Only editors of the room may run code in it"}, status_code=403)
+
+    try:
+        job = await submit_execution({**code.model_dump(), "username": username})
+    except Exception as err:
+        return get_error_response(err)
+    return JSONResponse(job, status_code=202)
+
+"""
+This endpoint submits user code for execution in a sandboxed environment.
+The code is run as a job by an execution worker; the response carries the
+job id, whose result is fetched from /jobs/{jobId}. With `roomId` set the
+room is notified when the job completes, and with `stream` set the output
+is pushed to the room over Socket.IO as it is produced. Unfinished runs of
+the same room are cancelled.
 """
 @router.post("/execute")
-async def run_code(code: Code):
+async def run_code(code: Code, username: str | None = Depends(get_current_username)):
+    if code.language not in LANG_CONFIG_MAP.keys():
+        return JSONResponse({"message": "Language not supported"}, status_code=400)
+
+    if code.stream and not code.roomId:
+        return JSONResponse({"message": "roomId is required for streaming"}, status_code=400)
+
+    return await submit_job(code, username)
+
+
+"""
+This endpoint runs user code against a batch of test cases (stdin, optional
+expected output and time limit). The code is compiled once and all cases
+run in the same sandbox; like /execute it submits a job, whose result holds
+the setup outcome and the stdout, stderr, exit code, wall time and verdict
+of every case. With `stream` set every case result is also pushed to the
+room as soon as the case has finished.
+"""
+@router.post("/execute/batch")
+async def run_test_case_batch(batch: TestCaseBatch, username: str | None = Depends(get_current_username)):
+    if batch.language not in LANG_CONFIG_MAP.keys():
+        return JSONResponse({"message": "Language not supported"}, status_code=400)
+
+    if not batch.testCases or len(batch.testCases) > MAX_TEST_CASES:
+        return JSONResponse({"message": f"Between 1 and {MAX_TEST_CASES} test cases are required"}, status_code=400)
+
+    if batch.stream and not batch.roomId:
+        return JSONResponse({"message": "roomId is required for streaming"}, status_code=400)
+
+    return await submit_job(batch, username)
+
+
+"""
+This endpoint returns an execution job with its result once it has finished.
+With `wait` set it long-polls: the response is held for up to `wait`
+seconds (at most JOB_MAX_WAIT) until the job finishes.
+"""
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    job = await job_queue.wait(job_id, min(max(wait, 0), JOB_MAX_WAIT))
+    if job is None:
+        return JSONResponse({"message": "Job not found"}, status_code=404)
+    return JSONResponse(job)
+
+
+"""
+This endpoint cancels an execution job. A queued job is cancelled at once;
+for a running job the container is killed and its execution slot released,
+and the job finishes with status `cancelled` shortly after. Only the user
+who submitted the job, or a member of its room, may cancel it.
+"""
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, username: str | None = Depends(get_current_username)):
+    if username is None:
+        return JSONResponse({"message": "Authentication required"}, status_code=401)
+    job = await job_queue.get(job_id)
+    if job is None:
+        return JSONResponse({"message": "Job not found"}, status_code=404)
+    if job.get("username") != username and not (
+        job["roomId"] and await is_room_member(job["roomId"], username)
+    ):
+        return JSONResponse({"message": "Not allowed to cancel this job"}, status_code=403)
+    if job["status"] in FINISHED_STATES or await job_queue.cancel(job_id) is None:
+        return JSONResponse({"message": "Job has already finished"}, status_code=409)
+    return JSONResponse(await job_queue.get(job_id), status_code=202)
+
+
+"""
+This endpoint returns the full stdout or stderr of an execution whose
+output was truncated, by the `output_id` of its result. Spilled output is
+kept for OUTPUT_SPILL_TTL seconds.
+"""
+@router.get("/outputs/{output_id}/{stream}")
+async def get_output(output_id: str, stream: str):
+    path = output_store.lookup(output_id, stream) if output_store else None
+    if path is None:
+        return JSONResponse({"message": "Output not found"}, status_code=404)
+    return FileResponse(path, media_type="text/plain; charset=utf-8")
+
+
+"""
+This endpoint reports the state of the execution engine and its caches.
+"""
+@router.get("/execution-stats")
+async def execution_stats():
+    return JSONResponse({**get_execution_stats(), "jobs": await job_queue.stats()})
+
+
+"""
+This endpoint prepares an environment with the given prerequisites
+installed in the background, so that later runs do not have to install them.
+Like executions, builds are refused with 429 while too many are pending.
+"""
+@router.post("/environments")
+async def prepare_environment(code: Code):
     if code.language not in LANG_CONFIG_MAP.keys():
         return JSONResponse({"message": "Language not supported"}, status_code=400)
+    if not image_cache:
+        return JSONResponse({"message": "Prepared environments are disabled"}, status_code=404)
 
-    return execute_code(code)
+    if not image_cache.schedule_build(code.language, code.prerequisites or ""):
+        return get_error_response(ExecutionQueueFull())
+    return JSONResponse({"message": "Environment build scheduled"}, status_code=202)
@@ -0,0 +1,52 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from ..auth.security import password_hasher
+from ..constants import ROOM_ROLES
+from ..jobs import job_queue
+from ..metrics import metrics
+from ..service.execution_engine import execution_scheduler
+from ..service.room_persistence import room_persistence
+from ..sockets.socket_manager import broadcaster, local_room_stats
+
+router = APIRouter()
+
+ACTIVE_ROOMS = metrics.gauge("simcode_rooms_active", "Rooms with members connected to this process")
+ROOM_MEMBERS = metrics.gauge("simcode_room_members", "Room members connected to this process")
+ROOM_MEMBERS_BY_ROLE = metrics.gauge("simcode_room_members_by_role", "Room members connected to this process, by role", ("role",))
+EXECUTIONS_RUNNING = metrics.gauge("simcode_executions_running", "Sandbox executions in progress, by language", ("language",))
+EXECUTIONS_WAITING = metrics.gauge("simcode_executions_waiting", "Sandbox executions waiting for admission, by language", ("language",))
+JOBS_PENDING = metrics.gauge("simcode_jobs_pending", "Execution jobs waiting for a worker")
+BROADCAST_PENDING_ROOMS = metrics.gauge("simcode_broadcast_pending_rooms", "Rooms with outbound editor events waiting to be flushed")
+ROOMS_UNFLUSHED = metrics.gauge("simcode_rooms_unflushed", "Rooms with changes not yet written to the database")
+PASSWORD_HASHES_PENDING = metrics.gauge("simcode_password_hashes_pending", "Password hashing operations running or waiting")
+
+
+"""
+Refresh the gauges from the state of the rooms and queues
+"""
+@metrics.collector
+async def collect_queue_depths():
+    rooms = local_room_stats()
+    ACTIVE_ROOMS.set(rooms["rooms"])
+    ROOM_MEMBERS.set(rooms["members"])
+    for role in ROOM_ROLES:
+        ROOM_MEMBERS_BY_ROLE.set(rooms["roles"].get(role, 0), role=role)
+
+    for language, stats in execution_scheduler.stats()["languages"].items():
+        EXECUTIONS_RUNNING.set(stats["running"], language=language)
+        EXECUTIONS_WAITING.set(stats["waiting"], language=language)
+
+    JOBS_PENDING.set((await job_queue.stats())["pending"])
+    BROADCAST_PENDING_ROOMS.set(broadcaster.stats()["pending_rooms"])
+    if room_persistence:
+        ROOMS_UNFLUSHED.set(room_persistence.stats()["unflushed_rooms"])
+    PASSWORD_HASHES_PENDING.set(password_hasher.stats()["pending"])
+
+
+"""
+This endpoint exposes the server's metrics in the Prometheus text format.
+"""
+@router.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(await metrics.render(), media_type="text/plain; version=0.0.4")
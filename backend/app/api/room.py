@@ -1,23 +1,40 @@
 from fastapi import APIRouter
 from fastapi.responses import JSONResponse
 
-from ..sockets.socket_manager import connected_room_socket_mapping
+from ..backends import state_backend
+from ..service.room_persistence import room_persistence
+from ..sockets.room_runs import room_runs
+from ..sockets.socket_manager import broadcaster, sio, viewer_stream
 
 router = APIRouter()
 
 """
-This endpoint is used to get the number of users in a room.
+This endpoint is used to get the number of users in a room, in total and by role.
 """
 @router.get("/room-user-count")
 async def return_count(roomId: str = None):
-    global connected_room_socket_mapping
+    return JSONResponse(
+        {
+            "member_count": await state_backend.member_count(roomId),
+            "roles": await state_backend.role_counts(roomId),
+        }
+    )
 
+
+"""
+This endpoint reports room membership, broadcast, viewer stream, run and
+persistence statistics. `fanout` counts the room broadcast events delivered
+to the sockets of this process by the role of the recipient.
+"""
+@router.get("/room-stats")
+async def room_stats():
     return JSONResponse(
         {
-            "member_count": (
-                len(connected_room_socket_mapping.get(roomId))
-                if roomId in connected_room_socket_mapping
-                else 0
-            )
+            "rooms": await state_backend.stats(),
+            "broadcast": broadcaster.stats(),
+            "viewers": viewer_stream.stats(),
+            "fanout": dict(sio.deliveries),
+            "runs": room_runs.stats(),
+            "persistence": room_persistence.stats() if room_persistence else None,
         }
     )
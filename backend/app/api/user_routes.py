@@ -1,15 +1,15 @@
 from app.models.user_schema import UserIn
 from app.service import user_service
-from db import get_db
+from db import db_stats, get_db
 from fastapi import APIRouter, Depends
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter()
 
 @router.post("/signup")
-def signup(user: UserIn, db: Session = Depends(get_db)):
-    return user_service.signup_user(
+async def signup(user: UserIn, db: AsyncSession = Depends(get_db)):
+    return await user_service.signup_user(
         db=db,
         username=user.username,
         email=user.email,
@@ -18,9 +18,16 @@ def signup(user: UserIn, db: Session = Depends(get_db)):
     )
 
 @router.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    return user_service.login_user(
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    return await user_service.login_user(
         db=db,
         username=form_data.username,
         password=form_data.password
     )
+
+"""
+This endpoint reports the database connection pool and query latency.
+"""
+@router.get("/db-stats")
+async def database_stats():
+    return db_stats.stats()
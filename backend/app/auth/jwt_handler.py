@@ -1,13 +1,88 @@
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
-from jose import jwt
+from app.constants import TOKEN_CACHE_SIZE
+from fastapi import Depends
+from fastapi.security import OAuth2PasswordBearer
+from jose import JWTError, jwt
 
 SECRET_KEY = "your_secret_key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# endpoints that also serve anonymous requests read the token when there is one
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login", auto_error=False)
 
 def create_access_token(data: dict, expires_minutes: int = ACCESS_TOKEN_EXPIRE_MINUTES):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=expires_minutes)
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
\ No newline at end of file
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+
+"""
+Cache of access tokens whose signature has already been verified, so that
+reconnecting sockets do not pay for a full JWT verification every time.
+An entry is only used until the token's own expiry, and at most `max_size`
+tokens are kept (least recently used are dropped first).
+"""
+class VerifiedTokenCache:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+
+    def get(self, token: str) -> dict | None:
+        claims = self._entries.get(token)
+        if claims is None:
+            self.misses += 1
+            return None
+        if claims["exp"] <= time.time():
+            del self._entries[token]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return claims
+
+    def put(self, token: str, claims: dict):
+        self._entries[token] = claims
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+token_cache = VerifiedTokenCache(TOKEN_CACHE_SIZE)
+
+
+"""
+Verify an access token and return its claims, or None if it is invalid or
+expired
+"""
+def decode_access_token(token: str) -> dict | None:
+    claims = token_cache.get(token)
+    if claims is not None:
+        return claims
+
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    if "exp" not in claims:
+        return None
+
+    token_cache.put(token, claims)
+    return claims
+
+
+"""
+Username of the bearer token a request carries, or None without a valid one
+"""
+async def get_current_username(token: str | None = Depends(optional_oauth2_scheme)) -> str | None:
+    claims = decode_access_token(token) if token else None
+    return claims.get("sub") if claims else None
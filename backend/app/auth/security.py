@@ -1,21 +1,71 @@
+import asyncio
 import re
+from concurrent.futures import ThreadPoolExecutor
 
+from app.constants import BCRYPT_ROUNDS, MAX_QUEUED_PASSWORD_HASHES, PASSWORD_HASH_WORKERS
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 
 SECRET_KEY = "your-secret-key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# hashes made with a different cost are reported as needing an update
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+class PasswordHasherBusy(Exception):
+    pass
+
+
+"""
+Runs bcrypt on a small dedicated thread pool (bcrypt releases the GIL), so
+that a burst of logins neither blocks the event loop nor takes the default
+thread pool away from other work. At most `max_queued` operations wait for
+a worker; beyond that PasswordHasherBusy is raised.
+"""
+class PasswordHasher:
+    def __init__(self, workers: int, max_queued: int):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.pending = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+
+    async def _run(self, func, *args):
+        if self.pending >= self.workers + self.max_queued:
+            self.rejected += 1
+            raise PasswordHasherBusy()
+
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+    """
+    Verify a password; returns (valid, new hash) where the new hash is set
+    when the stored one was made with a different cost and should be replaced
+    """
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+        return await self._run(pwd_context.verify_and_update, plain_password, hashed_password)
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "pending": self.pending, "rejected": self.rejected}
+
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, MAX_QUEUED_PASSWORD_HASHES)
+
+
+async def hash_password(password: str) -> str:
+    return await password_hasher.hash(password)
+
+async def verify_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return await password_hasher.verify_and_update(plain_password, hashed_password)
 
 def is_valid_password(password: str) -> bool:
     # Minimum 8 characters, at least 1 uppercase, 1 lowercase, 1 digit, 1 special character
@@ -0,0 +1,17 @@
+from ..constants import REDIS_URL, STATE_BACKEND
+from .base import StateBackend
+from .memory import InMemoryStateBackend
+
+"""
+Create the state backend selected by the STATE_BACKEND setting
+"""
+def create_state_backend() -> StateBackend:
+    if STATE_BACKEND == "redis":
+        # imported lazily, redis is only needed for multi-worker deployments
+        from .redis_backend import RedisStateBackend
+
+        return RedisStateBackend.from_url(REDIS_URL)
+    return InMemoryStateBackend()
+
+
+state_backend = create_state_backend()
@@ -0,0 +1,90 @@
+"""
+Interface for the state shared by all workers serving rooms: room
+membership, the canonical room documents and settings, and the Socket.IO client manager
+used to fan events out to sockets connected to other workers.
+"""
+class StateBackend:
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    """
+    Socket.IO client manager for cross-process event fan-out, or None to use
+    the default process-local manager
+    """
+    def client_manager(self):
+        return None
+
+    # Room membership
+
+    async def join(self, room: str, sid: str, username: str, role: str):
+        raise NotImplementedError
+
+    async def leave(self, room: str, sid: str) -> str | None:
+        raise NotImplementedError
+
+    async def leave_all(self, sid: str) -> list[tuple[str, str]]:
+        raise NotImplementedError
+
+    async def rooms_of(self, sid: str) -> set[str]:
+        raise NotImplementedError
+
+    async def members(self, room: str) -> list[dict]:
+        raise NotImplementedError
+
+    async def member_count(self, room: str) -> int:
+        raise NotImplementedError
+
+    """
+    Number of members of the room by role
+    """
+    async def role_counts(self, room: str) -> dict[str, int]:
+        raise NotImplementedError
+
+    # Room documents
+
+    """
+    Returns (text, version) of the room's document, or None if there is none
+    """
+    async def get_document(self, room: str) -> tuple[str, int] | None:
+        raise NotImplementedError
+
+    """
+    Apply client ops based on `base_version` to the room's document.
+    Returns the transformed ops and the new version; raises StaleVersionError.
+    """
+    async def apply_ops(self, room: str, base_version: int, ops: list[tuple]) -> tuple[list[tuple], int]:
+        raise NotImplementedError
+
+    """
+    Replace the room's document text.
+    Returns the ops that replaced it and the new version.
+    """
+    async def replace_document(self, room: str, text: str) -> tuple[list[tuple], int]:
+        raise NotImplementedError
+
+    """
+    Install a document loaded from storage, unless the room already has one.
+    Returns whether it was installed.
+    """
+    async def restore_document(self, room: str, text: str, version: int) -> bool:
+        raise NotImplementedError
+
+    """
+    Drop the room's document and settings
+    """
+    async def drop_document(self, room: str):
+        raise NotImplementedError
+
+    # Room settings (language, prerequisites)
+
+    async def get_settings(self, room: str) -> dict:
+        raise NotImplementedError
+
+    async def update_settings(self, room: str, **settings):
+        raise NotImplementedError
+
+    async def stats(self) -> dict:
+        return {}
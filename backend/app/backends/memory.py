@@ -0,0 +1,66 @@
+from ..service.document_service import RoomDocument
+from .room_registry import RoomRegistry
+from .base import StateBackend
+
+
+"""
+Process-local state backend. Fastest option, but every member of a room
+must be connected to the same worker.
+"""
+class InMemoryStateBackend(StateBackend):
+    def __init__(self):
+        self.registry = RoomRegistry()
+        self.documents: dict[str, RoomDocument] = {}
+        self.settings: dict[str, dict] = {}
+
+    async def join(self, room: str, sid: str, username: str, role: str):
+        self.registry.join(room, sid, username, role)
+
+    async def leave(self, room: str, sid: str) -> str | None:
+        return self.registry.leave(room, sid)
+
+    async def leave_all(self, sid: str) -> list[tuple[str, str]]:
+        return self.registry.leave_all(sid)
+
+    async def rooms_of(self, sid: str) -> set[str]:
+        return self.registry.rooms_of(sid)
+
+    async def members(self, room: str) -> list[dict]:
+        return self.registry.members(room)
+
+    async def member_count(self, room: str) -> int:
+        return self.registry.member_count(room)
+
+    async def role_counts(self, room: str) -> dict[str, int]:
+        return self.registry.role_counts(room)
+
+    async def get_document(self, room: str) -> tuple[str, int] | None:
+        document = self.documents.get(room)
+        return (document.text, document.version) if document else None
+
+    async def apply_ops(self, room: str, base_version: int, ops: list[tuple]) -> tuple[list[tuple], int]:
+        document = self.documents.setdefault(room, RoomDocument())
+        return document.apply(base_version, ops), document.version
+
+    async def replace_document(self, room: str, text: str) -> tuple[list[tuple], int]:
+        document = self.documents.setdefault(room, RoomDocument())
+        return document.replace(text), document.version
+
+    async def restore_document(self, room: str, text: str, version: int) -> bool:
+        if room in self.documents:
+            return False
+        self.documents[room] = RoomDocument(text, version)
+        return True
+
+    async def drop_document(self, room: str):
+        self.documents.pop(room, None)
+        self.settings.pop(room, None)
+
+    async def get_settings(self, room: str) -> dict:
+        return dict(self.settings.get(room, {}))
+
+    async def update_settings(self, room: str, **settings):
+        self.settings.setdefault(room, {}).update(settings)
+
+    async def stats(self) -> dict:
+        return {**self.registry.stats(), "documents": len(self.documents)}
@@ -0,0 +1,249 @@
+import asyncio
+import json
+import logging
+import uuid
+from collections import Counter
+
+import socketio
+from redis import asyncio as aioredis
+from redis.exceptions import WatchError
+
+from ..constants import DOCUMENT_HISTORY_SIZE, STATE_HEARTBEAT_INTERVAL, STATE_HEARTBEAT_TTL
+from ..service.document_service import RoomDocument
+from .base import StateBackend
+
+KEY_PREFIX = "simcode"
+SOCKETIO_CHANNEL = f"{KEY_PREFIX}-socketio"
+WORKERS_KEY = f"{KEY_PREFIX}:workers"
+
+logger = logging.getLogger(__name__)
+
+
+"""
+State backend shared through Redis, so that members of the same room can be
+connected to different workers or hosts. Membership lives in two hashes per
+room (usernames and roles) and one set per socket, documents in a hash plus
+a capped list of the most recent ops, room settings in another hash, and
+Socket.IO events are fanned out over Redis pub/sub. Document updates use
+optimistic WATCH/MULTI transactions, so concurrent ops from different
+workers are serialized and transformed like local ones. Every worker keeps
+the set of sockets it added to rooms next to a heartbeat key, so that the
+members of a worker that died without its sockets leaving can be removed.
+"""
+class RedisStateBackend(StateBackend):
+    def __init__(
+        self,
+        client,
+        url: str | None = None,
+        heartbeat_interval: float = STATE_HEARTBEAT_INTERVAL,
+        heartbeat_ttl: float = STATE_HEARTBEAT_TTL,
+    ):
+        self.redis = client
+        self.url = url
+        self.worker_id = uuid.uuid4().hex
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_ttl = heartbeat_ttl
+        self.removed_members = 0
+        self._heartbeat_task = None
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisStateBackend":
+        return cls(aioredis.from_url(url, decode_responses=True), url)
+
+    def client_manager(self):
+        return socketio.AsyncRedisManager(self.url, channel=SOCKETIO_CHANNEL) if self.url else None
+
+    async def start(self):
+        await self.heartbeat()
+        await self.remove_dead_workers()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self):
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        # the sockets of this worker go away with it
+        await self._remove_worker(self.worker_id)
+        await self.redis.aclose()
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self.heartbeat()
+                await self.remove_dead_workers()
+            except Exception as err:
+                logger.warning("State backend heartbeat failed: %r", err)
+
+    async def heartbeat(self):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(self._worker_key(self.worker_id), 1, px=int(self.heartbeat_ttl * 1000))
+            pipe.sadd(WORKERS_KEY, self.worker_id)
+            await pipe.execute()
+
+    """
+    Remove the room members of workers whose heartbeat has expired.
+    Returns the number of memberships removed.
+    """
+    async def remove_dead_workers(self) -> int:
+        removed = 0
+        for worker in await self.redis.smembers(WORKERS_KEY):
+            if worker != self.worker_id and not await self.redis.exists(self._worker_key(worker)):
+                removed += await self._remove_worker(worker)
+        if removed:
+            logger.info("Removed %d room members of dead workers", removed)
+        return removed
+
+    async def _remove_worker(self, worker: str) -> int:
+        removed = 0
+        for sid in await self.redis.smembers(self._worker_sids_key(worker)):
+            removed += len(await self.leave_all(sid))
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(self._worker_sids_key(worker))
+            pipe.srem(WORKERS_KEY, worker)
+            await pipe.execute()
+        self.removed_members += removed
+        return removed
+
+    @staticmethod
+    def _worker_key(worker: str) -> str:
+        return f"{KEY_PREFIX}:worker:{worker}"
+
+    @staticmethod
+    def _worker_sids_key(worker: str) -> str:
+        return f"{KEY_PREFIX}:worker:{worker}:sids"
+
+    @staticmethod
+    def _members_key(room: str) -> str:
+        return f"{KEY_PREFIX}:room:{room}:members"
+
+    @staticmethod
+    def _roles_key(room: str) -> str:
+        return f"{KEY_PREFIX}:room:{room}:roles"
+
+    @staticmethod
+    def _rooms_key(sid: str) -> str:
+        return f"{KEY_PREFIX}:sid:{sid}:rooms"
+
+    @staticmethod
+    def _document_key(room: str) -> str:
+        return f"{KEY_PREFIX}:doc:{room}"
+
+    @staticmethod
+    def _history_key(room: str) -> str:
+        return f"{KEY_PREFIX}:doc:{room}:history"
+
+    @staticmethod
+    def _settings_key(room: str) -> str:
+        return f"{KEY_PREFIX}:doc:{room}:settings"
+
+    async def join(self, room: str, sid: str, username: str, role: str):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self._members_key(room), sid, username)
+            pipe.hset(self._roles_key(room), sid, role)
+            pipe.sadd(self._rooms_key(sid), room)
+            pipe.sadd(self._worker_sids_key(self.worker_id), sid)
+            await pipe.execute()
+
+    async def leave(self, room: str, sid: str) -> str | None:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hget(self._members_key(room), sid)
+            pipe.hdel(self._members_key(room), sid)
+            pipe.hdel(self._roles_key(room), sid)
+            pipe.srem(self._rooms_key(sid), room)
+            username, _, _, _ = await pipe.execute()
+        return username
+
+    async def leave_all(self, sid: str) -> list[tuple[str, str]]:
+        rooms = await self.redis.smembers(self._rooms_key(sid))
+        left = [(room, await self.leave(room, sid)) for room in rooms]
+        await self.redis.srem(self._worker_sids_key(self.worker_id), sid)
+        return left
+
+    async def rooms_of(self, sid: str) -> set[str]:
+        return set(await self.redis.smembers(self._rooms_key(sid)))
+
+    async def members(self, room: str) -> list[dict]:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hgetall(self._members_key(room))
+            pipe.hgetall(self._roles_key(room))
+            members, roles = await pipe.execute()
+        return [
+            {"socketId": sid, "username": username, "role": roles.get(sid)}
+            for sid, username in members.items()
+        ]
+
+    async def member_count(self, room: str) -> int:
+        return await self.redis.hlen(self._members_key(room))
+
+    async def role_counts(self, room: str) -> dict[str, int]:
+        return dict(Counter(await self.redis.hvals(self._roles_key(room))))
+
+    async def get_document(self, room: str) -> tuple[str, int] | None:
+        text, version = await self.redis.hmget(self._document_key(room), "text", "version")
+        return (text or "", int(version)) if version is not None else None
+
+    """
+    Load the document together with the ops applied after `base_version`,
+    run `update` on it and write the result back, retrying if another
+    worker changed the document in the meantime
+    """
+    async def _update_document(self, room: str, base_version: int | None, update):
+        document_key = self._document_key(room)
+        history_key = self._history_key(room)
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(document_key, history_key)
+                    text, version = await pipe.hmget(document_key, "text", "version")
+                    document = RoomDocument(text or "", int(version or 0))
+
+                    missed = document.version - (document.version if base_version is None else base_version)
+                    if 0 < missed <= DOCUMENT_HISTORY_SIZE:
+                        history = await pipe.lrange(history_key, -missed, -1)
+                        document.history.extend(
+                            [tuple(op) for op in json.loads(entry)] for entry in history
+                        )
+
+                    result = update(document)
+
+                    pipe.multi()
+                    pipe.hset(document_key, mapping={"text": document.text, "version": document.version})
+                    pipe.rpush(history_key, json.dumps(document.history[-1]))
+                    pipe.ltrim(history_key, -DOCUMENT_HISTORY_SIZE, -1)
+                    await pipe.execute()
+                    return result, document.version
+                except WatchError:
+                    continue
+
+    async def apply_ops(self, room: str, base_version: int, ops: list[tuple]) -> tuple[list[tuple], int]:
+        return await self._update_document(room, base_version, lambda document: document.apply(base_version, ops))
+
+    async def replace_document(self, room: str, text: str) -> tuple[list[tuple], int]:
+        return await self._update_document(room, None, lambda document: document.replace(text))
+
+    async def restore_document(self, room: str, text: str, version: int) -> bool:
+        document_key = self._document_key(room)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(document_key)
+                if await pipe.exists(document_key):
+                    return False
+                pipe.multi()
+                pipe.hset(document_key, mapping={"text": text, "version": version})
+                pipe.delete(self._history_key(room))
+                await pipe.execute()
+                return True
+            except WatchError:
+                # another worker created the document first
+                return False
+
+    async def drop_document(self, room: str):
+        await self.redis.delete(self._document_key(room), self._history_key(room), self._settings_key(room))
+
+    async def get_settings(self, room: str) -> dict:
+        return await self.redis.hgetall(self._settings_key(room))
+
+    async def update_settings(self, room: str, **settings):
+        await self.redis.hset(self._settings_key(room), mapping=settings)
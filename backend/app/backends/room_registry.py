@@ -0,0 +1,66 @@
+from collections import Counter
+
+
+"""
+In-memory index of room membership.
+Rooms map socket ids to usernames and roles and every socket id maps back to the rooms
+it joined, so joins, leaves and disconnect cleanup are all constant time per
+room and empty rooms are evicted as soon as their last member goes away.
+"""
+class RoomRegistry:
+    def __init__(self):
+        self._rooms: dict[str, dict[str, tuple[str, str]]] = {}
+        self._sid_rooms: dict[str, set[str]] = {}
+
+    def join(self, room: str, sid: str, username: str, role: str):
+        self._rooms.setdefault(room, {})[sid] = (username, role)
+        self._sid_rooms.setdefault(sid, set()).add(room)
+
+    """
+    Remove a socket from a room.
+    Returns the username it joined with, or None if it was not a member.
+    """
+    def leave(self, room: str, sid: str) -> str | None:
+        members = self._rooms.get(room)
+        if members is None or sid not in members:
+            return None
+
+        username, _ = members.pop(sid)
+        if not members:
+            del self._rooms[room]
+
+        rooms = self._sid_rooms.get(sid)
+        if rooms is not None:
+            rooms.discard(room)
+            if not rooms:
+                del self._sid_rooms[sid]
+        return username
+
+    """
+    Remove a socket from every room it is in.
+    Returns (room, username) pairs for the rooms it left.
+    """
+    def leave_all(self, sid: str) -> list[tuple[str, str]]:
+        return [(room, self.leave(room, sid)) for room in list(self._sid_rooms.get(sid, ()))]
+
+    def rooms_of(self, sid: str) -> set[str]:
+        return set(self._sid_rooms.get(sid, ()))
+
+    def members(self, room: str) -> list[dict]:
+        return [
+            {"socketId": sid, "username": username, "role": role}
+            for sid, (username, role) in self._rooms.get(room, {}).items()
+        ]
+
+    def member_count(self, room: str) -> int:
+        return len(self._rooms.get(room, ()))
+
+    def role_counts(self, room: str) -> dict[str, int]:
+        return dict(Counter(role for _, role in self._rooms.get(room, {}).values()))
+
+    def stats(self) -> dict:
+        return {
+            "rooms": len(self._rooms),
+            "members": len(self._sid_rooms),
+            "roles": dict(Counter(role for members in self._rooms.values() for _, role in members.values())),
+        }
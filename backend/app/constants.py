@@ -1,40 +1,253 @@
+import os
+
 ACTION_JOINED = "joined"
 ACTION_DISCONNECTED = "disconnected"
 ACTION_LANG_CHANGE = "lang_change"
 ACTION_CODE_CHANGE = "code_change"
 ACTION_PREREQ_CHANGE = "prereq_change"
 ACTION_CODE_EXECUTED = "code_executed"
+ACTION_CODE_OP = "code_op"
+ACTION_CODE_OP_ACK = "code_op_ack"
+ACTION_CODE_SYNC = "code_sync"
+ACTION_ROOM_STATE = "room_state"
+ACTION_EXECUTION_STARTED = "execution_started"
+ACTION_EXECUTION_STDOUT = "execution_stdout"
+ACTION_EXECUTION_STDERR = "execution_stderr"
+ACTION_EXECUTION_EXIT = "execution_exit"
+ACTION_JOB_COMPLETED = "job_completed"
+ACTION_TEST_CASE_RESULT = "test_case_result"
 
 FRONTEND_PORT = 3000
 FRONTEND_URL = f"http://localhost:{FRONTEND_PORT}"
 
+# options of every sandbox JVM: a quick start-up, and a heap that leaves the
+# rest of the java profile's memory to metaspace, code cache and stacks
+JAVA_OPTIONS = os.getenv("JAVA_OPTIONS", "-Xshare:auto -XX:+UseSerialGC -XX:-UsePerfData -Xmx768m")
+
 USER_SCRIPT_FILE_NAME = "run_combined.sh"
+CASE_SCRIPT_FILE_NAME = "run_case.sh"
 LANG_CONFIG_MAP = {
     "python": {
         "file": "user_code.py",
         "command": ["python3", "user_code.py"],
         "image": "python:3.10-slim",
+        "cpus": 0.5,
+        "memory": 256,
+        "max_concurrent": 4,
     },
     "cpp": {
         "file": "user_code.cpp",
         "command": ["g++ user_code.cpp -o out && ./out"],
+        "compile": "g++ user_code.cpp -o out",
+        "run": "./out",
+        "artifacts": ["out"],
         "image": "gcc:latest",
+        "cpus": 1,
+        "memory": 512,
+        "max_concurrent": 2,
     },
     "java": {
         "file": "Main.java",
-        "command": ["javac Main.java && java Main"],
+        "command": [f"javac Main.java && java {JAVA_OPTIONS} Main"],
+        "compile": "javac Main.java",
+        "run": f"java {JAVA_OPTIONS} Main",
+        # compiles in memory and runs in a single JVM
+        "fast_run": f"java {JAVA_OPTIONS} Main.java",
+        "artifacts": ["*.class"],
         "image": "openjdk:17-slim",
+        "cpus": 1,
+        "memory": 1024,
+        "max_concurrent": 2,
     },
     "javascript": {
         "file": "user_code.js",
         "command": ["node", "user_code.js"],
         "image": "node:18-slim",
+        "cpus": 0.5,
+        "memory": 256,
+        "max_concurrent": 4,
     },
     "bash": {
         "file": "user_code.sh",
         "command": ["bash", "user_code.sh"],
         "image": "ubuntu:22.04",
+        "cpus": 0.25,
+        "memory": 128,
+        "max_concurrent": 4,
     },
 }
+# languages the editor offers that are not run, a room may still switch to them
+EDITOR_ONLY_LANGUAGES = frozenset({"markdown"})
 DEFAULT_EXECUTION_TIMEOUT = 60
 JAVA_EXECUTION_TIMEOUT = 300
+
+# Java fast path: uncached sources are compiled in memory by the JVM that
+# runs them, in pooled containers by a JVM started ahead of the run
+JAVA_FAST_PATH_ENABLED = os.getenv("JAVA_FAST_PATH_ENABLED", "true").lower() == "true"
+JAVA_WARM_JVM_ENABLED = os.getenv("JAVA_WARM_JVM_ENABLED", "true").lower() == "true"
+
+# Execution engine admission control
+MAX_CONCURRENT_EXECUTIONS = int(os.getenv("MAX_CONCURRENT_EXECUTIONS", 4))
+MAX_QUEUED_EXECUTIONS = int(os.getenv("MAX_QUEUED_EXECUTIONS", 16))
+# total CPUs and memory (MB) the sandboxes may use, per language see LANG_CONFIG_MAP
+EXECUTION_CPU_BUDGET = float(os.getenv("EXECUTION_CPU_BUDGET", os.cpu_count() or 2))
+EXECUTION_MEMORY_BUDGET = int(os.getenv("EXECUTION_MEMORY_BUDGET_MB", 4096))
+MAX_RUNNING_PER_ROOM = int(os.getenv("MAX_RUNNING_PER_ROOM", 2))
+MAX_QUEUED_PER_ROOM = int(os.getenv("MAX_QUEUED_PER_ROOM", 4))
+EXECUTION_RETRY_AFTER = int(os.getenv("EXECUTION_RETRY_AFTER", 5))
+CONTAINER_NAME_PREFIX = "simcode"
+
+# Warm sandbox container pool
+SANDBOX_DIR = "/sandbox"
+SANDBOX_USER = "65534:65534"
+SANDBOX_PIDS_LIMIT = int(os.getenv("SANDBOX_PIDS_LIMIT", 512))
+CONTAINER_POOL_ENABLED = os.getenv("CONTAINER_POOL_ENABLED", "true").lower() == "true"
+CONTAINER_POOL_MIN_SIZE = int(os.getenv("CONTAINER_POOL_MIN_SIZE", 1))
+CONTAINER_POOL_MAX_SIZE = int(os.getenv("CONTAINER_POOL_MAX_SIZE", 4))
+CONTAINER_POOL_MAX_USES = int(os.getenv("CONTAINER_POOL_MAX_USES", 50))
+CONTAINER_POOL_IDLE_TIMEOUT = int(os.getenv("CONTAINER_POOL_IDLE_TIMEOUT", 300))
+
+# Executor backend per language: "docker" or "process" (isolated local child
+# processes), e.g. EXECUTOR_BACKENDS="python=process,bash=process"
+EXECUTOR_BACKEND_NAMES = ("docker", "process")
+
+
+"""
+Parse the executor backend of every language from DEFAULT_EXECUTOR_BACKEND
+and a comma separated list of `language=backend` entries. Raises ValueError
+naming the offending setting for malformed entries, unknown languages and
+unknown backends.
+"""
+def parse_executor_backends(default: str, entries: str) -> dict[str, str]:
+    default = default.strip()
+    if default not in EXECUTOR_BACKEND_NAMES:
+        raise ValueError(
+            f"DEFAULT_EXECUTOR_BACKEND: unknown backend {default!r}, expected one of {', '.join(EXECUTOR_BACKEND_NAMES)}"
+        )
+
+    backends = {language: default for language in LANG_CONFIG_MAP}
+    for entry in entries.split(","):
+        if not entry.strip():
+            continue
+        language, separator, backend = entry.partition("=")
+        language, backend = language.strip(), backend.strip()
+        if not separator or not language or not backend:
+            raise ValueError(f"EXECUTOR_BACKENDS: expected language=backend, got {entry.strip()!r}")
+        if language not in LANG_CONFIG_MAP:
+            raise ValueError(
+                f"EXECUTOR_BACKENDS: unknown language {language!r}, expected one of {', '.join(LANG_CONFIG_MAP)}"
+            )
+        if backend not in EXECUTOR_BACKEND_NAMES:
+            raise ValueError(
+                f"EXECUTOR_BACKENDS: unknown backend {backend!r} for {language}, "
+                f"expected one of {', '.join(EXECUTOR_BACKEND_NAMES)}"
+            )
+        backends[language] = backend
+    return backends
+
+
+DEFAULT_EXECUTOR_BACKEND = os.getenv("DEFAULT_EXECUTOR_BACKEND", "docker").strip()
+EXECUTOR_BACKENDS = parse_executor_backends(DEFAULT_EXECUTOR_BACKEND, os.getenv("EXECUTOR_BACKENDS", ""))
+
+# Local process sandbox
+LOCAL_SANDBOX_DIR = os.getenv("LOCAL_SANDBOX_DIR", "/tmp/simcode-local")
+# a delegated cgroup v2 directory the server may create child groups in;
+# without one only rlimits apply
+LOCAL_SANDBOX_CGROUP = os.getenv("LOCAL_SANDBOX_CGROUP", "")
+LOCAL_SANDBOX_REQUIRE_NAMESPACES = os.getenv("LOCAL_SANDBOX_REQUIRE_NAMESPACES", "true").lower() == "true"
+LOCAL_SANDBOX_HIDDEN_PATHS = [
+    path for path in os.getenv("LOCAL_SANDBOX_HIDDEN_PATHS", "/home,/root,/tmp,/var/tmp,/run,/srv,/mnt,/media").split(",") if path
+]
+LOCAL_SANDBOX_PATH = os.getenv("LOCAL_SANDBOX_PATH", "/usr/local/bin:/usr/bin:/bin")
+LOCAL_SANDBOX_MAX_PROCESSES = int(os.getenv("LOCAL_SANDBOX_MAX_PROCESSES", 64))
+LOCAL_SANDBOX_MAX_FILE_BYTES = int(os.getenv("LOCAL_SANDBOX_MAX_FILE_BYTES", 64 * 1024 * 1024))
+
+# In-memory sandbox workspaces and clean-up of leftovers
+SANDBOX_TMPFS_SIZE = os.getenv("SANDBOX_TMPFS_SIZE", "64m")
+WORKSPACE_REAP_INTERVAL = int(os.getenv("WORKSPACE_REAP_INTERVAL", 300))
+
+# Bounded capture of sandbox output: the first and last MAX_OUTPUT_BYTES / 2
+# bytes of every stream are kept, the full output is optionally spilled to disk
+MAX_OUTPUT_BYTES = int(os.getenv("MAX_OUTPUT_BYTES", 1024 * 1024))
+OUTPUT_SPILL_ENABLED = os.getenv("OUTPUT_SPILL_ENABLED", "false").lower() == "true"
+OUTPUT_SPILL_DIR = os.getenv("OUTPUT_SPILL_DIR", "/tmp/simcode-output")
+OUTPUT_SPILL_MAX_BYTES = int(os.getenv("OUTPUT_SPILL_MAX_BYTES", 64 * 1024 * 1024))
+OUTPUT_SPILL_TTL = int(os.getenv("OUTPUT_SPILL_TTL", 600))
+
+# Batch test-case runs
+MAX_TEST_CASES = int(os.getenv("MAX_TEST_CASES", 50))
+DEFAULT_TEST_CASE_TIME_LIMIT = float(os.getenv("DEFAULT_TEST_CASE_TIME_LIMIT", 5))
+MAX_TEST_CASE_TIME_LIMIT = float(os.getenv("MAX_TEST_CASE_TIME_LIMIT", 30))
+# per stream and case, all case results of a batch are returned together
+MAX_TEST_CASE_OUTPUT_BYTES = int(os.getenv("MAX_TEST_CASE_OUTPUT_BYTES", 64 * 1024))
+
+# Compiled artifact cache for compiled languages
+COMPILE_CACHE_ENABLED = os.getenv("COMPILE_CACHE_ENABLED", "true").lower() == "true"
+COMPILE_CACHE_DIR = os.getenv("COMPILE_CACHE_DIR", "/tmp/simcode-compile-cache")
+COMPILE_CACHE_MAX_BYTES = int(os.getenv("COMPILE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# Memoized results for identical deterministic submissions
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "false").lower() == "true"
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 256))
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", 60))
+
+# Server-side document sync
+DOCUMENT_HISTORY_SIZE = int(os.getenv("DOCUMENT_HISTORY_SIZE", 500))
+
+# Write-behind persistence of room documents
+ROOM_PERSISTENCE_ENABLED = os.getenv("ROOM_PERSISTENCE_ENABLED", "true").lower() == "true"
+ROOM_FLUSH_INTERVAL = float(os.getenv("ROOM_FLUSH_INTERVAL", 2))
+ROOM_FLUSH_MAX_BYTES = int(os.getenv("ROOM_FLUSH_MAX_BYTES", 16 * 1024))
+ROOM_SNAPSHOT_INTERVAL = float(os.getenv("ROOM_SNAPSHOT_INTERVAL", 60))
+ROOM_SNAPSHOT_MAX_LOG_BYTES = int(os.getenv("ROOM_SNAPSHOT_MAX_LOG_BYTES", 256 * 1024))
+
+# Shared room state for running several workers
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# the members of a worker that stopped refreshing its heartbeat are removed
+STATE_HEARTBEAT_INTERVAL = float(os.getenv("STATE_HEARTBEAT_INTERVAL", 10))
+STATE_HEARTBEAT_TTL = float(os.getenv("STATE_HEARTBEAT_TTL", 30))
+
+# Per-room coalescing of outbound editor events
+BROADCAST_WINDOW = int(os.getenv("BROADCAST_WINDOW_MS", 25)) / 1000
+BROADCAST_MAX_RATE = float(os.getenv("BROADCAST_MAX_RATE", 20))
+
+# Room roles, in increasing order of rights; only editors and hosts may edit
+ROOM_ROLES = ("viewer", "editor", "host")
+EDITING_ROLES = frozenset({"editor", "host"})
+# role of sockets without a token, or whose token carries no role
+DEFAULT_ROOM_ROLE = os.getenv("DEFAULT_ROOM_ROLE", "viewer")
+# viewers get the room's state at most this often instead of every edit
+VIEWER_SNAPSHOT_INTERVAL = int(os.getenv("VIEWER_SNAPSHOT_INTERVAL_MS", 500)) / 1000
+
+# Prepared prerequisite environments (derived sandbox images)
+ENV_IMAGE_CACHE_ENABLED = os.getenv("ENV_IMAGE_CACHE_ENABLED", "true").lower() == "true"
+ENV_IMAGE_REPOSITORY = os.getenv("ENV_IMAGE_REPOSITORY", "simcode-env")
+ENV_IMAGE_CACHE_MAX_IMAGES = int(os.getenv("ENV_IMAGE_CACHE_MAX_IMAGES", 20))
+ENV_IMAGE_CACHE_MAX_BYTES = int(os.getenv("ENV_IMAGE_CACHE_MAX_BYTES", 10 * 1024 * 1024 * 1024))
+ENV_IMAGE_MAX_CONCURRENT_BUILDS = int(os.getenv("ENV_IMAGE_MAX_CONCURRENT_BUILDS", 2))
+ENV_IMAGE_MAX_PENDING_BUILDS = int(os.getenv("ENV_IMAGE_MAX_PENDING_BUILDS", 16))
+ENV_IMAGE_BUILD_TIMEOUT = int(os.getenv("ENV_IMAGE_BUILD_TIMEOUT", 600))
+ENV_IMAGE_BUILD_DELAY = int(os.getenv("ENV_IMAGE_BUILD_DELAY", 5))
+
+# Asynchronous execution jobs
+JOB_QUEUE = os.getenv("JOB_QUEUE", "local")
+# more consumers than execution slots, so that the scheduler can choose
+# fairly between the waiting jobs of different rooms
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", MAX_CONCURRENT_EXECUTIONS + MAX_QUEUED_EXECUTIONS))
+MAX_PENDING_JOBS = int(os.getenv("MAX_PENDING_JOBS", 64))
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", 300))
+JOB_MAX_WAIT = int(os.getenv("JOB_MAX_WAIT", 30))
+# a new run from a room cancels the room's unfinished ones
+EXECUTION_PREEMPTION_ENABLED = os.getenv("EXECUTION_PREEMPTION_ENABLED", "true").lower() == "true"
+
+# Password hashing and token verification
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+MAX_QUEUED_PASSWORD_HASHES = int(os.getenv("MAX_QUEUED_PASSWORD_HASHES", 64))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 1024))
+SOCKET_AUTH_REQUIRED = os.getenv("SOCKET_AUTH_REQUIRED", "false").lower() == "true"
+
+# Logging; per-event socket logs are emitted at DEBUG
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = "%(asctime)s level=%(levelname)s logger=%(name)s %(message)s"
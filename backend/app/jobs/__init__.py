@@ -0,0 +1,29 @@
+from ..constants import EXECUTION_PREEMPTION_ENABLED, JOB_QUEUE, JOB_RESULT_TTL, MAX_PENDING_JOBS, REDIS_URL
+from .base import CANCEL_PREEMPTED, JobQueue
+from .local import LocalJobQueue
+
+"""
+Create the job queue selected by the JOB_QUEUE setting
+"""
+def create_job_queue() -> JobQueue:
+    if JOB_QUEUE == "redis":
+        # imported lazily, redis is only needed when workers run separately
+        from .redis_queue import RedisJobQueue
+
+        return RedisJobQueue.from_url(REDIS_URL, MAX_PENDING_JOBS, JOB_RESULT_TTL)
+    return LocalJobQueue(MAX_PENDING_JOBS, JOB_RESULT_TTL)
+
+
+job_queue = create_job_queue()
+
+
+"""
+Submit an execution job and return its record. A new run from a room
+preempts the runs of the room that have not finished yet.
+Raises ExecutionQueueFull when too many jobs are pending.
+"""
+async def submit_execution(payload: dict) -> dict:
+    job = await job_queue.submit(payload)
+    if payload.get("roomId") and EXECUTION_PREEMPTION_ENABLED:
+        await job_queue.cancel_room(payload["roomId"], CANCEL_PREEMPTED, keep=job["jobId"])
+    return job
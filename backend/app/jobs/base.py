@@ -0,0 +1,139 @@
+import time
+import uuid
+
+from ..metrics import metrics
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED_STATES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+# why a job was cancelled
+CANCEL_REQUESTED = "requested"
+CANCEL_PREEMPTED = "preempted"
+CANCEL_ROOM_EMPTY = "room_empty"
+
+JOBS_CANCELLED = metrics.counter(
+    "simcode_jobs_cancelled_total",
+    "Execution jobs cancelled, by reason and the state they were cancelled in",
+    ("reason", "status"),
+)
+
+
+"""
+Create the record of a newly submitted job
+"""
+def new_job(payload: dict) -> dict:
+    return {
+        "jobId": str(uuid.uuid4()),
+        "status": JOB_QUEUED,
+        "language": payload.get("language"),
+        "roomId": payload.get("roomId"),
+        # the authenticated user who submitted the job
+        "username": payload.get("username"),
+        # identifies the room state a `run` event executes, see room_runs.py
+        "sourceKey": payload.get("sourceKey"),
+        "submitted_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+    }
+
+
+"""
+Outcome of a job that was cancelled for `reason`
+"""
+def cancelled_outcome(reason: str) -> dict:
+    return {"status": JOB_CANCELLED, "error": {"message": "Execution cancelled", "reason": reason}}
+
+
+"""
+Interface of the queue connecting the web processes, which submit execution
+jobs and wait for their results, to the execution workers consuming them.
+A job is a dict with its id, status and timestamps; once it has finished it
+also carries the `result` of the run or the `error` that stopped it.
+"""
+class JobQueue:
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    # Producer side
+
+    """
+    Enqueue a job for `payload` (a dumped Code model) and return its record.
+    Raises ExecutionQueueFull when too many jobs are pending.
+    """
+    async def submit(self, payload: dict) -> dict:
+        raise NotImplementedError
+
+    async def get(self, job_id: str) -> dict | None:
+        raise NotImplementedError
+
+    """
+    Wait up to `timeout` seconds for the job to finish and return its record,
+    or None if there is no such job
+    """
+    async def wait(self, job_id: str, timeout: float) -> dict | None:
+        raise NotImplementedError
+
+    """
+    Cancel an unfinished job. A queued job is finished as cancelled right
+    away; the worker running a job is asked to stop it.
+    Returns the job record as it was before, or None if there is no
+    unfinished job with that id.
+    """
+    async def cancel(self, job_id: str, reason: str = CANCEL_REQUESTED) -> dict | None:
+        job = await self._cancel(job_id, reason)
+        if job is not None:
+            JOBS_CANCELLED.inc(reason=reason, status=job["status"])
+        return job
+
+    async def _cancel(self, job_id: str, reason: str) -> dict | None:
+        raise NotImplementedError
+
+    """
+    Ids of the unfinished jobs submitted for a room
+    """
+    async def room_jobs(self, room: str) -> list[str]:
+        raise NotImplementedError
+
+    """
+    Cancel the unfinished jobs of a room, except `keep`.
+    Returns the ids of the cancelled jobs.
+    """
+    async def cancel_room(self, room: str, reason: str, keep: str | None = None) -> list[str]:
+        cancelled = []
+        for job_id in await self.room_jobs(room):
+            if job_id != keep and await self.cancel(job_id, reason) is not None:
+                cancelled.append(job_id)
+        return cancelled
+
+    # Worker side
+
+    """
+    Take the next job off the queue, waiting for one if there is none.
+    Returns (job id, payload).
+    """
+    async def consume(self) -> tuple[str, dict]:
+        raise NotImplementedError
+
+    """
+    Store the outcome of a job ({"status", "result" or "error"}) and wake up
+    everybody waiting for it
+    """
+    async def complete(self, job_id: str, outcome: dict):
+        raise NotImplementedError
+
+    """
+    Register `callback(job_id, reason)`, called when a job is cancelled, so
+    that the worker running it can stop it
+    """
+    def watch_cancellations(self, callback):
+        raise NotImplementedError
+
+    async def stats(self) -> dict:
+        return {}
@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+from ..service.execution_engine import ExecutionQueueFull
+from .base import FINISHED_STATES, JOB_CANCELLED, JOB_QUEUED, JOB_RUNNING, JobQueue, cancelled_outcome, new_job
+
+
+"""
+In-process job queue, used when the executions run in the web process
+itself (a single server, development and tests). Finished jobs are kept for
+`result_ttl` seconds so that their result can still be fetched.
+"""
+class LocalJobQueue(JobQueue):
+    def __init__(self, max_pending: int, result_ttl: float):
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self._pending: asyncio.Queue[tuple[str, dict]] = asyncio.Queue()
+        # jobs waiting in `_pending` that have not been cancelled
+        self._queued = 0
+        self._jobs: dict[str, dict] = {}
+        self._finished: dict[str, asyncio.Event] = {}
+        self._cancel_callbacks = []
+
+    async def submit(self, payload: dict) -> dict:
+        if self._queued >= self.max_pending:
+            self.rejected += 1
+            raise ExecutionQueueFull()
+
+        job = new_job(payload)
+        self._jobs[job["jobId"]] = job
+        self._finished[job["jobId"]] = asyncio.Event()
+        self._pending.put_nowait((job["jobId"], payload))
+        self._queued += 1
+        self.submitted += 1
+        return dict(job)
+
+    async def get(self, job_id: str) -> dict | None:
+        job = self._jobs.get(job_id)
+        return dict(job) if job else None
+
+    async def wait(self, job_id: str, timeout: float) -> dict | None:
+        finished = self._finished.get(job_id)
+        if finished is not None and timeout > 0:
+            try:
+                await asyncio.wait_for(finished.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return await self.get(job_id)
+
+    async def _cancel(self, job_id: str, reason: str) -> dict | None:
+        job = self._jobs.get(job_id)
+        if job is None or job["status"] in FINISHED_STATES:
+            return None
+
+        previous = dict(job)
+        if job["status"] == JOB_QUEUED:
+            # it stays in the queue, but is skipped when it comes up
+            self._queued -= 1
+            await self.complete(job_id, cancelled_outcome(reason))
+        else:
+            for callback in self._cancel_callbacks:
+                callback(job_id, reason)
+        return previous
+
+    async def room_jobs(self, room: str) -> list[str]:
+        return [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job["roomId"] == room and job["status"] not in FINISHED_STATES
+        ]
+
+    async def consume(self) -> tuple[str, dict]:
+        while True:
+            job_id, payload = await self._pending.get()
+            job = self._jobs.get(job_id)
+            if job is not None and job["status"] in FINISHED_STATES:
+                continue
+            self._queued -= 1
+            if job is not None:
+                job.update(status=JOB_RUNNING, started_at=time.time())
+            return job_id, payload
+
+    async def complete(self, job_id: str, outcome: dict):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+
+        job.update(outcome, finished_at=time.time())
+        self.completed += 1
+        self._finished[job_id].set()
+        asyncio.get_running_loop().call_later(self.result_ttl, self._expire, job_id)
+
+    def watch_cancellations(self, callback):
+        self._cancel_callbacks.append(callback)
+
+    def _expire(self, job_id: str):
+        self._jobs.pop(job_id, None)
+        self._finished.pop(job_id, None)
+
+    async def stats(self) -> dict:
+        running = sum(1 for job in self._jobs.values() if job["status"] == JOB_RUNNING)
+        return {
+            "queue": "local",
+            "pending": self._queued,
+            "running": running,
+            "finished": sum(1 for job in self._jobs.values() if job["status"] in FINISHED_STATES),
+            "cancelled": sum(1 for job in self._jobs.values() if job["status"] == JOB_CANCELLED),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import time
+
+from redis import asyncio as aioredis
+from redis.exceptions import WatchError
+
+from ..backends.redis_backend import KEY_PREFIX
+from ..service.execution_engine import ExecutionQueueFull
+from .base import FINISHED_STATES, JOB_QUEUED, JOB_RUNNING, JobQueue, cancelled_outcome, new_job
+
+PENDING_KEY = f"{KEY_PREFIX}:jobs:pending"
+# number of jobs in the pending list that have not been cancelled
+PENDING_COUNT_KEY = f"{KEY_PREFIX}:jobs:pending_count"
+FINISHED_CHANNEL = f"{KEY_PREFIX}:jobs:finished"
+CANCEL_CHANNEL = f"{KEY_PREFIX}:jobs:cancel"
+CONSUME_POLL_TIMEOUT = 5
+# jobs whose worker died never finish; their records are dropped after a day
+UNFINISHED_JOB_TTL = 24 * 60 * 60
+
+
+"""
+Job queue shared through Redis, so that jobs submitted by any web process
+can be consumed by execution workers in other processes or on other hosts.
+Pending jobs are kept in a list, with a counter of the ones still live
+(cancelled jobs stay in the list until a worker skips them), job records as
+JSON strings that expire `result_ttl` seconds after the job finished, and
+finished job ids are published on a channel to wake up long-polling
+requests. The unfinished jobs of every room are tracked in a set, and
+cancellations are published on another channel to reach the worker running
+the job.
+"""
+class RedisJobQueue(JobQueue):
+    def __init__(self, client, max_pending: int, result_ttl: float):
+        self.redis = client
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.rejected = 0
+        self._pubsub = None
+        self._listener = None
+        self._waiters: dict[str, set[asyncio.Event]] = {}
+        self._cancel_callbacks = []
+
+    @classmethod
+    def from_url(cls, url: str, max_pending: int, result_ttl: float) -> "RedisJobQueue":
+        return cls(aioredis.from_url(url, decode_responses=True), max_pending, result_ttl)
+
+    @staticmethod
+    def _job_key(job_id: str) -> str:
+        return f"{KEY_PREFIX}:job:{job_id}"
+
+    @staticmethod
+    def _room_jobs_key(room: str) -> str:
+        return f"{KEY_PREFIX}:room:{room}:jobs"
+
+    async def start(self):
+        self._pubsub = self.redis.pubsub()
+        await self._pubsub.subscribe(FINISHED_CHANNEL, CANCEL_CHANNEL)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            self._listener = None
+        if self._pubsub:
+            await self._pubsub.aclose()
+        await self.redis.aclose()
+
+    async def _listen(self):
+        async for message in self._pubsub.listen():
+            if message["type"] != "message":
+                continue
+            if message["channel"] == CANCEL_CHANNEL:
+                cancellation = json.loads(message["data"])
+                for callback in self._cancel_callbacks:
+                    callback(cancellation["jobId"], cancellation["reason"])
+            else:
+                for finished in self._waiters.get(message["data"], ()):
+                    finished.set()
+
+    async def submit(self, payload: dict) -> dict:
+        if int(await self.redis.get(PENDING_COUNT_KEY) or 0) >= self.max_pending:
+            self.rejected += 1
+            raise ExecutionQueueFull()
+
+        job = new_job(payload)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(self._job_key(job["jobId"]), json.dumps(job), ex=UNFINISHED_JOB_TTL)
+            pipe.lpush(PENDING_KEY, json.dumps({"jobId": job["jobId"], "payload": payload}))
+            pipe.incr(PENDING_COUNT_KEY)
+            if job["roomId"]:
+                pipe.sadd(self._room_jobs_key(job["roomId"]), job["jobId"])
+                pipe.expire(self._room_jobs_key(job["roomId"]), UNFINISHED_JOB_TTL)
+            await pipe.execute()
+        return job
+
+    async def get(self, job_id: str) -> dict | None:
+        job = await self.redis.get(self._job_key(job_id))
+        return json.loads(job) if job else None
+
+    async def wait(self, job_id: str, timeout: float) -> dict | None:
+        # register before reading the job, so that a completion in between is not missed
+        finished = asyncio.Event()
+        waiters = self._waiters.setdefault(job_id, set())
+        waiters.add(finished)
+        try:
+            job = await self.get(job_id)
+            if job is not None and job["status"] not in FINISHED_STATES and timeout > 0:
+                try:
+                    await asyncio.wait_for(finished.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                job = await self.get(job_id)
+            return job
+        finally:
+            waiters.discard(finished)
+            if not waiters:
+                self._waiters.pop(job_id, None)
+
+    async def _cancel(self, job_id: str, reason: str) -> dict | None:
+        job_key = self._job_key(job_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    # a worker may take the job off the list at the same time
+                    await pipe.watch(job_key)
+                    job = await pipe.get(job_key)
+                    job = json.loads(job) if job else None
+                    if job is None or job["status"] in FINISHED_STATES:
+                        return None
+
+                    if job["status"] == JOB_QUEUED:
+                        # it stays in the pending list, but is skipped when it comes up
+                        pipe.multi()
+                        self._finish(pipe, dict(job), cancelled_outcome(reason))
+                        pipe.decr(PENDING_COUNT_KEY)
+                        await pipe.execute()
+                    break
+                except WatchError:
+                    continue
+
+        # also sent for queued jobs, in case a worker took it off the list meanwhile
+        await self.redis.publish(CANCEL_CHANNEL, json.dumps({"jobId": job_id, "reason": reason}))
+        return job
+
+    async def room_jobs(self, room: str) -> list[str]:
+        return list(await self.redis.smembers(self._room_jobs_key(room)))
+
+    async def consume(self) -> tuple[str, dict]:
+        while True:
+            item = await self.redis.brpop(PENDING_KEY, timeout=CONSUME_POLL_TIMEOUT)
+            if item is None:
+                continue
+
+            entry = json.loads(item[1])
+            if await self._start_job(entry["jobId"]):
+                return entry["jobId"], entry["payload"]
+
+    """
+    Mark a job taken off the pending list as running, unless it was
+    cancelled while it was queued
+    """
+    async def _start_job(self, job_id: str) -> bool:
+        job_key = self._job_key(job_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(job_key)
+                    job = await pipe.get(job_key)
+                    job = json.loads(job) if job else None
+                    if job is not None and job["status"] in FINISHED_STATES:
+                        return False
+
+                    pipe.multi()
+                    if job is not None:
+                        job.update(status=JOB_RUNNING, started_at=time.time())
+                        pipe.set(job_key, json.dumps(job), ex=UNFINISHED_JOB_TTL)
+                    pipe.decr(PENDING_COUNT_KEY)
+                    await pipe.execute()
+                    return True
+                except WatchError:
+                    continue
+
+    async def complete(self, job_id: str, outcome: dict):
+        job = await self.get(job_id)
+        if job is None:
+            return
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            self._finish(pipe, job, outcome)
+            await pipe.execute()
+
+    def _finish(self, pipe, job: dict, outcome: dict):
+        job.update(outcome, finished_at=time.time())
+        pipe.set(self._job_key(job["jobId"]), json.dumps(job), ex=self.result_ttl)
+        if job["roomId"]:
+            pipe.srem(self._room_jobs_key(job["roomId"]), job["jobId"])
+        pipe.publish(FINISHED_CHANNEL, job["jobId"])
+
+    def watch_cancellations(self, callback):
+        self._cancel_callbacks.append(callback)
+
+    async def stats(self) -> dict:
+        return {
+            "queue": "redis",
+            "pending": int(await self.redis.get(PENDING_COUNT_KEY) or 0),
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+
+from ..constants import ACTION_JOB_COMPLETED
+from ..models.code import Code, TestCaseBatch
+from ..service.execution_service import run_job
+from ..service.image_cache import image_cache
+from .base import CANCEL_REQUESTED, JOB_FAILED, JobQueue, cancelled_outcome
+
+logger = logging.getLogger(__name__)
+
+
+"""
+Consumes execution jobs from the queue and runs them, `concurrency` at a
+time. Room events (streamed output and the completion notification) are
+sent through `emit(event, payload, room=...)`, which is the Socket.IO server
+when the worker runs inside the web process and a write-only Redis client
+manager when it runs on its own. Every job runs in its own task, so that a
+cancellation of the job stops the run (which kills its container and frees
+its execution slot) without stopping the consumer.
+"""
+class ExecutionWorker:
+    def __init__(self, queue: JobQueue, emit, concurrency: int):
+        self.queue = queue
+        self.emit = emit
+        self.concurrency = concurrency
+        self._tasks: list[asyncio.Task] = []
+        # job id -> task running it
+        self._running: dict[str, asyncio.Task] = {}
+        self._cancel_reasons: dict[str, str] = {}
+        queue.watch_cancellations(self._cancel)
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._consume()) for _ in range(self.concurrency)]
+
+    def _cancel(self, job_id: str, reason: str):
+        task = self._running.get(job_id)
+        if task is not None and not task.done():
+            self._cancel_reasons[job_id] = reason
+            task.cancel()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    """
+    Run a job: an execution, or the build of a prepared environment submitted
+    by the image cache of a web process
+    """
+    async def _run(self, job_id: str, payload: dict) -> dict:
+        if payload.get("environment"):
+            if not image_cache:
+                raise RuntimeError("Prepared environments are disabled")
+            return await image_cache.build_job(payload["language"], payload["prerequisites"])
+
+        code = TestCaseBatch(**payload) if "testCases" in payload else Code(**payload)
+        return await run_job(job_id, code, lambda event, data: self.emit(event, data, room=code.roomId))
+
+    async def _consume(self):
+        while True:
+            job_id, payload = await self.queue.consume()
+            try:
+                task = asyncio.create_task(self._run(job_id, payload))
+                self._running[job_id] = task
+                try:
+                    await asyncio.wait([task])
+                except asyncio.CancelledError:
+                    task.cancel()
+                    raise
+                finally:
+                    self._running.pop(job_id, None)
+                    reason = self._cancel_reasons.pop(job_id, CANCEL_REQUESTED)
+                outcome = cancelled_outcome(reason) if task.cancelled() else task.result()
+            except Exception as err:
+                logger.warning("Execution job %s failed: %r", job_id, err)
+                outcome = {"status": JOB_FAILED, "error": {"status_code": 500, "message": "Unknown error occurred"}}
+
+            try:
+                await self.queue.complete(job_id, outcome)
+                if payload.get("roomId"):
+                    await self.emit(ACTION_JOB_COMPLETED, {"jobId": job_id, **outcome}, room=payload["roomId"])
+            except Exception as err:
+                logger.warning("Could not report the outcome of execution job %s: %r", job_id, err)
@@ -7,3 +7,22 @@ class Code(BaseModel):
     language: str
     prerequisites: Optional[str] = ""
     code: str
+    # set to False for programs that read the clock, randomness or the network
+    cacheable: Optional[bool] = True
+    # room and user the run is scheduled for; the room is notified when it completes
+    roomId: Optional[str] = None
+    username: Optional[str] = None
+    # stream output to the room over Socket.IO instead of returning it
+    stream: Optional[bool] = False
+
+
+class TestCase(BaseModel):
+    stdin: Optional[str] = ""
+    # compared with the output ignoring trailing whitespace; no verdict without it
+    expectedOutput: Optional[str] = None
+    # wall-clock seconds, capped at MAX_TEST_CASE_TIME_LIMIT
+    timeLimit: Optional[float] = None
+
+
+class TestCaseBatch(Code):
+    testCases: list[TestCase]
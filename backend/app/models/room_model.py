@@ -0,0 +1,23 @@
+from app.models.base import Base
+from sqlalchemy import Column, DateTime, Integer, String, Text, func
+
+
+class RoomSnapshot(Base):
+    __tablename__ = "room_snapshots"
+
+    room_id = Column(String, primary_key=True)
+    code = Column(Text, nullable=False, default="")
+    lang = Column(String, nullable=True)
+    prerequisites = Column(Text, nullable=True)
+    version = Column(Integer, nullable=False, default=0)  # document version the snapshot was taken at
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class RoomEdit(Base):
+    __tablename__ = "room_edits"
+
+    id = Column(Integer, primary_key=True)
+    room_id = Column(String, nullable=False, index=True)
+    first_version = Column(Integer, nullable=False)
+    last_version = Column(Integer, nullable=False)
+    ops = Column(Text, nullable=False)  # JSON list of [version, ops] entries
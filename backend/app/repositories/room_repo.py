@@ -0,0 +1,54 @@
+import json
+from typing import Optional
+
+from app.models.room_model import RoomEdit, RoomSnapshot
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+async def get_snapshot(db: AsyncSession, room_id: str) -> Optional[RoomSnapshot]:
+    return await db.get(RoomSnapshot, room_id)
+
+"""
+Edit log entries (version, ops) of a room that are newer than `after_version`,
+in version order
+"""
+async def get_edits(db: AsyncSession, room_id: str, after_version: int) -> list[tuple[int, list]]:
+    result = await db.execute(
+        select(RoomEdit.ops)
+        .where(RoomEdit.room_id == room_id, RoomEdit.last_version > after_version)
+        .order_by(RoomEdit.first_version)
+    )
+    entries = [tuple(entry) for ops in result.scalars() for entry in json.loads(ops)]
+    return sorted((entry for entry in entries if entry[0] > after_version), key=lambda entry: entry[0])
+
+async def append_edits(db: AsyncSession, room_id: str, entries: list[tuple[int, list]]):
+    db.add(
+        RoomEdit(
+            room_id=room_id,
+            first_version=entries[0][0],
+            last_version=entries[-1][0],
+            ops=json.dumps(entries, separators=(",", ":")),
+        )
+    )
+    await db.commit()
+
+"""
+Store the room's state as of `version` and drop the edit log it covers.
+A snapshot already taken at a later version (by another worker) is kept.
+"""
+async def save_snapshot(db: AsyncSession, room_id: str, code: str, lang: Optional[str], prerequisites: Optional[str], version: int) -> bool:
+    snapshot = await db.get(RoomSnapshot, room_id, with_for_update=True)
+    if snapshot is None:
+        db.add(RoomSnapshot(room_id=room_id, code=code, lang=lang, prerequisites=prerequisites, version=version))
+    elif snapshot.version > version:
+        await db.rollback()
+        return False
+    else:
+        snapshot.code = code
+        snapshot.lang = lang
+        snapshot.prerequisites = prerequisites
+        snapshot.version = version
+    await db.execute(delete(RoomEdit).where(RoomEdit.room_id == room_id, RoomEdit.last_version <= version))
+    await db.commit()
+    return True
@@ -1,17 +1,43 @@
+import logging
 from typing import Optional
 
 from app.models.role_model import Role
 from app.models.user_model import User
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
+logger = logging.getLogger(__name__)
 
-def get_user_by_username(db: Session, username: str) -> Optional[User]:
-    return db.query(User).filter(User.username == username).first()
 
-def is_valid_role(db: Session, role_name: str) -> bool:
-    return db.query(Role).filter(Role.role_type == role_name).first() is not None
+async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
+    result = await db.execute(select(User).where(User.username == username))
+    return result.scalars().first()
 
-def create_user(db: Session, username: str, email: str, hashed_password: str, role: str) -> User:
+"""
+In-process cache of the valid role names. Roles only change when they are
+seeded, so they are loaded from the database once and kept until
+`invalidate` is called.
+"""
+class RoleCache:
+    def __init__(self):
+        self._roles: frozenset[str] | None = None
+
+    async def get(self, db: AsyncSession) -> frozenset[str]:
+        if self._roles is None:
+            result = await db.execute(select(Role.role_type))
+            self._roles = frozenset(result.scalars())
+        return self._roles
+
+    def invalidate(self):
+        self._roles = None
+
+
+role_cache = RoleCache()
+
+async def is_valid_role(db: AsyncSession, role_name: str) -> bool:
+    return role_name in await role_cache.get(db)
+
+async def create_user(db: AsyncSession, username: str, email: str, hashed_password: str, role: str) -> User:
     db_user = User(
         username=username,
         email=email,
@@ -19,18 +45,24 @@ def create_user(db: Session, username: str, email: str, hashed_password: str, ro
         role_of_user=role
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
-def create_default_roles(db: Session):
+async def update_password_hash(db: AsyncSession, user: User, hashed_password: str) -> User:
+    user.hashed_password = hashed_password
+    await db.commit()
+    return user
+
+async def create_default_roles(db: AsyncSession):
     roles = ["viewer", "editor", "host"]
-    for role_name in roles:
-        if not db.query(Role).filter(Role.role_type == role_name).first():
-            role = Role(role_type=role_name)
-            db.add(role)
-            print(f"{role} added")
-        else:
-            print(f"{role_name} role already present in db")
-            
-    db.commit()
+    result = await db.execute(select(Role.role_type))
+    existing = set(result.scalars())
+    missing = [role_name for role_name in roles if role_name not in existing]
+    for role_name in missing:
+        db.add(Role(role_type=role_name))
+        logger.info("%s role added", role_name)
+
+    if missing:
+        await db.commit()
+    role_cache.invalidate()
@@ -0,0 +1,182 @@
+import fnmatch
+import hashlib
+import io
+import os
+import shutil
+import tarfile
+import threading
+import uuid
+from collections import OrderedDict
+
+from ..constants import COMPILE_CACHE_DIR, COMPILE_CACHE_ENABLED, COMPILE_CACHE_MAX_BYTES
+
+
+"""
+Content-addressed cache of compiled artifacts (binaries, class files).
+Every entry is a directory named after the hash of the inputs that produced
+it and the total size of all entries is kept under `max_bytes` by evicting
+the least recently used ones. Entries found on disk at start-up are adopted
+in modification-time order, so the cache survives server restarts.
+"""
+class CompileCache:
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_bytes = 0
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def make_key(image: str, compile_command: str, source: str, prerequisites: str) -> str:
+        digest = hashlib.sha256()
+        for part in (image, compile_command, source, prerequisites or ""):
+            encoded = part.encode()
+            digest.update(len(encoded).to_bytes(8, "big"))
+            digest.update(encoded)
+        return digest.hexdigest()
+
+    def _load(self):
+        os.makedirs(self.root, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith(".") or not os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+            entries.append((os.path.getmtime(path), name, _dir_size(path)))
+
+        for _, name, size in sorted(entries):
+            self._entries[name] = size
+            self.total_bytes += size
+        self._evict()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+
+    """
+    Read the cached artifacts for `key` as {file name: (content, mode)}.
+    Returns None (and counts a miss) if there is no such entry.
+    """
+    def restore(self, key: str) -> dict[str, tuple[bytes, int]] | None:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        entry_dir = os.path.join(self.root, key)
+        try:
+            os.utime(entry_dir)
+            files = {}
+            for name in os.listdir(entry_dir):
+                path = os.path.join(entry_dir, name)
+                with open(path, "rb") as f:
+                    files[name] = (f.read(), os.stat(path).st_mode & 0o777)
+        except OSError:
+            self._drop(key)
+            return None
+        return files
+
+    """
+    Store artifacts matching `patterns` from a tar archive of the sandbox
+    workspace directory
+    """
+    def store_from_tar(self, key: str, archive: bytes, patterns: list[str]):
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            # archive entries are "<workdir>/<file>"; only top-level files are artifacts
+            members = [
+                member
+                for member in tar.getmembers()
+                if member.isfile()
+                and member.name.count("/") == 1
+                and any(fnmatch.fnmatch(member.name.split("/")[1], pattern) for pattern in patterns)
+            ]
+            if not members:
+                return
+
+            def extract(tmp_dir: str):
+                for member in members:
+                    member.name = os.path.basename(member.name)
+                    tar.extract(member, tmp_dir, filter="data")
+
+            self._store(key, extract)
+
+    """
+    Store artifacts matching `patterns` from a workspace directory on the host
+    """
+    def store_from_dir(self, key: str, directory: str, patterns: list[str]):
+        with os.scandir(directory) as entries:
+            # the sandbox may have left symlinks to files outside the workspace
+            files = [
+                entry.path
+                for entry in entries
+                if entry.is_file(follow_symlinks=False)
+                and any(fnmatch.fnmatch(entry.name, pattern) for pattern in patterns)
+            ]
+        if not files:
+            return
+
+        def copy(tmp_dir: str):
+            for path in files:
+                shutil.copy(path, tmp_dir, follow_symlinks=False)
+
+        self._store(key, copy)
+
+    def _store(self, key: str, populate):
+        if key in self._entries:
+            return
+
+        tmp_dir = os.path.join(self.root, f".{uuid.uuid4().hex}")
+        os.makedirs(tmp_dir)
+        try:
+            populate(tmp_dir)
+            size = _dir_size(tmp_dir)
+            if size > self.max_bytes:
+                return
+            os.rename(tmp_dir, os.path.join(self.root, key))
+        except OSError:
+            return
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        with self._lock:
+            self._entries[key] = size
+            self.total_bytes += size
+            self._evict()
+
+    def _drop(self, key: str):
+        with self._lock:
+            size = self._entries.pop(key, None)
+            if size is not None:
+                self.total_bytes -= size
+        shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+def _dir_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+compile_cache = CompileCache(COMPILE_CACHE_DIR, COMPILE_CACHE_MAX_BYTES) if COMPILE_CACHE_ENABLED else None
@@ -0,0 +1,276 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+
+from ..constants import (
+    CONTAINER_NAME_PREFIX,
+    CONTAINER_POOL_ENABLED,
+    CONTAINER_POOL_IDLE_TIMEOUT,
+    CONTAINER_POOL_MAX_SIZE,
+    CONTAINER_POOL_MAX_USES,
+    CONTAINER_POOL_MIN_SIZE,
+    EXECUTOR_BACKENDS,
+    LANG_CONFIG_MAP,
+    SANDBOX_DIR,
+    SANDBOX_TMPFS_SIZE,
+)
+from .execution_engine import OWNER_LABEL_ARGS, get_resource_args, kill_container, run_process
+from .java_runner import java_runner
+
+logger = logging.getLogger(__name__)
+
+DOCKER_COMMAND_TIMEOUT = 30
+POOL_MAINTENANCE_INTERVAL = 30
+
+
+class PooledContainer:
+    __slots__ = ("name", "image", "uses", "last_used")
+
+    def __init__(self, name: str, image: str):
+        self.name = name
+        self.image = image
+        self.uses = 0
+        self.last_used = time.monotonic()
+
+
+"""
+A pool of pre-started, idle sandbox containers for a single image.
+Containers are started detached with a long-running `sleep` so that user
+code can be run inside them with `docker exec`, and get an in-memory tmpfs
+as sandbox directory. Java containers also get a warm runner JVM whenever
+they are started or reset (see JavaRunner). After a run, a container is
+either reset and put back on the idle list or recycled (removed) when it has
+been used `max_uses` times, has been idle for longer than `idle_timeout`, or
+was left in an unknown state by the run.
+"""
+class ContainerPool:
+    def __init__(self, image: str, language: str, min_size: int, max_size: int, max_uses: int, idle_timeout: float):
+        self.image = image
+        self.language = language
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.max_uses = max_uses
+        self.idle_timeout = idle_timeout
+        self.size = 0
+        self.idle: deque[PooledContainer] = deque()
+        self._available = asyncio.Condition()
+
+    async def _start_container(self) -> PooledContainer:
+        name = f"{CONTAINER_NAME_PREFIX}-pool-{uuid.uuid4().hex[:12]}"
+        returncode, _, stderr = await run_process(
+            [
+                "docker",
+                "run",
+                "-d",
+                "--name",
+                name,
+                "--label",
+                f"{CONTAINER_NAME_PREFIX}.pool={self.image}",
+                *OWNER_LABEL_ARGS,
+                *get_resource_args(self.language),
+                "--tmpfs",
+                f"{SANDBOX_DIR}:rw,exec,mode=1777,size={SANDBOX_TMPFS_SIZE}",
+                "-w",
+                SANDBOX_DIR,
+                self.image,
+                "sleep",
+                "infinity",
+            ],
+            timeout=DOCKER_COMMAND_TIMEOUT,
+            on_timeout=lambda: kill_container(name),
+        )
+        if returncode:
+            raise RuntimeError(f"Could not start pooled container for {self.image}: {stderr.strip()}")
+        container = PooledContainer(name, self.image)
+        await self._prepare(container)
+        return container
+
+    async def _prepare(self, container: PooledContainer):
+        if java_runner and self.language == "java":
+            await java_runner.start(container.name)
+
+    async def _reset_container(self, container: PooledContainer) -> bool:
+        # kill -9 -1 terminates every process except the keep-alive sleep (pid 1)
+        try:
+            returncode, _, _ = await run_process(
+                [
+                    "docker",
+                    "exec",
+                    container.name,
+                    "sh",
+                    "-c",
+                    f"kill -9 -1 2>/dev/null; rm -rf {SANDBOX_DIR}/* {SANDBOX_DIR}/.[!.]* /tmp/* /tmp/.[!.]*; true",
+                ],
+                timeout=DOCKER_COMMAND_TIMEOUT,
+            )
+        except Exception:
+            return False
+        return returncode == 0
+
+    async def _grow(self) -> PooledContainer:
+        self.size += 1
+        try:
+            return await self._start_container()
+        except BaseException:
+            self.size -= 1
+            raise
+
+    async def _destroy(self, container: PooledContainer):
+        self.size -= 1
+        await kill_container(container.name)
+        async with self._available:
+            self._available.notify()
+
+    async def checkout(self) -> PooledContainer:
+        async with self._available:
+            while not self.idle and self.size >= self.max_size:
+                await self._available.wait()
+
+            if self.idle:
+                return self.idle.pop()
+            self.size += 1
+
+        try:
+            return await self._start_container()
+        except BaseException:
+            self.size -= 1
+            async with self._available:
+                self._available.notify()
+            raise
+
+    async def checkin(self, container: PooledContainer, recycle: bool = False):
+        container.uses += 1
+        container.last_used = time.monotonic()
+
+        if recycle or container.uses >= self.max_uses or not await self._reset_container(container):
+            await self._destroy(container)
+            return
+        # the reset also stopped the container's runner JVM
+        await self._prepare(container)
+
+        async with self._available:
+            self.idle.append(container)
+            self._available.notify()
+
+    async def fill(self):
+        while self.size < self.min_size:
+            container = await self._grow()
+            async with self._available:
+                self.idle.append(container)
+                self._available.notify()
+
+    async def evict_idle(self):
+        now = time.monotonic()
+        expired = []
+        async with self._available:
+            # idle containers are appended on checkin, so the oldest are on the left
+            while self.idle and self.size - len(expired) > self.min_size:
+                if now - self.idle[0].last_used < self.idle_timeout:
+                    break
+                expired.append(self.idle.popleft())
+
+        for container in expired:
+            await self._destroy(container)
+
+    async def drain(self):
+        async with self._available:
+            containers = list(self.idle)
+            self.idle.clear()
+
+        for container in containers:
+            await self._destroy(container)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "idle": len(self.idle),
+            "in_use": self.size - len(self.idle),
+        }
+
+
+"""
+Owns one ContainerPool per image and the background task that keeps the
+pools topped up and evicts containers that have been idle for too long.
+Pools for the images of the languages that run in Docker (see
+EXECUTOR_BACKENDS) are warmed at start-up; pools for other
+images (such as prepared prerequisite environments) are created on first
+use without a minimum size and removed once they are empty. Containers are
+limited to the CPU and memory budget of the language they run.
+"""
+class ContainerPoolManager:
+    def __init__(self):
+        languages = {
+            language: config for language, config in LANG_CONFIG_MAP.items() if EXECUTOR_BACKENDS[language] == "docker"
+        }
+        self.base_images = {config["image"] for config in languages.values()}
+        self.pools: dict[str, ContainerPool] = {
+            config["image"]: self._create_pool(config["image"], language, CONTAINER_POOL_MIN_SIZE)
+            for language, config in languages.items()
+        }
+        self._maintenance_task = None
+
+    @staticmethod
+    def _create_pool(image: str, language: str, min_size: int) -> ContainerPool:
+        return ContainerPool(
+            image,
+            language,
+            min_size,
+            CONTAINER_POOL_MAX_SIZE,
+            CONTAINER_POOL_MAX_USES,
+            CONTAINER_POOL_IDLE_TIMEOUT,
+        )
+
+    async def start(self):
+        await self._maintain()
+        self._maintenance_task = asyncio.create_task(self._maintenance_loop())
+
+    async def stop(self):
+        if self._maintenance_task:
+            self._maintenance_task.cancel()
+            self._maintenance_task = None
+        await asyncio.gather(*(pool.drain() for pool in self.pools.values()))
+
+    async def _maintain(self):
+        for image, pool in list(self.pools.items()):
+            try:
+                await pool.evict_idle()
+                await pool.fill()
+            except Exception as err:
+                logger.warning("Container pool maintenance failed for %s: %r", image, err)
+
+            if image not in self.base_images and not pool.size:
+                self.pools.pop(image, None)
+
+    async def _maintenance_loop(self):
+        while True:
+            await asyncio.sleep(POOL_MAINTENANCE_INTERVAL)
+            await self._maintain()
+
+    async def checkout(self, image: str, language: str) -> PooledContainer:
+        pool = self.pools.get(image)
+        if pool is None:
+            pool = self.pools[image] = self._create_pool(image, language, 0)
+        return await pool.checkout()
+
+    async def checkin(self, container: PooledContainer, recycle: bool = False):
+        pool = self.pools.get(container.image)
+        if pool is None:
+            await kill_container(container.name)
+            return
+        await pool.checkin(container, recycle=recycle)
+
+    """
+    Remove the pool of an image that is about to be deleted
+    """
+    async def discard(self, image: str):
+        pool = self.pools.pop(image, None)
+        if pool is not None:
+            await pool.drain()
+
+    def stats(self) -> dict:
+        return {image: pool.stats() for image, pool in self.pools.items()}
+
+
+container_pool = ContainerPoolManager() if CONTAINER_POOL_ENABLED else None
@@ -0,0 +1,160 @@
+from collections import deque
+
+from ..constants import DOCUMENT_HISTORY_SIZE
+
+INSERT = "insert"
+DELETE = "delete"
+
+
+class StaleVersionError(Exception):
+    pass
+
+
+"""
+Validate and convert client ops ({"pos", "insert"} / {"pos", "delete"})
+into the internal (kind, pos, value) tuples
+"""
+def parse_ops(raw_ops: list) -> list[tuple]:
+    if not isinstance(raw_ops, list):
+        raise ValueError("ops must be a list")
+
+    ops = []
+    for raw in raw_ops:
+        pos = raw.get("pos") if isinstance(raw, dict) else None
+        if not isinstance(pos, int) or pos < 0:
+            raise ValueError(f"Invalid op: {raw!r}")
+
+        if isinstance(raw.get(INSERT), str) and raw[INSERT]:
+            ops.append((INSERT, pos, raw[INSERT]))
+        elif isinstance(raw.get(DELETE), int) and raw[DELETE] > 0:
+            ops.append((DELETE, pos, raw[DELETE]))
+        else:
+            raise ValueError(f"Invalid op: {raw!r}")
+    return ops
+
+
+"""
+Convert internal ops back into the wire format
+"""
+def serialize_ops(ops: list[tuple]) -> list[dict]:
+    return [{"pos": pos, kind: value} for kind, pos, value in ops]
+
+
+"""
+Transform `op` so that it applies after `against` has been applied.
+When both insert at the same position, the op that `wins` is placed first.
+Returns a list, since a delete can be split in two or vanish entirely.
+"""
+def transform(op: tuple, against: tuple, wins: bool) -> list[tuple]:
+    kind, pos, value = op
+    other_kind, other_pos, other_value = against
+
+    if other_kind == INSERT:
+        length = len(other_value)
+        if kind == INSERT:
+            if other_pos < pos or (other_pos == pos and not wins):
+                return [(kind, pos + length, value)]
+            return [op]
+
+        # delete against insert: an insert inside the deleted range survives
+        if other_pos <= pos:
+            return [(kind, pos + length, value)]
+        if other_pos >= pos + value:
+            return [op]
+        before = other_pos - pos
+        return [(DELETE, pos, before), (DELETE, pos + length, value - before)]
+
+    other_end = other_pos + other_value
+    if kind == INSERT:
+        if pos <= other_pos:
+            return [op]
+        if pos >= other_end:
+            return [(kind, pos - other_value, value)]
+        return [(kind, other_pos, value)]
+
+    # delete against delete: drop the part that is already gone
+    end = pos + value
+    if end <= other_pos:
+        return [op]
+    if pos >= other_end:
+        return [(kind, pos - other_value, value)]
+    overlap = min(end, other_end) - max(pos, other_pos)
+    remaining = value - overlap
+    return [(kind, min(pos, other_pos), remaining)] if remaining else []
+
+
+"""
+Transform two concurrent op sequences against each other.
+Returns (ops', against') where ops' applies after `against` and against'
+applies after `ops`; `against` wins ties.
+"""
+def transform_sequences(ops: list[tuple], against: list[tuple]) -> tuple[list[tuple], list[tuple]]:
+    if not ops or not against:
+        return ops, against
+
+    if len(ops) > 1:
+        head, against = transform_sequences(ops[:1], against)
+        tail, against = transform_sequences(ops[1:], against)
+        return head + tail, against
+
+    if len(against) > 1:
+        ops, head = transform_sequences(ops, against[:1])
+        ops, tail = transform_sequences(ops, against[1:])
+        return ops, head + tail
+
+    return transform(ops[0], against[0], False), transform(against[0], ops[0], True)
+
+
+"""
+Apply a sequence of ops to a text
+"""
+def apply_ops(text: str, ops: list[tuple]) -> str:
+    for kind, pos, value in ops:
+        if pos > len(text) or (kind == DELETE and pos + value > len(text)):
+            raise ValueError("Op out of range")
+        text = text[:pos] + value + text[pos:] if kind == INSERT else text[:pos] + text[pos + value:]
+    return text
+
+
+"""
+Server-authoritative, versioned buffer of a room's code.
+Every accepted change increments the version and is kept in a bounded
+history, so that ops a client based on an older version can be transformed
+over everything that was applied since.
+"""
+class RoomDocument:
+    __slots__ = ("text", "version", "history")
+
+    def __init__(self, text: str = "", version: int = 0):
+        self.text = text
+        self.version = version
+        self.history: deque[list[tuple]] = deque(maxlen=DOCUMENT_HISTORY_SIZE)
+
+    """
+    Apply ops that the client based on `base_version`.
+    Returns the transformed ops as they were applied to the canonical text.
+    """
+    def apply(self, base_version: int, ops: list[tuple]) -> list[tuple]:
+        missed = self.version - base_version
+        if missed < 0 or missed > len(self.history):
+            raise StaleVersionError()
+
+        for applied in list(self.history)[len(self.history) - missed:]:
+            ops, _ = transform_sequences(ops, applied)
+
+        self.text = apply_ops(self.text, ops)
+        self.version += 1
+        self.history.append(ops)
+        return ops
+
+    """
+    Replace the whole text, as sent by full-state `code_change` events.
+    The replacement is recorded as ops so that in-flight deltas still transform.
+    """
+    def replace(self, text: str) -> list[tuple]:
+        ops = []
+        if self.text:
+            ops.append((DELETE, 0, len(self.text)))
+        if text:
+            ops.append((INSERT, 0, text))
+        return self.apply(self.version, ops)
@@ -0,0 +1,387 @@
+import asyncio
+import codecs
+import itertools
+import os
+import signal
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from ..constants import (
+    CONTAINER_NAME_PREFIX,
+    DEFAULT_EXECUTION_TIMEOUT,
+    EXECUTION_CPU_BUDGET,
+    EXECUTION_MEMORY_BUDGET,
+    JAVA_EXECUTION_TIMEOUT,
+    LANG_CONFIG_MAP,
+    MAX_CONCURRENT_EXECUTIONS,
+    MAX_QUEUED_EXECUTIONS,
+    MAX_QUEUED_PER_ROOM,
+    MAX_RUNNING_PER_ROOM,
+    SANDBOX_PIDS_LIMIT,
+)
+
+STREAM_CHUNK_SIZE = 4096
+
+# every container is labelled with the pid of the server that created it,
+# so that the reaper can tell leftovers of a crashed server from live ones
+OWNER_LABEL = f"{CONTAINER_NAME_PREFIX}.owner"
+OWNER_LABEL_ARGS = ["--label", f"{OWNER_LABEL}={os.getpid()}"]
+
+
+class ExecutionQueueFull(Exception):
+    pass
+
+
+class ExecutionTimeout(Exception):
+    pass
+
+
+"""
+Docker CLI arguments limiting a container to the CPU and memory budget of
+the language and to SANDBOX_PIDS_LIMIT processes
+"""
+def get_resource_args(language: str) -> list[str]:
+    config = LANG_CONFIG_MAP[language]
+    memory = f"{config['memory']}m"
+    return [
+        "--cpus", str(config["cpus"]),
+        "--memory", memory,
+        "--memory-swap", memory,
+        "--pids-limit", str(SANDBOX_PIDS_LIMIT),
+    ]
+
+
+"""
+Seconds a sandbox run of the language may take
+"""
+def get_execution_timeout(language: str) -> int:
+    return JAVA_EXECUTION_TIMEOUT if language == "java" else DEFAULT_EXECUTION_TIMEOUT
+
+
+class _Waiter:
+    __slots__ = ("language", "room", "user", "enqueued_at", "granted")
+
+    def __init__(self, language: str, room: str | None, user: str | None):
+        self.language = language
+        self.room = room
+        self.user = user
+        self.enqueued_at = time.monotonic()
+        self.granted = asyncio.get_running_loop().create_future()
+
+
+class _LanguageStats:
+    __slots__ = ("running", "waiting", "admitted", "rejected", "total_wait", "max_wait")
+
+    def __init__(self):
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+"""
+Admission control for sandbox executions.
+A run is admitted when a slot of its language is free (`max_concurrent` in
+LANG_CONFIG_MAP), its CPU and memory budget fits into what is left of the
+host budget, and at most `max_concurrent` runs are in progress overall.
+Waiting runs are queued per room and, within a room, per user. Of the runs
+that fit, the one of the room (and then the user) that was served longest
+ago is admitted first, so that a burst from one room cannot starve others.
+A room has at most `max_running_per_room` runs in progress and
+`max_queued_per_room` waiting; beyond that, or beyond `max_queued` waiting
+runs in total, new runs are rejected immediately so that the caller can
+apply backpressure.
+"""
+class ExecutionScheduler:
+    def __init__(
+        self,
+        languages: dict,
+        max_concurrent: int,
+        max_queued: int,
+        cpu_budget: float,
+        memory_budget: int,
+        max_running_per_room: int,
+        max_queued_per_room: int,
+    ):
+        self.languages = languages
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.cpu_budget = cpu_budget
+        self.memory_budget = memory_budget
+        self.max_running_per_room = max_running_per_room
+        self.max_queued_per_room = max_queued_per_room
+        self.running = 0
+        self.waiting = 0
+        self.cpus_in_use = 0.0
+        self.memory_in_use = 0
+        self._running_per_room: dict[str | None, int] = {}
+        # room -> user -> waiters
+        self._queues: dict[str | None, dict[str | None, deque[_Waiter]]] = {}
+        # room -> [turn the room was last served, {user: turn the user was last served}],
+        # kept while the room has runs waiting or in progress
+        self._turns: dict[str | None, list] = {}
+        self._turn_counter = itertools.count()
+        self._stats = {language: _LanguageStats() for language in languages}
+
+    @asynccontextmanager
+    async def slot(self, language: str, room: str | None = None, user: str | None = None):
+        stats = self._stats[language]
+        room_queue = self._queues.get(room)
+        queued_in_room = sum(len(waiters) for waiters in room_queue.values()) if room_queue else 0
+        if self.waiting >= self.max_queued or (room is not None and queued_in_room >= self.max_queued_per_room):
+            stats.rejected += 1
+            raise ExecutionQueueFull()
+
+        waiter = _Waiter(language, room, user)
+        self._queues.setdefault(room, {}).setdefault(user, deque()).append(waiter)
+        self.waiting += 1
+        stats.waiting += 1
+        self._dispatch()
+
+        try:
+            await waiter.granted
+        except asyncio.CancelledError:
+            if not waiter.granted.cancelled():
+                # granted just before the cancellation arrived
+                self._release(waiter)
+            else:
+                self._dequeue(waiter)
+            raise
+
+        try:
+            yield
+        finally:
+            self._release(waiter)
+
+    def _fits(self, waiter: _Waiter) -> bool:
+        config = self.languages[waiter.language]
+        if self.running >= self.max_concurrent:
+            return False
+        if self._stats[waiter.language].running >= config["max_concurrent"]:
+            return False
+        if waiter.room is not None and self._running_per_room.get(waiter.room, 0) >= self.max_running_per_room:
+            return False
+        # a run larger than the whole budget is still admitted on an idle host
+        return not self.running or (
+            self.cpus_in_use + config["cpus"] <= self.cpu_budget
+            and self.memory_in_use + config["memory"] <= self.memory_budget
+        )
+
+    def _next_waiter(self) -> _Waiter | None:
+        best_turn, best = None, None
+        for room, users in self._queues.items():
+            room_turn, user_turns = self._turns.get(room, (-1, {}))
+            for user, waiters in users.items():
+                turn = (room_turn, user_turns.get(user, -1))
+                if (best_turn is None or turn < best_turn) and self._fits(waiters[0]):
+                    best_turn, best = turn, waiters[0]
+        return best
+
+    def _dispatch(self):
+        while (waiter := self._next_waiter()) is not None:
+            self._dequeue(waiter)
+            self._grant(waiter)
+
+    def _forget(self, room: str | None):
+        if room not in self._queues and room not in self._running_per_room:
+            self._turns.pop(room, None)
+
+    def _dequeue(self, waiter: _Waiter):
+        users = self._queues[waiter.room]
+        users[waiter.user].remove(waiter)
+        if not users[waiter.user]:
+            del users[waiter.user]
+        if not users:
+            del self._queues[waiter.room]
+        self.waiting -= 1
+        self._stats[waiter.language].waiting -= 1
+        self._forget(waiter.room)
+
+    def _grant(self, waiter: _Waiter):
+        config = self.languages[waiter.language]
+        stats = self._stats[waiter.language]
+        wait = time.monotonic() - waiter.enqueued_at
+        stats.admitted += 1
+        stats.total_wait += wait
+        stats.max_wait = max(stats.max_wait, wait)
+        stats.running += 1
+        self.running += 1
+        self.cpus_in_use += config["cpus"]
+        self.memory_in_use += config["memory"]
+        self._running_per_room[waiter.room] = self._running_per_room.get(waiter.room, 0) + 1
+        turn = next(self._turn_counter)
+        turns = self._turns.setdefault(waiter.room, [turn, {}])
+        turns[0] = turns[1][waiter.user] = turn
+        waiter.granted.set_result(None)
+
+    def _release(self, waiter: _Waiter):
+        config = self.languages[waiter.language]
+        self._stats[waiter.language].running -= 1
+        self.running -= 1
+        self.cpus_in_use -= config["cpus"]
+        self.memory_in_use -= config["memory"]
+        self._running_per_room[waiter.room] -= 1
+        if not self._running_per_room[waiter.room]:
+            del self._running_per_room[waiter.room]
+            self._forget(waiter.room)
+        self._dispatch()
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "waiting": self.waiting,
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+            "cpus_in_use": round(self.cpus_in_use, 2),
+            "cpu_budget": self.cpu_budget,
+            "memory_in_use": self.memory_in_use,
+            "memory_budget": self.memory_budget,
+            "rooms_waiting": len(self._queues),
+            "languages": {
+                language: {
+                    "running": stats.running,
+                    "waiting": stats.waiting,
+                    "max_concurrent": self.languages[language]["max_concurrent"],
+                    "admitted": stats.admitted,
+                    "rejected": stats.rejected,
+                    "avg_wait": round(stats.total_wait / stats.admitted, 3) if stats.admitted else 0,
+                    "max_wait": round(stats.max_wait, 3),
+                }
+                for language, stats in self._stats.items()
+            },
+        }
+
+
+execution_scheduler = ExecutionScheduler(
+    LANG_CONFIG_MAP,
+    MAX_CONCURRENT_EXECUTIONS,
+    MAX_QUEUED_EXECUTIONS,
+    EXECUTION_CPU_BUDGET,
+    EXECUTION_MEMORY_BUDGET,
+    MAX_RUNNING_PER_ROOM,
+    MAX_QUEUED_PER_ROOM,
+)
+
+
+"""
+Run a command as an asyncio subprocess and collect its output.
+On timeout the optional `on_timeout` coroutine is awaited first (used to kill
+the container, since killing the docker CLI alone leaves it running), then
+the process itself is killed and ExecutionTimeout is raised. The process is
+killed as well when the caller is cancelled.
+Output is decoded as text unless `binary` is set. If `on_stdout`/`on_stderr`
+callbacks are given, that stream is passed to the callback chunk by chunk as
+it is produced instead of being collected, and "" is returned in its place.
+`input` is written to the process's stdin, which is closed afterwards.
+The process runs in `cwd` with the environment `env` when given. With
+`new_session` it leads a process group of its own, and the whole group is
+killed instead of just the process.
+"""
+async def run_process(args: list[str], timeout: float, on_timeout=None, binary: bool = False, on_stdout=None, on_stderr=None, input: bytes | None = None, cwd: str | None = None, env: dict | None = None, new_session: bool = False) -> tuple:
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=asyncio.subprocess.DEVNULL if input is None else asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=cwd,
+        env=env,
+        start_new_session=new_session,
+    )
+
+    try:
+        if on_stdout is None and on_stderr is None:
+            stdout, stderr = await asyncio.wait_for(process.communicate(input), timeout=timeout)
+        else:
+            stdout, stderr = await asyncio.wait_for(
+                _communicate_streaming(process, on_stdout, on_stderr, binary, input), timeout=timeout
+            )
+    except asyncio.TimeoutError:
+        if on_timeout is not None:
+            await on_timeout()
+        _kill(process, new_session)
+        await process.wait()
+        raise ExecutionTimeout()
+    except asyncio.CancelledError:
+        # the caller removes the container, the CLI must not outlive it either
+        _kill(process, new_session)
+        raise
+
+    if binary:
+        return process.returncode, stdout, stderr
+    return (
+        process.returncode,
+        stdout.decode(errors="replace"),
+        stderr.decode(errors="replace"),
+    )
+
+
+def _kill(process, group: bool):
+    if group:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    elif process.returncode is None:
+        process.kill()
+
+
+"""
+Drain both output pipes of a process while writing its stdin, until it exits.
+Wrapped in a coroutine so that a cancelled gather is awaited by its task
+instead of being left unretrieved by wait_for.
+"""
+async def _communicate_streaming(process, on_stdout, on_stderr, binary: bool, input: bytes | None) -> tuple:
+    stdout, stderr, _, _ = await asyncio.gather(
+        _read_stream(process.stdout, on_stdout, binary),
+        _read_stream(process.stderr, on_stderr, binary),
+        _write_stdin(process.stdin, input),
+        process.wait(),
+    )
+    return stdout, stderr
+
+
+"""
+Drain a process pipe, either into memory or chunk by chunk into `on_chunk`
+"""
+async def _read_stream(stream: asyncio.StreamReader, on_chunk, binary: bool) -> bytes:
+    if on_chunk is None:
+        return await stream.read()
+
+    decoder = None if binary else codecs.getincrementaldecoder("utf-8")(errors="replace")
+    while chunk := await stream.read(STREAM_CHUNK_SIZE):
+        await on_chunk(chunk if binary else decoder.decode(chunk))
+    if decoder is not None and (tail := decoder.decode(b"", final=True)):
+        await on_chunk(tail)
+    return b""
+
+
+"""
+Write `data` to a process's stdin and close it
+"""
+async def _write_stdin(stdin: asyncio.StreamWriter | None, data: bytes | None):
+    if stdin is None:
+        return
+    try:
+        stdin.write(data)
+        await stdin.drain()
+        stdin.close()
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+
+
+"""
+Forcefully stop and remove a running container by name
+"""
+async def kill_container(name: str):
+    process = await asyncio.create_subprocess_exec(
+        "docker",
+        "rm",
+        "-f",
+        name,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    await process.wait()
@@ -1,100 +1,952 @@
+import asyncio
+import itertools
+import json
+import math
 import os
-import subprocess
+import time
 import uuid
+from contextlib import asynccontextmanager
 from http import HTTPStatus
 
 from fastapi.responses import JSONResponse
 
 from ..constants import (
-    DEFAULT_EXECUTION_TIMEOUT,
-    JAVA_EXECUTION_TIMEOUT,
+    ACTION_EXECUTION_EXIT,
+    ACTION_EXECUTION_STARTED,
+    ACTION_EXECUTION_STDERR,
+    ACTION_EXECUTION_STDOUT,
+    ACTION_TEST_CASE_RESULT,
+    CASE_SCRIPT_FILE_NAME,
+    CONTAINER_NAME_PREFIX,
+    DEFAULT_TEST_CASE_TIME_LIMIT,
+    EXECUTION_RETRY_AFTER,
+    EXECUTOR_BACKENDS,
+    JAVA_FAST_PATH_ENABLED,
     LANG_CONFIG_MAP,
+    MAX_OUTPUT_BYTES,
+    MAX_TEST_CASE_OUTPUT_BYTES,
+    MAX_TEST_CASE_TIME_LIMIT,
+    SANDBOX_DIR,
+    SANDBOX_TMPFS_SIZE,
+    SANDBOX_USER,
     USER_SCRIPT_FILE_NAME,
 )
-from ..models.code import Code
+from ..jobs.base import JOB_COMPLETED, JOB_FAILED
+from ..metrics import metrics
+from ..models.code import Code, TestCase, TestCaseBatch
+from .compile_cache import CompileCache, compile_cache
+from .container_pool import container_pool
+from .execution_engine import (
+    OWNER_LABEL_ARGS,
+    ExecutionQueueFull,
+    ExecutionTimeout,
+    execution_scheduler,
+    get_execution_timeout,
+    get_resource_args,
+    kill_container,
+    run_process,
+)
+from .image_cache import image_cache
+from .java_runner import java_runner
+from .local_sandbox import LocalSandboxSession, local_sandbox
+from .output_capture import OutputCapture, output_store
+from .result_cache import ResultCache, result_cache
+from .workspace import Workspace, workspace_manager
+
+EXECUTION_SECONDS = metrics.histogram(
+    "simcode_execution_seconds",
+    "Sandbox executions from admission request to teardown, by language, executor backend and outcome",
+    ("language", "backend", "outcome"),
+)
+EXECUTION_STAGE_SECONDS = metrics.histogram(
+    "simcode_execution_stage_seconds",
+    "Time spent in each stage of sandbox executions, by language and stage",
+    ("language", "stage"),
+)
+EXECUTION_FREED_CPU_SECONDS = metrics.counter(
+    "simcode_execution_freed_cpu_seconds_total",
+    "CPU seconds of the time limit that cancelled executions left unused, by language",
+    ("language",),
+)
+OUTPUT_TRUNCATED = metrics.counter(
+    "simcode_execution_output_truncated_total",
+    "Sandbox executions whose output exceeded MAX_OUTPUT_BYTES, by language",
+    ("language",),
+)
+
+# written to stderr by the sandbox scripts, see get_combined_script and get_case_script
+STAGE_MARK = "\x1esimcode-stages "
+CASE_MARK = "\x1esimcode-case "
+# the case script enforces the time limit itself, this only catches a stuck container
+CASE_TIMEOUT_GRACE = 5
+# CPU seconds per process of the sandbox scripts
+CPU_TIME_LIMIT = 2
+STAGE_MARK_MAX_LENGTH = 128
 
 """
-Get the combined execution script from the user code and prerequisites
+Everything that is decided about a single sandbox run before it starts:
+the executor backend and image it runs in, whether the prerequisites still
+have to be run, whether compiled artifacts are restored from or stored
+into the compile cache, and whether the language's fast path compiles and
+runs the program in one process.
 """
-def get_combined_script(code: Code) -> str:
+class SandboxRun:
+    __slots__ = (
+        "session_id",
+        "code",
+        "backend",
+        "image",
+        "run_prerequisites",
+        "timeout",
+        "compile_key",
+        "precompiled",
+        "fast_path",
+        "workspace",
+        "stages",
+        "requested_at",
+        "exited_at",
+    )
+
+    def __init__(self, code: Code):
+        self.session_id = str(uuid.uuid4())
+        self.code = code
+        self.timeout = get_execution_timeout(code.language)
+        self.precompiled = False
+        self.fast_path = False
+        self.workspace = None
+        # stage -> seconds, see record_execution
+        self.stages = {}
+        self.requested_at = time.perf_counter()
+        self.exited_at = None
+
+        # start from an image with the prerequisites installed when there is one
+        self.image = LANG_CONFIG_MAP[code.language]["image"]
+        has_prerequisites = bool(code.prerequisites and code.prerequisites.strip())
+        self.run_prerequisites = has_prerequisites
+        if self.run_prerequisites and image_cache:
+            prepared_image = image_cache.lookup(code.language, code.prerequisites)
+            if prepared_image:
+                self.image = prepared_image
+                self.run_prerequisites = False
+
+        # prerequisites need the network and an image they may modify, so they always run in Docker
+        self.backend = EXECUTOR_BACKENDS.get(code.language, "docker")
+        if self.backend == "process" and (has_prerequisites or not (local_sandbox and local_sandbox.available)):
+            self.backend = "docker"
+        self.compile_key = get_compile_key(code, self.backend)
+
+    @property
+    def compiles(self) -> bool:
+        return "compile" in LANG_CONFIG_MAP[self.code.language] and not self.precompiled and not self.fast_path
+
+    # the fast path compiles in memory and leaves no artifacts to cache, so
+    # its runs are not precompiled next time either
+    @property
+    def stores_artifacts(self) -> bool:
+        return bool(self.compile_key) and self.compiles
+
+    def add_stage(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0) + max(seconds, 0)
+
+
+"""
+Get the combined execution script from the user code and prerequisites.
+The prerequisites are left out when the run uses a prepared environment, and
+if the compiled artifacts were restored from the compile cache only the run
+step of the language is executed. Otherwise languages with a fast path
+compile and run in a single process, handed to the warm JVM of a pooled
+container when there is one. Without `run_program` the script stops after
+compiling, for sessions that run the program separately.
+Before the user's program starts, the script writes a STAGE_MARK line with
+the times it started, finished the prerequisites and finished compiling to
+stderr; it is taken off the output again by StageMarks.
+"""
+def get_combined_script(run: SandboxRun, run_program: bool = True) -> str:
+    config = LANG_CONFIG_MAP[run.code.language]
+    command = config.get("run") or " ".join(config["command"])
+    cpu_limit = CPU_TIME_LIMIT
+    if run.fast_path:
+        command = get_fast_path_command(run)
+        # one process compiles and runs the program
+        cpu_limit *= 2
     return f"""#!/bin/bash
-ulimit -t 2
-{"ulimit -v 262144" if code.language not in ["javascript", "java"] else ""}
+ulimit -t {cpu_limit}
+{"ulimit -v 262144" if run.code.language not in ["javascript", "java"] else ""}
+__started=$EPOCHREALTIME
+
+{run.code.prerequisites if run.run_prerequisites else ""}
 
-{code.prerequisites}
+__compiling=$EPOCHREALTIME
+{config["compile"] if run.compiles else "true"}
+__status=$?
+printf '\\036simcode-stages %s %s %s\\n' "$__started" "$__compiling" "$EPOCHREALTIME" >&2
+[ "$__status" -eq 0 ] || exit "$__status"
 
-{' '.join(LANG_CONFIG_MAP[code.language]["command"])}
+{command if run_program else ""}
 """
 
 
 """
-Prepare sandboxed environment for code execution
+Get the fast path command of the run's language. Runs in pooled containers
+that do not install prerequisites go to the container's warm JVM, which
+enforces the CPU time limit itself.
 """
-def create_sandbox_env(session_id: str, code: Code) -> str:
-    base_dir = f"/tmp/{session_id}"
-    os.makedirs(base_dir, exist_ok=True)
+def get_fast_path_command(run: SandboxRun) -> str:
+    command = LANG_CONFIG_MAP[run.code.language]["fast_run"]
+    if java_runner and run.backend == "docker" and container_pool and not run.run_prerequisites:
+        return java_runner.client_script(command, CPU_TIME_LIMIT)
+    return command
+
+
+"""
+Get the script running the program once for a test case, with the wall-clock
+time limit (seconds) and CPU time limit (whole seconds) as arguments. It
+writes a CASE_MARK line with the times the program started and ended to
+stderr once the program has exited.
+"""
+def get_case_script(run: SandboxRun) -> str:
+    config = LANG_CONFIG_MAP[run.code.language]
+    command = config.get("run") or " ".join(config["command"])
+    return f"""#!/bin/bash
+ulimit -t "$2"
+{"ulimit -v 262144" if run.code.language not in ["javascript", "java"] else ""}
+__started=$EPOCHREALTIME
+timeout -k 1 "$1" {command}
+__status=$?
+printf '\\036simcode-case %s %s\\n' "$__started" "$EPOCHREALTIME" >&2
+exit "$__status"
+"""
+
+
+"""
+Takes a mark line (STAGE_MARK or CASE_MARK) off a sandbox script's stderr
+and keeps the timestamps in it. The output is passed on to `on_stderr` as it
+comes, only text that may be the start of the mark is held back until it is
+complete.
+"""
+class StageMarks:
+    def __init__(self, on_stderr, mark: str = STAGE_MARK):
+        self.on_stderr = on_stderr
+        self.mark = mark
+        self.times = None
+        self._done = False
+        self._held = ""
+
+    def _parse(self, line: str):
+        try:
+            self.times = tuple(float(value) for value in line.split())
+        except ValueError:
+            pass
+
+    async def feed(self, data: str):
+        if self._done:
+            await self.on_stderr(data)
+            return
+
+        data, self._held = self._held + data, ""
+        start = 0
+        while (index := data.find(self.mark[0], start)) >= 0:
+            candidate = data[index:]
+            if candidate.startswith(self.mark):
+                end = candidate.find("\n")
+                if end >= 0:
+                    self._parse(candidate[len(self.mark):end])
+                    self._done = True
+                    data = data[:index] + candidate[end + 1:]
+                    break
+                if len(candidate) < STAGE_MARK_MAX_LENGTH:
+                    self._held, data = candidate, data[:index]
+                    break
+            elif self.mark.startswith(candidate):
+                self._held, data = candidate, data[:index]
+                break
+            start = index + 1
+
+        if data:
+            await self.on_stderr(data)
+
+    async def flush(self):
+        if self._held:
+            held, self._held = self._held, ""
+            await self.on_stderr(held)
+
+
+"""
+Run the sandbox script with `args` and split its duration into stages using
+the script's STAGE_MARK: container start (until the script started), setup
+(the prerequisites), compile (if the run compiles) and run.
+Returns the exit code; the output goes to `on_stdout` and `on_stderr`.
+"""
+async def run_script(run: SandboxRun, args: list[str], on_stdout, on_stderr, **kwargs) -> int:
+    marks = StageMarks(on_stderr)
+    spawned_at = time.time()
+    try:
+        returncode, _, _ = await run_process(
+            args, timeout=run.timeout, on_stdout=on_stdout, on_stderr=marks.feed, **kwargs
+        )
+    finally:
+        run.exited_at = time.time()
+        await marks.flush()
+
+    if marks.times and len(marks.times) == 3:
+        started, compiling, compiled = marks.times
+        run.add_stage("container_start", started - spawned_at)
+        run.add_stage("setup", compiling - started)
+        if run.compiles:
+            run.add_stage("compile", compiled - compiling)
+        run.add_stage("run", run.exited_at - compiled)
+    return returncode
+
+
+"""
+Get the compile cache key for the code, or None if it is not cacheable.
+Artifacts compiled by the host's toolchain are kept apart from the image's.
+"""
+def get_compile_key(code: Code, backend: str = "docker") -> str | None:
+    config = LANG_CONFIG_MAP[code.language]
+    if not compile_cache or "compile" not in config:
+        return None
+    environment = config["image"] if backend == "docker" else backend
+    return CompileCache.make_key(environment, config["compile"], code.code, code.prerequisites)
+
+
+"""
+Prepare the in-memory sandbox workspace for code execution.
+Compiled artifacts are restored from the compile cache when available.
+For test-case sessions the combined script only prepares the program and a
+separate script runs it once per case.
+"""
+def create_sandbox_env(run: SandboxRun, test_cases: bool = False) -> Workspace:
+    workspace = run.workspace = workspace_manager.create(run.session_id)
 
     # Write user code to file
-    with open(f"{base_dir}/{LANG_CONFIG_MAP[code.language]["file"]}", "w") as f:
-        f.write(code.code)
+    workspace.add(LANG_CONFIG_MAP[run.code.language]["file"], run.code.code)
+
+    # Reuse previously compiled artifacts for identical sources
+    artifacts = compile_cache.restore(run.compile_key) if run.compile_key else None
+    run.precompiled = artifacts is not None
+    for name, (data, mode) in (artifacts or {}).items():
+        workspace.add(name, data, mode)
+    # test-case sessions compile once and run the program for every case
+    config = LANG_CONFIG_MAP[run.code.language]
+    run.fast_path = JAVA_FAST_PATH_ENABLED and "fast_run" in config and not run.precompiled and not test_cases
 
     # Combine setup + run into single script
-    run_script = get_combined_script(code)
+    workspace.add(USER_SCRIPT_FILE_NAME, get_combined_script(run, run_program=not test_cases), 0o755)
+    if test_cases:
+        workspace.add(CASE_SCRIPT_FILE_NAME, get_case_script(run), 0o755)
+    return workspace
 
-    with open(f"{base_dir}/{USER_SCRIPT_FILE_NAME}", "w") as f:
-        f.write(run_script)
-        os.chmod(f"{base_dir}/{USER_SCRIPT_FILE_NAME}", 0o755)
-    return base_dir
+
+"""
+Build the docker CLI invocation for a sandbox run.
+The workspace archive is unpacked from stdin before the script starts, into
+a tmpfs unless compiled artifacts have to be copied out of the container
+after it exited (a tmpfs does not outlive the container's processes).
+"""
+def get_docker_command(container_name: str, run: SandboxRun) -> list[str]:
+    tmpfs_args = [] if run.stores_artifacts else ["--tmpfs", f"{SANDBOX_DIR}:rw,exec,mode=1777,size={SANDBOX_TMPFS_SIZE}"]
+    return [
+        "docker",
+        "run",
+        "-i",
+        "--name",
+        container_name,
+        *OWNER_LABEL_ARGS,
+        *get_resource_args(run.code.language),
+        *tmpfs_args,
+        "-w",
+        SANDBOX_DIR,
+        run.image,
+        "sh",
+        "-c",
+        f"tar -x -C {SANDBOX_DIR} && cd {run.session_id} && exec ./{USER_SCRIPT_FILE_NAME}",
+    ]
 
 
 """
-This function executes the user code in a Docker container.
-It uses a sandboxed environment to ensure security and isolation.
+Copy the workspace out of the container with `args` and store the compiled
+artifacts in it in the compile cache
 """
-def execute_code(code: Code):
-    session_id = str(uuid.uuid4())
-    base_dir = create_sandbox_env(session_id, code)
+async def store_artifacts(run: SandboxRun, args: list[str]):
+    returncode, archive, _ = await run_process(args, timeout=run.timeout, binary=True)
+    if returncode:
+        return
+
+    run.workspace.bytes_out = len(archive)
+    patterns = LANG_CONFIG_MAP[run.code.language]["artifacts"]
+    await asyncio.to_thread(compile_cache.store_from_tar, run.compile_key, archive, patterns)
 
-    # Run Docker container with volume mount
+
+"""
+Run the sandbox in a fresh container.
+The container is always removed afterwards, whether the run succeeded,
+failed, timed out or was cancelled. Compiled artifacts are stored in the
+compile cache before that.
+"""
+async def run_in_new_container(run: SandboxRun, **output_handlers) -> int:
+    container_name = f"{CONTAINER_NAME_PREFIX}-{run.session_id}"
     try:
-        result = subprocess.run(
-            [
-                "docker",
-                "run",
-                "--rm",
-                "-v",
-                f"{base_dir}:/sandbox",
-                "-w",
-                "/sandbox",
-                f"{LANG_CONFIG_MAP[code.language]["image"]}",
-                f"./{USER_SCRIPT_FILE_NAME}",
-            ],
-            capture_output=True,
-            text=True,
-            timeout=(
-                DEFAULT_EXECUTION_TIMEOUT
-                if code.language != "java"
-                else JAVA_EXECUTION_TIMEOUT
-            ),
+        returncode = await run_script(
+            run,
+            get_docker_command(container_name, run),
+            on_timeout=lambda: kill_container(container_name),
+            input=run.workspace.archive(),
+            **output_handlers,
         )
 
-        if not result.returncode:
-            result.stderr = ""
+        if run.stores_artifacts:
+            await store_artifacts(
+                run, ["docker", "cp", f"{container_name}:{SANDBOX_DIR}/{run.session_id}", "-"]
+            )
+        return returncode
+    finally:
+        await asyncio.shield(kill_container(container_name))
 
-        return JSONResponse(
-            {
-                "stdout": result.stdout,
-                "stderr": result.stderr,
-                "exit_code": result.returncode,
-            }
+
+"""
+A sandbox prepared for one run, in which the run's commands are executed
+one after the other. Executors yield one from their `session`.
+"""
+class ExecutorSession:
+    def __init__(self, run: SandboxRun):
+        self.run = run
+
+    """
+    Put the run's workspace into the sandbox
+    """
+    async def upload(self):
+        raise NotImplementedError
+
+    """
+    Arguments and run_process options running `argv` in the run's work
+    directory; with `stdin` the command reads the process's input
+    """
+    def command(self, argv: list[str], stdin: bool = False) -> tuple[list[str], dict]:
+        raise NotImplementedError
+
+    """
+    Store the compiled artifacts in the run's work directory in the compile
+    cache
+    """
+    async def store_artifacts(self):
+        raise NotImplementedError
+
+
+"""
+A session in a sandbox container, run as the user selected by `user_args`
+"""
+class DockerSession(ExecutorSession):
+    def __init__(self, run: SandboxRun, container: str, user_args: list[str]):
+        super().__init__(run)
+        self.container = container
+        self.user_args = user_args
+
+    """
+    Unpack the run's workspace into the container's tmpfs
+    """
+    async def upload(self):
+        started = time.perf_counter()
+        returncode, _, stderr = await run_process(
+            ["docker", "exec", "-i", *self.user_args, self.container, "tar", "-x", "-C", SANDBOX_DIR],
+            timeout=self.run.timeout,
+            input=self.run.workspace.archive(),
         )
+        if returncode:
+            raise RuntimeError(f"Could not copy sandbox into container: {stderr.strip()}")
+        self.run.add_stage("setup", time.perf_counter() - started)
 
-    except subprocess.TimeoutExpired:
-        return JSONResponse(
-            {"message": "Execution timed out"}, status_code=HTTPStatus.REQUEST_TIMEOUT
+    def command(self, argv: list[str], stdin: bool = False) -> tuple[list[str], dict]:
+        container = self.container
+        args = [
+            "docker",
+            "exec",
+            *(["-i"] if stdin else []),
+            *self.user_args,
+            "-w",
+            f"{SANDBOX_DIR}/{self.run.session_id}",
+            container,
+            *argv,
+        ]
+        return args, {"on_timeout": lambda: kill_container(container)}
+
+    async def store_artifacts(self):
+        await store_artifacts(
+            self.run, ["docker", "exec", self.container, "tar", "-c", "-C", SANDBOX_DIR, self.run.session_id]
         )
+
+
+"""
+A session in a scratch directory of the local process sandbox
+"""
+class ProcessSession(ExecutorSession):
+    def __init__(self, run: SandboxRun, session: LocalSandboxSession):
+        super().__init__(run)
+        self.session = session
+        self.workdir = os.path.join(session.directory, run.session_id)
+
+    """
+    Write the run's files straight into the scratch directory
+    """
+    async def upload(self):
+        started = time.perf_counter()
+        await asyncio.to_thread(self.run.workspace.write, self.session.directory, local_sandbox.owner)
+        self.run.add_stage("setup", time.perf_counter() - started)
+
+    def command(self, argv: list[str], stdin: bool = False) -> tuple[list[str], dict]:
+        return local_sandbox.command(self.session, argv, self.workdir, self.run.timeout)
+
+    async def store_artifacts(self):
+        patterns = LANG_CONFIG_MAP[self.run.code.language]["artifacts"]
+        await asyncio.to_thread(compile_cache.store_from_dir, self.run.compile_key, self.workdir, patterns)
+
+
+"""
+A sandbox container that stays up for several commands: a warm container
+checked out from the pool or, when the pool is disabled, one started just
+for the session and removed at its end. Yields a DockerSession selecting the
+user to run as.
+Pooled sessions without prerequisites run as an unprivileged user so that
+they cannot modify the image, and the container is reset and reused
+afterwards. Sessions with prerequisites may install packages as root, and
+failed sessions may have left anything behind, so their container is
+recycled instead of being handed to the next run.
+"""
+@asynccontextmanager
+async def sandbox_session(run: SandboxRun):
+    started = time.perf_counter()
+    if not container_pool:
+        name = f"{CONTAINER_NAME_PREFIX}-{run.session_id}"
+        try:
+            returncode, _, stderr = await run_process(
+                [
+                    "docker",
+                    "run",
+                    "-d",
+                    "--name",
+                    name,
+                    *OWNER_LABEL_ARGS,
+                    *get_resource_args(run.code.language),
+                    "--tmpfs",
+                    f"{SANDBOX_DIR}:rw,exec,mode=1777,size={SANDBOX_TMPFS_SIZE}",
+                    "-w",
+                    SANDBOX_DIR,
+                    run.image,
+                    "sleep",
+                    "infinity",
+                ],
+                timeout=run.timeout,
+                on_timeout=lambda: kill_container(name),
+            )
+            if returncode:
+                raise RuntimeError(f"Could not start sandbox container: {stderr.strip()}")
+            run.add_stage("container_start", time.perf_counter() - started)
+            yield DockerSession(run, name, [])
+        finally:
+            await asyncio.shield(kill_container(name))
+        return
+
+    recycle = run.run_prerequisites
+    container = await container_pool.checkout(run.image, run.code.language)
+    run.add_stage("container_start", time.perf_counter() - started)
+    try:
+        yield DockerSession(run, container.name, [] if recycle else ["--user", SANDBOX_USER, "-e", "HOME=/tmp"])
+    except BaseException:
+        recycle = True
+        raise
+    finally:
+        await asyncio.shield(container_pool.checkin(container, recycle=recycle))
+
+
+"""
+Run the sandbox script in the session and store the compiled artifacts in
+the compile cache
+"""
+async def run_in_session(run: SandboxRun, session: ExecutorSession, **output_handlers) -> int:
+    args, options = session.command([f"./{USER_SCRIPT_FILE_NAME}"])
+    returncode = await run_script(run, args, **options, **output_handlers)
+
+    if run.stores_artifacts:
+        await session.store_artifacts()
+    return returncode
+
+
+"""
+Runs the sandbox of a run in one of the executor backends. The default
+implementation opens a session, puts the workspace into it and runs the
+sandbox script there.
+"""
+class Executor:
+    name = None
+
+    def session(self, run: SandboxRun):
+        raise NotImplementedError
+
+    async def run(self, run: SandboxRun, **output_handlers) -> int:
+        async with self.session(run) as session:
+            await session.upload()
+            return await run_in_session(run, session, **output_handlers)
+
+
+"""
+Runs sandboxes in Docker containers: in a warm container checked out from
+the pool, into whose tmpfs the workspace is unpacked and out of which
+compiled artifacts are copied before the container is returned, or, with
+the pool disabled, in a fresh container for every run.
+"""
+class DockerExecutor(Executor):
+    name = "docker"
+
+    def session(self, run: SandboxRun):
+        return sandbox_session(run)
+
+    async def run(self, run: SandboxRun, **output_handlers) -> int:
+        if not container_pool:
+            return await run_in_new_container(run, **output_handlers)
+        return await super().run(run, **output_handlers)
+
+
+"""
+Runs sandboxes as isolated child processes of the server, see LocalSandbox.
+The language's commands run with the host's toolchain, so a run starts in
+milliseconds instead of paying for a container.
+"""
+class ProcessExecutor(Executor):
+    name = "process"
+
+    @asynccontextmanager
+    async def session(self, run: SandboxRun):
+        started = time.perf_counter()
+        async with local_sandbox.session(run.session_id, run.code.language) as session:
+            run.add_stage("container_start", time.perf_counter() - started)
+            yield ProcessSession(run, session)
+
+
+EXECUTORS = {executor.name: executor for executor in (DockerExecutor(), ProcessExecutor())}
+
+
+"""
+Run the user code in a sandbox and return its output.
+Runs are admitted by the execution scheduler (per language, room and user),
+and the sandbox is driven as an asyncio subprocess, so the event loop keeps
+serving sockets while it is running. The sandbox is a Docker container or
+an isolated local process, depending on the executor backend of the
+language (see EXECUTOR_BACKENDS); when the container pool is enabled Docker
+runs happen in a pre-started container instead of paying for `docker run`.
+`on_start` is awaited once the run has been admitted, and `on_stdout` /
+`on_stderr` receive the output incrementally instead of it being returned.
+At most MAX_OUTPUT_BYTES of every stream are kept (or passed on): its start
+and its end. The result flags truncated output, and carries the id under
+which the full output can be fetched when it was spilled to the output store.
+Raises ExecutionQueueFull or ExecutionTimeout. When the caller is cancelled,
+the container is removed and the execution slot released before the
+cancellation propagates.
+"""
+async def run_sandboxed(code: Code, on_start=None, on_stdout=None, on_stderr=None) -> dict:
+    run = SandboxRun(code)
+    executor = EXECUTORS[run.backend]
+    outcome = "error"
+    output_id = output_store.new_id() if output_store else None
+    stdout = OutputCapture("stdout", MAX_OUTPUT_BYTES, on_stdout, output_store, output_id)
+    stderr = OutputCapture("stderr", MAX_OUTPUT_BYTES, on_stderr, output_store, output_id)
+
+    try:
+        async with execution_scheduler.slot(code.language, code.roomId, code.username):
+            run.add_stage("queued", time.perf_counter() - run.requested_at)
+            if on_start is not None:
+                await on_start()
+
+            try:
+                started = time.perf_counter()
+                await asyncio.to_thread(create_sandbox_env, run)
+                run.add_stage("setup", time.perf_counter() - started)
+                returncode = await executor.run(run, on_stdout=stdout.write, on_stderr=stderr.write)
+            finally:
+                await stdout.close()
+                await stderr.close()
+                if run.workspace is not None:
+                    workspace_manager.release(run.workspace)
+                if run.exited_at is not None:
+                    run.add_stage("teardown", time.time() - run.exited_at)
+        outcome = "failure" if returncode else "success"
+    except ExecutionQueueFull:
+        outcome = "rejected"
+        raise
+    except ExecutionTimeout:
+        outcome = "timeout"
+        raise
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        record_cancellation(run)
+        raise
+    finally:
+        record_execution(run, outcome)
+
+    truncated = stdout.truncated or stderr.truncated
+    if truncated:
+        OUTPUT_TRUNCATED.inc(language=code.language)
+
+    return {
+        "stdout": stdout.text() if on_stdout is None else "",
+        "stderr": stderr.text() if on_stderr is None and returncode else "",
+        "exit_code": returncode,
+        "truncated": truncated,
+        "output_id": output_id if stdout.spilled or stderr.spilled else None,
+    }
+
+
+"""
+Record the duration of a sandbox run and of its stages
+"""
+def record_execution(run: SandboxRun, outcome: str):
+    language = run.code.language
+    EXECUTION_SECONDS.observe(
+        time.perf_counter() - run.requested_at, language=language, backend=run.backend, outcome=outcome
+    )
+    for stage, seconds in run.stages.items():
+        EXECUTION_STAGE_SECONDS.observe(seconds, language=language, stage=stage)
+
+
+"""
+Count the capacity a cancelled run gave back: the CPUs it reserved for the
+part of its time limit that it did not use. Runs cancelled while waiting for
+admission had not reserved anything yet.
+"""
+def record_cancellation(run: SandboxRun):
+    if "queued" not in run.stages:
+        return
+    elapsed = time.perf_counter() - run.requested_at - run.stages["queued"]
+    config = LANG_CONFIG_MAP[run.code.language]
+    EXECUTION_FREED_CPU_SECONDS.inc(max(run.timeout - elapsed, 0) * config["cpus"], language=run.code.language)
+
+
+"""
+Compare program output with an expected output, ignoring trailing
+whitespace on every line and trailing blank lines
+"""
+def matches_expected(output: str, expected: str) -> bool:
+    normalize = lambda text: [line.rstrip() for line in text.rstrip().splitlines()]
+    return normalize(output) == normalize(expected)
+
+
+"""
+Run the prepared program once for a test case in the session.
+The case script enforces the case's wall-clock limit and reports the
+program's start and end time through a CASE_MARK, so the wall time does not
+include the overhead of starting the command in the sandbox.
+"""
+async def run_test_case(run: SandboxRun, session: ExecutorSession, case: TestCase) -> dict:
+    time_limit = min(case.timeLimit or DEFAULT_TEST_CASE_TIME_LIMIT, MAX_TEST_CASE_TIME_LIMIT)
+    stdout = OutputCapture("stdout", MAX_TEST_CASE_OUTPUT_BYTES)
+    stderr = OutputCapture("stderr", MAX_TEST_CASE_OUTPUT_BYTES)
+    marks = StageMarks(stderr.write, CASE_MARK)
+    args, options = session.command(
+        [f"./{CASE_SCRIPT_FILE_NAME}", str(time_limit), str(math.ceil(time_limit))], stdin=True
+    )
+    spawned_at = time.time()
+    try:
+        returncode, _, _ = await run_process(
+            args,
+            timeout=time_limit + CASE_TIMEOUT_GRACE,
+            **options,
+            on_stdout=stdout.write,
+            on_stderr=marks.feed,
+            input=(case.stdin or "").encode(),
+        )
+    finally:
+        run.exited_at = time.time()
+        await marks.flush()
+
+    started, ended = marks.times if marks.times and len(marks.times) == 2 else (spawned_at, run.exited_at)
+    wall_time = max(ended - started, 0)
+    run.add_stage("run", wall_time)
+    # `timeout` exits with 124, or 137 if the program had to be killed
+    timed_out = returncode in (124, 137) and wall_time >= time_limit
+    output = stdout.text()
+    return {
+        "stdout": output,
+        "stderr": stderr.text(),
+        "exit_code": returncode,
+        "wall_time": round(wall_time, 3),
+        "timed_out": timed_out,
+        "truncated": stdout.truncated or stderr.truncated,
+        "passed": (
+            None
+            if case.expectedOutput is None
+            else not returncode and not stdout.truncated and matches_expected(output, case.expectedOutput)
+        ),
+    }
+
+
+"""
+Run the program against all test cases of a batch in a single sandbox
+session: the prerequisites are installed and the code is compiled once,
+then the program runs once per case with the case's stdin and time limit.
+`on_case(index, result)` is awaited as soon as a case has finished. If the
+setup fails (for example with a compile error) no case is run.
+Raises ExecutionQueueFull or ExecutionTimeout.
+"""
+async def run_test_cases(batch: TestCaseBatch, on_case=None) -> dict:
+    run = SandboxRun(batch)
+    outcome = "error"
+    setup_stdout = OutputCapture("stdout", MAX_TEST_CASE_OUTPUT_BYTES)
+    setup_stderr = OutputCapture("stderr", MAX_TEST_CASE_OUTPUT_BYTES)
+    cases = []
+
+    try:
+        async with execution_scheduler.slot(batch.language, batch.roomId, batch.username):
+            run.add_stage("queued", time.perf_counter() - run.requested_at)
+            try:
+                started = time.perf_counter()
+                await asyncio.to_thread(create_sandbox_env, run, True)
+                run.add_stage("setup", time.perf_counter() - started)
+
+                async with EXECUTORS[run.backend].session(run) as session:
+                    await session.upload()
+                    returncode = await run_in_session(
+                        run, session, on_stdout=setup_stdout.write, on_stderr=setup_stderr.write
+                    )
+                    for index, case in enumerate(batch.testCases if not returncode else ()):
+                        result = await run_test_case(run, session, case)
+                        cases.append(result)
+                        if on_case is not None:
+                            await on_case(index, result)
+            finally:
+                if run.workspace is not None:
+                    workspace_manager.release(run.workspace)
+                if run.exited_at is not None:
+                    run.add_stage("teardown", time.time() - run.exited_at)
+        outcome = "failure" if returncode else "success"
+    except ExecutionQueueFull:
+        outcome = "rejected"
+        raise
+    except ExecutionTimeout:
+        outcome = "timeout"
+        raise
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        record_cancellation(run)
+        raise
+    finally:
+        record_execution(run, outcome)
+
+    return {
+        "setup": {
+            "stdout": setup_stdout.text(),
+            "stderr": setup_stderr.text() if returncode else "",
+            "exit_code": returncode,
+        },
+        "cases": cases,
+        "passed": sum(1 for case in cases if case["passed"] is True),
+        "failed": sum(1 for case in cases if case["passed"] is False),
+    }
+
+
+"""
+This function executes the user code in a sandbox.
+It uses a sandboxed environment to ensure security and isolation.
+Identical cacheable submissions are served from the result cache, and
+concurrent identical submissions share a single execution.
+"""
+async def execute_code(code: Code) -> dict:
+    if result_cache and code.cacheable:
+        return await result_cache.get_or_run(ResultCache.make_key(code), lambda: run_sandboxed(code))
+    return await run_sandboxed(code)
+
+
+"""
+This function executes the user code like execute_code, but pushes the
+output to the caller's `emit(event, payload)` coroutine as it is produced:
+a started event, stdout/stderr chunks and an exit event, all tagged with the
+execution id and a sequence number. Output is never accumulated on the
+server, so the result only carries the execution id, exit code and whether
+the output was truncated.
+"""
+async def stream_code(code: Code, emit, execution_id: str | None = None) -> dict:
+    execution_id = execution_id or str(uuid.uuid4())
+    sequence = itertools.count()
+
+    async def send(event: str, payload: dict):
+        await emit(event, {"executionId": execution_id, "seq": next(sequence), **payload})
+
+    try:
+        result = await run_sandboxed(
+            code,
+            on_start=lambda: send(ACTION_EXECUTION_STARTED, {"language": code.language}),
+            on_stdout=lambda data: send(ACTION_EXECUTION_STDOUT, {"data": data}),
+            on_stderr=lambda data: send(ACTION_EXECUTION_STDERR, {"data": data}),
+        )
+    except Exception as err:
+        response = get_error_response(err)
+        await send(ACTION_EXECUTION_EXIT, {"exit_code": None, **json.loads(response.body)})
+        raise
+    except asyncio.CancelledError:
+        await send(ACTION_EXECUTION_EXIT, {"exit_code": None, "message": "Execution cancelled", "cancelled": True})
+        raise
+
+    outcome = {key: result[key] for key in ("exit_code", "truncated", "output_id")}
+    await send(ACTION_EXECUTION_EXIT, outcome)
+    return {"executionId": execution_id, **outcome}
+
+
+"""
+Run an execution job and return its outcome: the result of the run, or the
+error that stopped it together with the HTTP status it maps to.
+Streamed jobs use the job id as execution id; streamed test-case batches
+send every case result as it finishes.
+"""
+async def run_job(job_id: str, code: Code, emit) -> dict:
+    try:
+        if isinstance(code, TestCaseBatch):
+            on_case = None
+            if code.stream:
+                on_case = lambda index, result: emit(
+                    ACTION_TEST_CASE_RESULT, {"executionId": job_id, "index": index, **result}
+                )
+            result = await run_test_cases(code, on_case=on_case)
+        elif code.stream:
+            result = await stream_code(code, emit, execution_id=job_id)
+        else:
+            result = await execute_code(code)
+        return {"status": JOB_COMPLETED, "result": result}
+
     except Exception as err:
+        response = get_error_response(err)
+        return {"status": JOB_FAILED, "error": {"status_code": response.status_code, **json.loads(response.body)}}
+
+
+"""
+Map an execution error to the HTTP response sent to the client
+"""
+def get_error_response(err: Exception) -> JSONResponse:
+    if isinstance(err, ExecutionQueueFull):
         return JSONResponse(
-            {"message": "Unknown error occurred", "error": repr(err)},
-            status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
+            {"message": "Too many executions in progress, please retry later"},
+            status_code=HTTPStatus.TOO_MANY_REQUESTS,
+            headers={"Retry-After": str(EXECUTION_RETRY_AFTER)},
         )
+    if isinstance(err, ExecutionTimeout):
+        return JSONResponse(
+            {"message": "Execution timed out"}, status_code=HTTPStatus.REQUEST_TIMEOUT
+        )
+    return JSONResponse(
+        {"message": "Unknown error occurred", "error": repr(err)},
+        status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
+    )
+
+
+"""
+Snapshot of the execution engine state for monitoring
+"""
+def get_execution_stats() -> dict:
+    return {
+        "executions": execution_scheduler.stats(),
+        "container_pool": container_pool.stats() if container_pool else None,
+        "compile_cache": compile_cache.stats() if compile_cache else None,
+        "result_cache": result_cache.stats() if result_cache else None,
+        "environment_images": image_cache.stats() if image_cache else None,
+        "workspaces": workspace_manager.stats(),
+        "output_spill": output_store.stats() if output_store else None,
+        "local_sandbox": local_sandbox.stats() if local_sandbox else None,
+        "java_runner": java_runner.stats() if java_runner else None,
+    }
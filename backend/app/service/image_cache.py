@@ -0,0 +1,292 @@
+import asyncio
+import hashlib
+import shutil
+import uuid
+from collections import OrderedDict
+
+from ..constants import (
+    CONTAINER_NAME_PREFIX,
+    ENV_IMAGE_BUILD_DELAY,
+    ENV_IMAGE_BUILD_TIMEOUT,
+    ENV_IMAGE_CACHE_ENABLED,
+    ENV_IMAGE_CACHE_MAX_BYTES,
+    ENV_IMAGE_CACHE_MAX_IMAGES,
+    ENV_IMAGE_MAX_CONCURRENT_BUILDS,
+    ENV_IMAGE_MAX_PENDING_BUILDS,
+    ENV_IMAGE_REPOSITORY,
+    LANG_CONFIG_MAP,
+)
+from ..jobs.base import JOB_COMPLETED, JOB_FAILED
+from .container_pool import container_pool
+from .execution_engine import (
+    OWNER_LABEL_ARGS,
+    ExecutionQueueFull,
+    ExecutionTimeout,
+    execution_scheduler,
+    get_execution_timeout,
+    get_resource_args,
+    kill_container,
+    run_process,
+)
+
+DOCKER_COMMAND_TIMEOUT = 60
+
+
+"""
+Cache of derived sandbox images with the prerequisites of a room already
+installed. An image is built by running the prerequisites in a container of
+the base image and committing the result, and is tagged with the hash of the
+base image and prerequisites. Images are evicted least recently used first
+once there are more than `max_images` of them or they use more than
+`max_bytes`. Builds run in the background, one per key at a time and at
+most `max_pending_builds` at once; further builds are refused.
+A build is an execution of the prerequisites like any other: it is
+admitted by the execution scheduler and runs with the resource limits, user
+and time limit of a sandbox run of the language. Where executions run in
+separate workers, builds are handed to them as jobs (see `delegate_builds`),
+so that the images end up on the hosts that use them.
+"""
+class EnvironmentImageCache:
+    def __init__(
+        self,
+        repository: str,
+        max_images: int,
+        max_bytes: int,
+        max_concurrent_builds: int,
+        max_pending_builds: int,
+    ):
+        self.repository = repository
+        self.max_images = max_images
+        self.max_bytes = max_bytes
+        self.max_pending_builds = max_pending_builds
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        self.failed_builds = 0
+        self.rejected_builds = 0
+        self.evictions = 0
+        self.total_bytes = 0
+        # key -> image size in bytes
+        self._images: OrderedDict[str, int] = OrderedDict()
+        self._builds: dict[str, asyncio.Task] = {}
+        self._debounce: dict[str, asyncio.TimerHandle] = {}
+        self._build_slots = asyncio.Semaphore(max_concurrent_builds)
+        # job queue the builds are submitted to instead of running them here
+        self._job_queue = None
+
+    @staticmethod
+    def make_key(image: str, prerequisites: str) -> str:
+        return hashlib.sha256(f"{image}\0{prerequisites.strip()}".encode()).hexdigest()
+
+    def tag(self, key: str) -> str:
+        return f"{self.repository}:{key}"
+
+    """
+    Submit the builds to `job_queue` for the execution workers instead of
+    running them in this process
+    """
+    def delegate_builds(self, job_queue):
+        self._job_queue = job_queue
+
+    """
+    Adopt images built by a previous run of the server
+    """
+    async def load(self):
+        if shutil.which("docker") is None:
+            return
+        returncode, stdout, _ = await run_process(
+            ["docker", "images", self.repository, "--format", "{{.Tag}} {{.Size}}"],
+            timeout=DOCKER_COMMAND_TIMEOUT,
+        )
+        if returncode:
+            return
+
+        for line in stdout.splitlines():
+            key, _ = line.split(" ", 1)
+            # dangling images left behind when a tag was reused
+            if key == "<none>":
+                continue
+            if key not in self._images:
+                self._images[key] = await self._image_size(key)
+                self.total_bytes += self._images[key]
+        await self._evict()
+
+    async def _image_size(self, key: str) -> int:
+        returncode, stdout, _ = await run_process(
+            ["docker", "image", "inspect", "--format", "{{.Size}}", self.tag(key)],
+            timeout=DOCKER_COMMAND_TIMEOUT,
+        )
+        return int(stdout.strip()) if not returncode and stdout.strip().isdigit() else 0
+
+    """
+    Get the prepared image for the prerequisites, or None if it is not built
+    yet; in that case a background build is started
+    """
+    def lookup(self, language: str, prerequisites: str) -> str | None:
+        key = self.make_key(LANG_CONFIG_MAP[language]["image"], prerequisites)
+        if key in self._images:
+            self._images.move_to_end(key)
+            self.hits += 1
+            return self.tag(key)
+
+        self.misses += 1
+        self.schedule_build(language, prerequisites)
+        return None
+
+    """
+    Build the prepared image for the language's sandbox image in the background.
+    With `group` and `delay` set, the build only starts once the group (for
+    example a room) has not changed its prerequisites for `delay` seconds.
+    Returns False if the build was refused because too many are pending.
+    """
+    def schedule_build(self, language: str, prerequisites: str, group: str | None = None, delay: float = 0) -> bool:
+        if not prerequisites.strip():
+            return True
+
+        if group is not None:
+            timer = self._debounce.pop(group, None)
+            if timer:
+                timer.cancel()
+            if delay:
+                loop = asyncio.get_running_loop()
+                self._debounce[group] = loop.call_later(
+                    delay, self._debounced_build, group, language, prerequisites
+                )
+                return True
+
+        key = self.make_key(LANG_CONFIG_MAP[language]["image"], prerequisites)
+        if key in self._images or key in self._builds:
+            return True
+        if len(self._builds) >= self.max_pending_builds:
+            self.rejected_builds += 1
+            return False
+
+        if self._job_queue is not None:
+            task = asyncio.ensure_future(self._submit_build(language, prerequisites))
+        else:
+            task = asyncio.ensure_future(self._build(key, language, prerequisites))
+        self._builds[key] = task
+        task.add_done_callback(lambda _: self._builds.pop(key, None))
+        return True
+
+    def _debounced_build(self, group: str, language: str, prerequisites: str):
+        self._debounce.pop(group, None)
+        self.schedule_build(language, prerequisites)
+
+    """
+    Build the prepared image as a job of the execution workers, see
+    `build_job`, and wait until it is done
+    """
+    async def _submit_build(self, language: str, prerequisites: str):
+        try:
+            job = await self._job_queue.submit(
+                {"environment": True, "language": language, "prerequisites": prerequisites}
+            )
+        except ExecutionQueueFull:
+            self.rejected_builds += 1
+            return
+        await self._job_queue.wait(job["jobId"], self.build_timeout(language))
+
+    """
+    Run a build submitted by `_submit_build` and return the job's outcome
+    """
+    async def build_job(self, language: str, prerequisites: str) -> dict:
+        key = self.make_key(LANG_CONFIG_MAP[language]["image"], prerequisites)
+        if key not in self._images:
+            task = self._builds.get(key)
+            if task is None:
+                task = asyncio.ensure_future(self._build(key, language, prerequisites))
+                self._builds[key] = task
+                task.add_done_callback(lambda _: self._builds.pop(key, None))
+            await asyncio.shield(task)
+        if key not in self._images:
+            return {"status": JOB_FAILED, "error": {"status_code": 500, "message": "Environment build failed"}}
+        return {"status": JOB_COMPLETED, "result": {"image": self.tag(key)}}
+
+    @staticmethod
+    def build_timeout(language: str) -> int:
+        return min(get_execution_timeout(language), ENV_IMAGE_BUILD_TIMEOUT)
+
+    async def _build(self, key: str, language: str, prerequisites: str):
+        name = f"{CONTAINER_NAME_PREFIX}-build-{uuid.uuid4().hex[:12]}"
+        image = LANG_CONFIG_MAP[language]["image"]
+        async with self._build_slots:
+            try:
+                async with execution_scheduler.slot(language):
+                    returncode, _, _ = await run_process(
+                        [
+                            "docker",
+                            "run",
+                            "--name",
+                            name,
+                            *OWNER_LABEL_ARGS,
+                            *get_resource_args(language),
+                            image,
+                            "bash",
+                            "-c",
+                            prerequisites,
+                        ],
+                        timeout=self.build_timeout(language),
+                        on_timeout=lambda: kill_container(name),
+                    )
+                if not returncode:
+                    returncode, _, _ = await run_process(
+                        ["docker", "commit", name, self.tag(key)],
+                        timeout=DOCKER_COMMAND_TIMEOUT,
+                    )
+            except (ExecutionQueueFull, ExecutionTimeout):
+                returncode = -1
+            finally:
+                await kill_container(name)
+
+            if returncode:
+                self.failed_builds += 1
+                return
+
+        self.builds += 1
+        size = await self._image_size(key)
+        self._images[key] = size
+        self.total_bytes += size
+        await self._evict()
+
+    async def _evict(self):
+        while self._images and (len(self._images) > self.max_images or self.total_bytes > self.max_bytes):
+            key, size = self._images.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            if container_pool:
+                await container_pool.discard(self.tag(key))
+            await run_process(["docker", "rmi", "-f", self.tag(key)], timeout=DOCKER_COMMAND_TIMEOUT)
+
+    async def stop(self):
+        for timer in self._debounce.values():
+            timer.cancel()
+        self._debounce.clear()
+        for task in list(self._builds.values()):
+            task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "builds": self.builds,
+            "failed_builds": self.failed_builds,
+            "rejected_builds": self.rejected_builds,
+            "building": len(self._builds),
+            "evictions": self.evictions,
+            "images": len(self._images),
+            "bytes": self.total_bytes,
+        }
+
+
+image_cache = (
+    EnvironmentImageCache(
+        ENV_IMAGE_REPOSITORY,
+        ENV_IMAGE_CACHE_MAX_IMAGES,
+        ENV_IMAGE_CACHE_MAX_BYTES,
+        ENV_IMAGE_MAX_CONCURRENT_BUILDS,
+        ENV_IMAGE_MAX_PENDING_BUILDS,
+    )
+    if ENV_IMAGE_CACHE_ENABLED
+    else None
+)
@@ -0,0 +1,294 @@
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.BufferedReader;
+import java.io.ByteArrayOutputStream;
+import java.io.FileInputStream;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.io.StringWriter;
+import java.io.Writer;
+import java.lang.management.ManagementFactory;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.net.URI;
+import java.nio.charset.StandardCharsets;
+import java.nio.file.Files;
+import java.nio.file.Path;
+import java.nio.file.Paths;
+import java.nio.file.StandardCopyOption;
+import java.security.Permission;
+import java.util.Arrays;
+import java.util.HashMap;
+import java.util.List;
+import java.util.Map;
+import javax.tools.FileObject;
+import javax.tools.ForwardingJavaFileManager;
+import javax.tools.JavaCompiler;
+import javax.tools.JavaFileManager;
+import javax.tools.JavaFileObject;
+import javax.tools.SimpleJavaFileObject;
+import javax.tools.StandardJavaFileManager;
+import javax.tools.ToolProvider;
+
+/**
+ * Pre-started JVM serving a single SimCode run (see java_runner.py).
+ *
+ * It loads and warms up the compiler, creates the "ready" file in its state
+ * directory and waits for a request on the "request" FIFO: the run's work
+ * directory and its CPU time limit in seconds, which covers both compiling
+ * and running the program. The program's standard streams are the FIFOs
+ * .stdin, .stdout and .stderr in the work directory. Main.java is compiled
+ * in memory and its classes are loaded by a throwaway class loader; they are
+ * also written to the work directory for the compile cache. Once the
+ * program and its threads have ended, or it called System.exit, its exit
+ * status is written to .status and the JVM exits, so every run gets a fresh
+ * heap with the memory limit of the JVM.
+ */
+public class SimcodeRunner {
+    private static final long WATCHDOG_INTERVAL_MS = 50;
+    // what a shell reports for a process killed by SIGXCPU
+    private static final int CPU_LIMIT_STATUS = 152;
+
+    private static Path workdir;
+    private static PrintStream out;
+    private static PrintStream err;
+    private static boolean finished;
+
+    public static void main(String[] args) throws Exception {
+        Path state = Paths.get(args[0]);
+        JavaCompiler compiler = ToolProvider.getSystemJavaCompiler();
+        compile(compiler, "Warmup", "public class Warmup { public static void main(String[] args) {} }", new StringWriter());
+        System.setSecurityManager(new ExitGuard());
+        Files.createFile(state.resolve("ready"));
+
+        String[] request;
+        try (BufferedReader reader = Files.newBufferedReader(state.resolve("request"))) {
+            request = reader.readLine().trim().split(" ");
+        }
+        workdir = Paths.get(request[0]);
+        long cpuLimitNanos = Long.parseLong(request[1]) * 1_000_000_000L;
+
+        out = open(".stdout");
+        err = open(".stderr");
+        System.setOut(out);
+        System.setErr(err);
+        System.setIn(new BufferedInputStream(new FileInputStream(workdir.resolve(".stdin").toFile())));
+        System.exit(run(compiler, cpuLimitNanos));
+    }
+
+    private static PrintStream open(String name) throws IOException {
+        OutputStream stream = new FileOutputStream(workdir.resolve(name).toFile());
+        return new PrintStream(new BufferedOutputStream(stream), true, StandardCharsets.UTF_8);
+    }
+
+    private static int run(JavaCompiler compiler, long cpuLimitNanos) throws Exception {
+        // compiling counts against the limit too
+        startWatchdog(cpuLimitNanos);
+        String source = Files.readString(workdir.resolve("Main.java"));
+        StringWriter diagnostics = new StringWriter();
+        Map<String, ClassOutput> classes = compile(compiler, "Main", source, diagnostics);
+        err.print(diagnostics);
+        if (classes == null) {
+            return 1;
+        }
+        storeClasses(classes);
+
+        Method main;
+        try {
+            main = new MemoryClassLoader(classes).loadClass("Main").getMethod("main", String[].class);
+            main.setAccessible(true);
+        } catch (ClassNotFoundException e) {
+            err.println("Error: Could not find or load main class Main");
+            return 1;
+        } catch (NoSuchMethodException e) {
+            err.println("Error: Main method not found in class Main, please define the main method as:");
+            err.println("   public static void main(String[] args)");
+            return 1;
+        }
+
+        int status = 0;
+        try {
+            main.invoke(null, (Object) new String[0]);
+        } catch (InvocationTargetException e) {
+            Throwable cause = e.getCause();
+            trimStackTrace(cause);
+            err.print("Exception in thread \"main\" ");
+            cause.printStackTrace(err);
+            status = 1;
+        }
+        awaitThreads();
+        return status;
+    }
+
+    private static Map<String, ClassOutput> compile(JavaCompiler compiler, String name, String source, Writer diagnostics) {
+        Map<String, ClassOutput> classes = new HashMap<>();
+        StandardJavaFileManager files = compiler.getStandardFileManager(null, null, StandardCharsets.UTF_8);
+        JavaFileManager manager = new ForwardingJavaFileManager<StandardJavaFileManager>(files) {
+            @Override
+            public JavaFileObject getJavaFileForOutput(
+                JavaFileManager.Location location, String className, JavaFileObject.Kind kind, FileObject sibling
+            ) {
+                ClassOutput output = new ClassOutput(className);
+                classes.put(className, output);
+                return output;
+            }
+        };
+        boolean compiled = compiler.getTask(diagnostics, manager, null, null, null, List.of(new Source(name, source))).call();
+        return compiled ? classes : null;
+    }
+
+    private static void storeClasses(Map<String, ClassOutput> classes) {
+        for (Map.Entry<String, ClassOutput> entry : classes.entrySet()) {
+            // classes in packages would need directories, the compile cache only keeps top-level files
+            if (entry.getKey().contains(".")) {
+                continue;
+            }
+            try {
+                Files.write(workdir.resolve(entry.getKey() + ".class"), entry.getValue().bytes.toByteArray());
+            } catch (IOException e) {
+                return;
+            }
+        }
+    }
+
+    private static void startWatchdog(long cpuLimitNanos) {
+        com.sun.management.OperatingSystemMXBean system =
+            (com.sun.management.OperatingSystemMXBean) ManagementFactory.getOperatingSystemMXBean();
+        long deadline = system.getProcessCpuTime() + cpuLimitNanos;
+        Thread watchdog = new Thread(() -> {
+            while (system.getProcessCpuTime() < deadline) {
+                try {
+                    Thread.sleep(WATCHDOG_INTERVAL_MS);
+                } catch (InterruptedException e) {
+                    return;
+                }
+            }
+            err.println("CPU time limit exceeded");
+            finish(CPU_LIMIT_STATUS);
+            Runtime.getRuntime().halt(CPU_LIMIT_STATUS);
+        }, "simcode-watchdog");
+        watchdog.setDaemon(true);
+        watchdog.start();
+    }
+
+    // like the java launcher, wait for the program's other non-daemon threads
+    private static void awaitThreads() throws InterruptedException {
+        while (true) {
+            Thread pending = null;
+            for (Thread thread : Thread.getAllStackTraces().keySet()) {
+                if (thread != Thread.currentThread() && !thread.isDaemon() && thread.isAlive()) {
+                    pending = thread;
+                    break;
+                }
+            }
+            if (pending == null) {
+                return;
+            }
+            pending.join();
+        }
+    }
+
+    // drop the frames of the reflective call into main
+    private static void trimStackTrace(Throwable throwable) {
+        StackTraceElement[] trace = throwable.getStackTrace();
+        for (int i = 0; i < trace.length; i++) {
+            if (trace[i].getClassName().startsWith("jdk.internal.reflect.")) {
+                throwable.setStackTrace(Arrays.copyOf(trace, i));
+                return;
+            }
+        }
+    }
+
+    private static synchronized void finish(int status) {
+        if (finished) {
+            return;
+        }
+        finished = true;
+        if (out == null) {
+            return;
+        }
+        out.flush();
+        err.flush();
+        try {
+            Path pending = workdir.resolve(".status.tmp");
+            Files.writeString(pending, Integer.toString(status));
+            Files.move(pending, workdir.resolve(".status"), StandardCopyOption.ATOMIC_MOVE);
+        } catch (IOException e) {
+            // the client reports the run as killed
+        }
+    }
+
+    private static final class ExitGuard extends SecurityManager {
+        @Override
+        public void checkPermission(Permission permission) {
+            if ("setSecurityManager".equals(permission.getName())) {
+                throw new SecurityException("The security manager of the runner cannot be replaced");
+            }
+        }
+
+        @Override
+        public void checkPermission(Permission permission, Object context) {
+            checkPermission(permission);
+        }
+
+        @Override
+        public void checkExit(int status) {
+            finish(status);
+        }
+    }
+
+    private static final class Source extends SimpleJavaFileObject {
+        private final String name;
+        private final String code;
+
+        Source(String name, String code) {
+            super(URI.create("string:///" + name + JavaFileObject.Kind.SOURCE.extension), JavaFileObject.Kind.SOURCE);
+            this.name = name;
+            this.code = code;
+        }
+
+        @Override
+        public String getName() {
+            return name + JavaFileObject.Kind.SOURCE.extension;
+        }
+
+        @Override
+        public CharSequence getCharContent(boolean ignoreEncodingErrors) {
+            return code;
+        }
+    }
+
+    private static final class ClassOutput extends SimpleJavaFileObject {
+        private final ByteArrayOutputStream bytes = new ByteArrayOutputStream();
+
+        ClassOutput(String name) {
+            super(URI.create("bytes:///" + name.replace('.', '/') + JavaFileObject.Kind.CLASS.extension), JavaFileObject.Kind.CLASS);
+        }
+
+        @Override
+        public OutputStream openOutputStream() {
+            return bytes;
+        }
+    }
+
+    private static final class MemoryClassLoader extends ClassLoader {
+        private final Map<String, ClassOutput> classes;
+
+        MemoryClassLoader(Map<String, ClassOutput> classes) {
+            super(ClassLoader.getSystemClassLoader());
+            this.classes = classes;
+        }
+
+        @Override
+        protected Class<?> findClass(String name) throws ClassNotFoundException {
+            ClassOutput output = classes.get(name);
+            if (output == null) {
+                throw new ClassNotFoundException(name);
+            }
+            byte[] bytes = output.bytes.toByteArray();
+            return defineClass(name, bytes, 0, bytes.length);
+        }
+    }
+}
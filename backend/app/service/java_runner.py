@@ -0,0 +1,114 @@
+import logging
+import os
+import shlex
+
+from ..constants import (
+    CONTAINER_POOL_ENABLED,
+    JAVA_FAST_PATH_ENABLED,
+    JAVA_OPTIONS,
+    JAVA_WARM_JVM_ENABLED,
+    SANDBOX_DIR,
+    SANDBOX_USER,
+)
+from .execution_engine import run_process
+
+logger = logging.getLogger(__name__)
+
+DOCKER_COMMAND_TIMEOUT = 30
+RUNNER_SOURCE = os.path.join(os.path.dirname(__file__), "java", "SimcodeRunner.java")
+# inside the container; the reset of a pooled container wipes it
+RUNNER_STATE_DIR = "/tmp/simcode-jvm"
+# seconds a run waits for the runner to take its request before compiling itself
+REQUEST_TIMEOUT = 2
+
+START_SCRIPT = f"""state=$1 source=$2
+shift 2
+mkdir -p "$state" && cd "$state" && printf '%s' "$source" > SimcodeRunner.java && mkfifo request || exit 1
+cd {SANDBOX_DIR} && exec java "$@" "$state/SimcodeRunner.java" "$state"
+"""
+
+
+"""
+Pre-started JVMs for the Java runs of pooled containers.
+Whenever a Java container is started or reset, a runner JVM (see
+SimcodeRunner.java) is started in it as the sandbox user. It loads and warms
+up the compiler ahead of time and then waits for a run, which it compiles in
+memory and executes in a throwaway class loader. A runner serves a single
+run and exits with it, so that every run gets a fresh heap under the JVM's
+memory limit and cannot leave threads or static state behind for the next.
+"""
+class JavaRunner:
+    def __init__(self, options: list[str]):
+        with open(RUNNER_SOURCE) as f:
+            self.source = f.read()
+        # the runner installs a security manager to catch System.exit
+        self.options = [*options, "-Djava.security.manager=allow"]
+        self.started = 0
+        self.failed = 0
+
+    """
+    Start a runner in the background in a container
+    """
+    async def start(self, container: str):
+        try:
+            returncode, _, stderr = await run_process(
+                [
+                    "docker",
+                    "exec",
+                    "-d",
+                    "--user",
+                    SANDBOX_USER,
+                    "-e",
+                    "HOME=/tmp",
+                    container,
+                    "sh",
+                    "-c",
+                    START_SCRIPT,
+                    "sh",
+                    RUNNER_STATE_DIR,
+                    self.source,
+                    *self.options,
+                ],
+                timeout=DOCKER_COMMAND_TIMEOUT,
+            )
+        except Exception as err:
+            returncode, stderr = -1, repr(err)
+        if returncode:
+            self.failed += 1
+            logger.warning("Could not start a Java runner in %s: %s", container, stderr.strip())
+            return
+        self.started += 1
+
+    """
+    Shell code handing the run in the current directory to the container's
+    runner, with its output passed through; `fallback` runs instead when
+    there is no runner ready
+    """
+    @staticmethod
+    def client_script(fallback: str, cpu_limit: int) -> str:
+        return f"""if [ -e {RUNNER_STATE_DIR}/ready ] && mkfifo .stdin .stdout .stderr 2>/dev/null; then
+    if timeout {REQUEST_TIMEOUT} sh -c 'echo "$1" > "$2"' sh "$PWD {cpu_limit}" {RUNNER_STATE_DIR}/request; then
+        cat <&0 > .stdin &
+        __input=$!
+        cat .stderr >&2 &
+        __errors=$!
+        cat .stdout
+        wait $__errors
+        kill $__input 2>/dev/null
+        __status=$(cat .status 2>/dev/null || echo 137)
+        rm -f .stdin .stdout .stderr .status
+        exit "$__status"
+    fi
+    rm -f .stdin .stdout .stderr
+fi
+{fallback}"""
+
+    def stats(self) -> dict:
+        return {"started": self.started, "failed": self.failed}
+
+
+java_runner = (
+    JavaRunner(shlex.split(JAVA_OPTIONS))
+    if JAVA_FAST_PATH_ENABLED and JAVA_WARM_JVM_ENABLED and CONTAINER_POOL_ENABLED
+    else None
+)
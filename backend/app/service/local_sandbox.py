@@ -0,0 +1,301 @@
+import asyncio
+import logging
+import math
+import os
+import shlex
+import shutil
+import uuid
+from contextlib import asynccontextmanager
+
+from ..constants import (
+    COMPILE_CACHE_DIR,
+    EXECUTOR_BACKENDS,
+    LANG_CONFIG_MAP,
+    LOCAL_SANDBOX_CGROUP,
+    LOCAL_SANDBOX_DIR,
+    LOCAL_SANDBOX_HIDDEN_PATHS,
+    LOCAL_SANDBOX_MAX_FILE_BYTES,
+    LOCAL_SANDBOX_MAX_PROCESSES,
+    LOCAL_SANDBOX_PATH,
+    LOCAL_SANDBOX_REQUIRE_NAMESPACES,
+    OUTPUT_SPILL_DIR,
+    SANDBOX_TMPFS_SIZE,
+    SANDBOX_USER,
+)
+from .execution_engine import run_process
+from .workspace import _process_alive
+
+logger = logging.getLogger(__name__)
+
+PROBE_TIMEOUT = 10
+MAX_OPEN_FILES = 256
+CGROUP_CONTROLLERS = "+cpu +memory +pids"
+CGROUP_REMOVE_ATTEMPTS = 20
+CGROUP_REMOVE_DELAY = 0.05
+# exit code of the isolation script when the namespaces could not be set up
+ISOLATION_FAILED = 125
+
+
+"""
+Shell script run inside the new namespaces before the sandboxed command.
+It makes the root file system read-only except for the run's work directory
+(the current directory, bind-mounted onto itself) and mounts empty tmpfs
+over the hidden paths, such as home directories, the server's own files and
+the scratch directories of other runs. The work directory is then mounted
+again at its own path inside those, through the shell's current directory,
+so that programs resolving their files to absolute paths still find them.
+"""
+def get_isolation_script(hidden_paths: list[str]) -> str:
+    paths = " ".join(shlex.quote(path) for path in hidden_paths)
+    return f"""workdir=$(pwd)
+mount --bind "$workdir" "$workdir" && cd "$workdir" && mount -o remount,bind,ro / || exit {ISOLATION_FAILED}
+for path in {paths}; do
+    [ ! -d "$path" ] || mount -t tmpfs -o size={SANDBOX_TMPFS_SIZE},mode=1777 tmpfs "$path" || exit {ISOLATION_FAILED}
+done
+mkdir -p "$workdir" && mount --no-canonicalize --bind "/proc/$$/cwd" "$workdir" && cd "$workdir" || exit {ISOLATION_FAILED}
+exec "$@"
+"""
+
+
+"""
+The private scratch directory (and cgroup, if there is one) of a single run
+"""
+class LocalSandboxSession:
+    __slots__ = ("name", "language", "directory", "cgroup")
+
+    def __init__(self, name: str, language: str, directory: str, cgroup: str | None):
+        self.name = name
+        self.language = language
+        self.directory = directory
+        self.cgroup = cgroup
+
+
+"""
+Runs sandbox commands as local child processes instead of containers.
+Every run gets a private scratch directory and, with namespaces available,
+is started through `unshare` in new user, mount, PID, network, IPC and UTS
+namespaces: it has no network, sees only its own processes and cannot write
+outside its scratch directory. When the server runs as root the run first
+drops to SANDBOX_USER. CPU time, file size and open files are limited with
+rlimits; memory, CPU share and the number of processes are limited by a
+cgroup per run when a delegated cgroup v2 directory is configured.
+If the namespaces cannot be created the backend is unavailable, and the
+languages using it run in Docker, unless `require_namespaces` is off.
+"""
+class LocalSandbox:
+    def __init__(
+        self,
+        root: str,
+        cgroup: str,
+        require_namespaces: bool,
+        hidden_paths: list[str],
+        path: str,
+        max_processes: int,
+        max_file_bytes: int,
+    ):
+        # a directory per server process, so that leftovers of crashed ones can be told apart
+        self.root = root
+        self.directory = os.path.join(root, str(os.getpid()))
+        self.cgroup = cgroup
+        self.require_namespaces = require_namespaces
+        self.hidden_paths = [
+            path
+            for path in (*hidden_paths, root, COMPILE_CACHE_DIR, OUTPUT_SPILL_DIR, os.getcwd())
+            if path.rstrip("/")
+        ]
+        self.path = path
+        self.max_processes = max_processes
+        self.max_file_bytes = max_file_bytes
+        self.owner = tuple(int(id) for id in SANDBOX_USER.split(":")) if os.geteuid() == 0 else None
+        self.available = False
+        self.isolated = False
+        self.started = 0
+        self.active = 0
+        self.reaped_dirs = 0
+        self._isolation_script = get_isolation_script(self.hidden_paths)
+
+    """
+    Prepare the scratch directories and the cgroup, and check which isolation
+    the host supports
+    """
+    async def start(self):
+        await asyncio.to_thread(self._prepare)
+        self.isolated = await self._probe()
+        self.available = self.isolated or not self.require_namespaces
+        if not self.available:
+            logger.warning("Namespaces are not available, languages using the process backend run in Docker")
+        elif not self.isolated:
+            logger.warning("Namespaces are not available, the process backend runs without isolation")
+
+    async def stop(self):
+        await asyncio.to_thread(shutil.rmtree, self.directory, True)
+
+    def _prepare(self):
+        os.makedirs(self.root, mode=0o711, exist_ok=True)
+        for name in os.listdir(self.root):
+            if name.isdigit() and (int(name) == os.getpid() or not _process_alive(int(name))):
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+                self.reaped_dirs += 1
+        os.mkdir(self.directory, 0o711)
+
+        if self.cgroup:
+            try:
+                with open(os.path.join(self.cgroup, "cgroup.subtree_control"), "w") as f:
+                    f.write(CGROUP_CONTROLLERS)
+            except OSError as err:
+                logger.warning("Cannot use cgroup %s for local sandboxes: %r", self.cgroup, err)
+                self.cgroup = ""
+
+    async def _probe(self) -> bool:
+        async with self.session(f"probe-{uuid.uuid4().hex}", None) as session:
+            args, options = self._wrap(session, ["true"], PROBE_TIMEOUT, isolated=True)
+            try:
+                returncode, _, stderr = await run_process(args, timeout=PROBE_TIMEOUT, **options)
+            except Exception as err:
+                logger.debug("Namespace probe failed: %r", err)
+                return False
+        if returncode:
+            logger.debug("Namespace probe failed: %s", stderr.strip())
+        return not returncode
+
+    def _create(self, name: str, language: str | None) -> LocalSandboxSession:
+        directory = os.path.join(self.directory, name)
+        os.mkdir(directory, 0o700)
+        if self.owner is not None:
+            os.chown(directory, *self.owner)
+
+        session = LocalSandboxSession(name, language, directory, None)
+        if self.cgroup and language is not None:
+            config = LANG_CONFIG_MAP[language]
+            session.cgroup = os.path.join(self.cgroup, f"simcode-{os.getpid()}-{name}")
+            try:
+                os.mkdir(session.cgroup)
+                for file, value in (
+                    ("memory.max", str(config["memory"] * 1024 * 1024)),
+                    ("memory.swap.max", "0"),
+                    ("cpu.max", f"{math.ceil(config['cpus'] * 100000)} 100000"),
+                    ("pids.max", str(self.max_processes)),
+                ):
+                    with open(os.path.join(session.cgroup, file), "w") as f:
+                        f.write(value)
+            except OSError:
+                self._remove(session)
+                raise
+        return session
+
+    def _remove(self, session: LocalSandboxSession):
+        shutil.rmtree(session.directory, ignore_errors=True)
+        if session.cgroup and os.path.isdir(session.cgroup):
+            try:
+                os.rmdir(session.cgroup)
+            except OSError:
+                pass
+
+    async def _remove_cgroup(self, cgroup: str):
+        try:
+            with open(os.path.join(cgroup, "cgroup.kill"), "w") as f:
+                f.write("1")
+        except OSError:
+            pass
+        # the group can only be removed once its processes have exited
+        for _ in range(CGROUP_REMOVE_ATTEMPTS):
+            try:
+                os.rmdir(cgroup)
+                return
+            except FileNotFoundError:
+                return
+            except OSError:
+                await asyncio.sleep(CGROUP_REMOVE_DELAY)
+        logger.warning("Could not remove cgroup %s", cgroup)
+
+    """
+    The scratch directory and cgroup of a run, removed together with
+    anything the run left behind when the session ends
+    """
+    @asynccontextmanager
+    async def session(self, name: str, language: str | None):
+        session = await asyncio.to_thread(self._create, name, language)
+        self.started += 1
+        self.active += 1
+        try:
+            yield session
+        finally:
+            self.active -= 1
+            if session.cgroup:
+                await asyncio.shield(self._remove_cgroup(session.cgroup))
+            await asyncio.to_thread(self._remove, session)
+
+    """
+    Arguments and run_process options running `argv` in the session's work
+    directory `cwd` under the isolation and limits of the sandbox, with a
+    clean environment
+    """
+    def command(self, session: LocalSandboxSession, argv: list[str], cwd: str, timeout: float) -> tuple[list[str], dict]:
+        args, options = self._wrap(session, argv, timeout, self.isolated)
+        # outside of namespaces the host's /tmp is shared, keep the run's files in its own directory
+        home = "/tmp" if self.isolated else cwd
+        env = {"PATH": self.path, "HOME": home, "TMPDIR": home, "LANG": "C.UTF-8"}
+        return args, {**options, "cwd": cwd, "env": env}
+
+    def _wrap(self, session: LocalSandboxSession, argv: list[str], timeout: float, isolated: bool) -> tuple[list[str], dict]:
+        args = []
+        if session.cgroup:
+            # join the run's cgroup before anything else starts, the children inherit it
+            args += ["sh", "-c", 'echo $$ > "$0/cgroup.procs" && exec "$@"', session.cgroup]
+        if self.owner is not None:
+            uid, gid = self.owner
+            args += ["setpriv", f"--reuid={uid}", f"--regid={gid}", "--clear-groups", "--inh-caps=-all", "--bounding-set=-all", "--"]
+        if isolated:
+            args += [
+                "unshare",
+                "--user",
+                "--map-root-user",
+                "--net",
+                "--pid",
+                "--fork",
+                "--mount-proc",
+                "--ipc",
+                "--uts",
+                "--kill-child",
+                "sh",
+                "-c",
+                self._isolation_script,
+                "sandbox",
+            ]
+
+        limits = [
+            f"--cpu={math.ceil(timeout)}",
+            f"--fsize={self.max_file_bytes}",
+            f"--nofile={MAX_OPEN_FILES}",
+            "--core=0",
+        ]
+        if self.owner is not None and not session.cgroup:
+            # counts the processes of all runs, since they share the user
+            limits.append(f"--nproc={self.max_processes}")
+        args += ["prlimit", *limits, *argv]
+        return args, {"cwd": session.directory, "new_session": True}
+
+    def stats(self) -> dict:
+        return {
+            "available": self.available,
+            "isolated": self.isolated,
+            "cgroups": bool(self.cgroup),
+            "started": self.started,
+            "active": self.active,
+            "reaped_dirs": self.reaped_dirs,
+        }
+
+
+local_sandbox = (
+    LocalSandbox(
+        LOCAL_SANDBOX_DIR,
+        LOCAL_SANDBOX_CGROUP,
+        LOCAL_SANDBOX_REQUIRE_NAMESPACES,
+        LOCAL_SANDBOX_HIDDEN_PATHS,
+        LOCAL_SANDBOX_PATH,
+        LOCAL_SANDBOX_MAX_PROCESSES,
+        LOCAL_SANDBOX_MAX_FILE_BYTES,
+    )
+    if "process" in EXECUTOR_BACKENDS.values()
+    else None
+)
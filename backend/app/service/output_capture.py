@@ -0,0 +1,170 @@
+import codecs
+import os
+import re
+import time
+import uuid
+from collections import deque
+
+from ..constants import OUTPUT_SPILL_DIR, OUTPUT_SPILL_ENABLED, OUTPUT_SPILL_MAX_BYTES, OUTPUT_SPILL_TTL
+
+OUTPUT_STREAMS = ("stdout", "stderr")
+OUTPUT_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+"""
+Full output of truncated executions, spilled to files under `root` so that
+it can be fetched later by output id. Every stream is written up to
+`max_bytes`, and files older than `ttl` seconds are removed whenever a new
+spill starts.
+"""
+class OutputStore:
+    def __init__(self, root: str, max_bytes: int, ttl: float):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.spilled = 0
+        self.expired = 0
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def new_id() -> str:
+        return uuid.uuid4().hex
+
+    def _path(self, output_id: str, stream: str) -> str:
+        return os.path.join(self.root, f"{output_id}.{stream}")
+
+    def open(self, output_id: str, stream: str):
+        self._expire()
+        self.spilled += 1
+        return open(self._path(output_id, stream), "wb")
+
+    """
+    Path of a spilled stream, or None if there is none (or it has expired)
+    """
+    def lookup(self, output_id: str, stream: str) -> str | None:
+        if not OUTPUT_ID_PATTERN.match(output_id) or stream not in OUTPUT_STREAMS:
+            return None
+        path = self._path(output_id, stream)
+        try:
+            if os.path.getmtime(path) < time.time() - self.ttl:
+                return None
+        except OSError:
+            return None
+        return path
+
+    def _expire(self):
+        deadline = time.time() - self.ttl
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                try:
+                    if entry.stat().st_mtime < deadline:
+                        os.unlink(entry.path)
+                        self.expired += 1
+                except OSError:
+                    pass
+
+    def stats(self) -> dict:
+        return {"spilled": self.spilled, "expired": self.expired}
+
+
+output_store = OutputStore(OUTPUT_SPILL_DIR, OUTPUT_SPILL_MAX_BYTES, OUTPUT_SPILL_TTL) if OUTPUT_SPILL_ENABLED else None
+
+
+"""
+Bounded capture of one output stream of an execution.
+At most `limit` bytes are kept: the first half of the output and a ring
+buffer of the most recent bytes. Whatever falls in between is only counted.
+With `on_chunk` set the head is also passed on as it arrives, and the tail
+follows on `close`. As soon as the output outgrows the limit, everything is
+also written to the output store (if one is given) under `output_id`, so
+that the full output can be fetched later.
+"""
+class OutputCapture:
+    def __init__(self, stream: str, limit: int, on_chunk=None, store: OutputStore | None = None, output_id: str | None = None):
+        self.stream = stream
+        self.head_limit = limit // 2
+        self.tail_limit = limit - self.head_limit
+        self.on_chunk = on_chunk
+        self.store = store
+        self.output_id = output_id
+        self.total = 0
+        self.head = bytearray()
+        self.tail: deque[bytes] = deque()
+        self.tail_size = 0
+        self.spilled = False
+        self._spill = None
+        self._spill_size = 0
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    @property
+    def truncated(self) -> bool:
+        return self.total > len(self.head) + self.tail_size
+
+    @property
+    def omitted(self) -> int:
+        return self.total - len(self.head) - self.tail_size
+
+    async def write(self, chunk: str):
+        data = chunk.encode()
+        if self._spill is None and self.store is not None and self.total + len(data) > self.head_limit + self.tail_limit:
+            self._start_spill()
+        if self._spill is not None:
+            self._write_spill(data)
+        self.total += len(data)
+
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            head, data = data[:room], data[room:]
+            self.head += head
+            if self.on_chunk is not None and (text := self._decoder.decode(head)):
+                await self.on_chunk(text)
+
+        if data:
+            self.tail.append(data)
+            self.tail_size += len(data)
+            self._trim_tail()
+
+    def _trim_tail(self):
+        while self.tail_size - len(self.tail[0]) >= self.tail_limit:
+            self.tail_size -= len(self.tail.popleft())
+        excess = self.tail_size - self.tail_limit
+        if excess > 0:
+            self.tail[0] = self.tail[0][excess:]
+            self.tail_size -= excess
+
+    def _start_spill(self):
+        # nothing has been dropped yet, head and tail hold all output so far
+        self._spill = self.store.open(self.output_id, self.stream)
+        self.spilled = True
+        self._write_spill(bytes(self.head))
+        self._write_spill(b"".join(self.tail))
+
+    def _write_spill(self, data: bytes):
+        room = self.store.max_bytes - self._spill_size
+        if room > 0:
+            self._spill.write(data[:room])
+            self._spill_size += min(len(data), room)
+
+    def _omitted_notice(self) -> str:
+        return f"\n[... {self.omitted} bytes of output omitted ...]\n" if self.truncated else ""
+
+    """
+    Pass the tail on (when forwarding) and close the spill file
+    """
+    async def close(self):
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+        if self.on_chunk is not None:
+            tail = b"".join(self.tail)
+            # after a gap the tail does not continue the head's last character
+            tail = tail.decode(errors="replace") if self.truncated else self._decoder.decode(tail, final=True)
+            if tail or self.truncated:
+                await self.on_chunk(self._omitted_notice() + tail)
+
+    """
+    The captured output, with a notice in place of the omitted part
+    """
+    def text(self) -> str:
+        head = self.head.decode(errors="replace")
+        return head + self._omitted_notice() + b"".join(self.tail).decode(errors="replace")
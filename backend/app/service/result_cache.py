@@ -0,0 +1,102 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+
+from ..constants import (
+    LANG_CONFIG_MAP,
+    RESULT_CACHE_ENABLED,
+    RESULT_CACHE_MAX_ENTRIES,
+    RESULT_CACHE_TTL,
+)
+from ..models.code import Code
+
+
+"""
+Memoized execution results for deterministic submissions.
+Results are kept for `ttl` seconds in an LRU of at most `max_entries`.
+Concurrent requests for the same key are coalesced onto a single in-flight
+execution (single-flight), which runs as its own task so that one requester
+going away does not abort the run for everybody else waiting on it. Once
+the last requester has gone away the execution is cancelled, which frees
+its sandbox and execution slot.
+"""
+class ResultCache:
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Task] = {}
+        # key -> number of requesters waiting on the in-flight execution
+        self._waiters: dict[str, int] = {}
+
+    @staticmethod
+    def make_key(code: Code) -> str:
+        payload = code.model_dump_json(include={"language", "prerequisites", "code"})
+        image = LANG_CONFIG_MAP[code.language]["image"]
+        return hashlib.sha256(f"{image}\0{payload}".encode()).hexdigest()
+
+    def _get(self, key: str) -> dict | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, result = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return result
+
+    def _put(self, key: str, result: dict):
+        self._entries[key] = (time.monotonic() + self.ttl, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        self._waiters.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self._put(key, task.result())
+
+    async def get_or_run(self, key: str, run) -> dict:
+        result = self._get(key)
+        if result is not None:
+            self.hits += 1
+            return result
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(run())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.coalesced += 1
+
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._inflight.get(key) is task:
+                self._waiters[key] -= 1
+                if not self._waiters[key]:
+                    task.cancel()
+            raise
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "entries": len(self._entries),
+            "in_flight": len(self._inflight),
+        }
+
+
+result_cache = ResultCache(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL) if RESULT_CACHE_ENABLED else None
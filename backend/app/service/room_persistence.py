@@ -0,0 +1,278 @@
+import asyncio
+import logging
+import time
+
+from app.repositories import room_repo
+
+from ..backends import state_backend
+from ..constants import (
+    ROOM_FLUSH_INTERVAL,
+    ROOM_FLUSH_MAX_BYTES,
+    ROOM_PERSISTENCE_ENABLED,
+    ROOM_SNAPSHOT_INTERVAL,
+    ROOM_SNAPSHOT_MAX_LOG_BYTES,
+)
+from ..metrics import metrics
+from .document_service import INSERT, apply_ops
+
+logger = logging.getLogger(__name__)
+
+ROOM_SNAPSHOTS = metrics.counter("simcode_room_snapshots_total", "Room snapshots written to the database")
+ROOM_EDIT_FLUSHES = metrics.counter("simcode_room_edit_flushes_total", "Batches of room edits appended to the edit log")
+ROOM_RESTORES = metrics.counter("simcode_room_restores_total", "Room documents loaded from the database on join")
+ROOM_PERSISTENCE_ERRORS = metrics.counter("simcode_room_persistence_errors_total", "Failed room loads and flushes; flushes are retried")
+
+# rough per-entry overhead of an op in the JSON edit log
+OP_OVERHEAD = 16
+
+
+def _ops_size(ops: list[tuple]) -> int:
+    return sum(OP_OVERHEAD + (len(value) if kind == INSERT else 0) for kind, _, value in ops)
+
+
+"""
+Unflushed changes of one room
+"""
+class RoomJournal:
+    __slots__ = ("edits", "pending_bytes", "log_bytes", "needs_snapshot", "snapshot_at", "lock")
+
+    def __init__(self):
+        # (version, ops) applied since the last flush
+        self.edits: list[tuple[int, list[tuple]]] = []
+        self.pending_bytes = 0
+        # size of the edit log written since the last snapshot
+        self.log_bytes = 0
+        # settings changed or the whole text was replaced, the log cannot express it compactly
+        self.needs_snapshot = False
+        self.snapshot_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self.edits) or self.needs_snapshot
+
+
+"""
+Write-behind persistence of room documents and settings.
+Changes are only recorded in memory while the room is being edited. Every
+`flush_interval` seconds, or as soon as a room has `flush_bytes` of pending
+edits, the edits are appended to the room's edit log in one row. A snapshot
+of the whole room replaces the log once it has grown past
+`snapshot_log_bytes` or the last snapshot is `snapshot_interval` seconds old,
+when the settings change or the text is replaced wholesale, and when the last
+member leaves. A room is restored from its snapshot plus the edits after it.
+The database sessions come from the session factory passed to `start`.
+"""
+class RoomPersistence:
+    def __init__(self, backend, flush_interval: float, flush_bytes: int, snapshot_interval: float, snapshot_log_bytes: int):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_log_bytes = snapshot_log_bytes
+        self.journals: dict[str, RoomJournal] = {}
+        self.snapshots = 0
+        self.edit_flushes = 0
+        self.restored = 0
+        self.errors = 0
+        self.session_factory = None
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def start(self, session_factory):
+        self.session_factory = session_factory
+        self._task = asyncio.create_task(self._run())
+
+    """
+    Stop flushing periodically and write everything that is still pending
+    """
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush_all(snapshot=True)
+
+    def _journal(self, room: str) -> RoomJournal:
+        journal = self.journals.get(room)
+        if journal is None:
+            journal = self.journals[room] = RoomJournal()
+        return journal
+
+    """
+    Record ops applied to the room's document as `version`
+    """
+    def record_edits(self, room: str, version: int, ops: list[tuple]):
+        journal = self._journal(room)
+        journal.edits.append((version, ops))
+        journal.pending_bytes += _ops_size(ops)
+        if journal.pending_bytes >= self.flush_bytes:
+            self._wakeup.set()
+
+    """
+    Record a change that is persisted with the next snapshot: new settings or
+    a replacement of the whole text, which supersedes the pending edits
+    """
+    def record_snapshot_change(self, room: str, replaced: bool = False):
+        journal = self._journal(room)
+        if replaced:
+            journal.edits.clear()
+            journal.pending_bytes = 0
+        journal.needs_snapshot = True
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush_all()
+
+    async def flush_all(self, snapshot: bool = False):
+        for room in list(self.journals):
+            await self.flush(room, snapshot=snapshot)
+
+    """
+    Write the room's pending changes, as a snapshot if one is due (or
+    `snapshot` is set) and otherwise as a batch of the edit log. Changes that
+    could not be written are kept for the next flush.
+    """
+    async def flush(self, room: str, snapshot: bool = False):
+        journal = self.journals.get(room)
+        if journal is None:
+            return
+
+        async with journal.lock:
+            if not journal.dirty and not (snapshot and journal.log_bytes):
+                return
+
+            edits, pending_bytes = journal.edits, journal.pending_bytes
+            journal.edits, journal.pending_bytes = [], 0
+            snapshot = (
+                snapshot
+                or journal.needs_snapshot
+                or journal.log_bytes + pending_bytes >= self.snapshot_log_bytes
+                or time.monotonic() - journal.snapshot_at >= self.snapshot_interval
+            )
+            try:
+                if snapshot:
+                    await self._write_snapshot(room, journal)
+                else:
+                    async with self.session_factory() as db:
+                        await room_repo.append_edits(db, room, edits)
+                    journal.log_bytes += pending_bytes
+                    self.edit_flushes += 1
+                    ROOM_EDIT_FLUSHES.inc()
+            except Exception:
+                logger.exception("Could not persist room %s", room)
+                self.errors += 1
+                ROOM_PERSISTENCE_ERRORS.inc()
+                journal.edits[:0] = edits
+                journal.pending_bytes += pending_bytes
+
+    async def _write_snapshot(self, room: str, journal: RoomJournal):
+        document = await self.backend.get_document(room)
+        settings = await self.backend.get_settings(room)
+        if document is None and not settings:
+            # the room was released by another worker, which wrote the final snapshot
+            journal.needs_snapshot = False
+            return
+
+        # the live document already includes every recorded edit
+        text, version = document or ("", 0)
+        async with self.session_factory() as db:
+            await room_repo.save_snapshot(
+                db, room, text, settings.get("lang"), settings.get("prerequisites"), version
+            )
+        journal.needs_snapshot = False
+        journal.log_bytes = 0
+        journal.snapshot_at = time.monotonic()
+        self.snapshots += 1
+        ROOM_SNAPSHOTS.inc()
+
+    """
+    Persist the final state of a room whose last member left and forget it.
+    The room's document must still be in the state backend.
+    """
+    async def close(self, room: str):
+        await self.flush(room, snapshot=True)
+        journal = self.journals.get(room)
+        if journal is not None and not journal.dirty:
+            del self.journals[room]
+
+    """
+    Load a room from its snapshot and the edits logged after it.
+    Returns (text, version, settings), or None for a room that was never saved
+    or could not be loaded; the room then starts out empty.
+    """
+    async def load(self, room: str) -> tuple[str, int, dict] | None:
+        try:
+            async with self.session_factory() as db:
+                snapshot = await room_repo.get_snapshot(db, room)
+                edits = await room_repo.get_edits(db, room, snapshot.version if snapshot else 0)
+        except Exception:
+            logger.exception("Could not load room %s", room)
+            self.errors += 1
+            ROOM_PERSISTENCE_ERRORS.inc()
+            return None
+        if snapshot is None and not edits:
+            return None
+
+        text, version = (snapshot.code, snapshot.version) if snapshot else ("", 0)
+        log_bytes = 0
+        for edit_version, ops in edits:
+            if edit_version != version + 1:
+                # a gap, e.g. a worker that crashed before flushing; the rest cannot be applied
+                logger.warning("Edit log of room %s has a gap after version %d", room, version)
+                break
+            ops = [tuple(op) for op in ops]
+            try:
+                text = apply_ops(text, ops)
+            except ValueError:
+                # a corrupt entry; keep what was replayed before it
+                logger.exception("Could not replay version %d of room %s", edit_version, room)
+                self.errors += 1
+                ROOM_PERSISTENCE_ERRORS.inc()
+                break
+            version = edit_version
+            log_bytes += _ops_size(ops)
+        if snapshot is None and version == 0:
+            # not even the first edit could be replayed
+            return None
+
+        settings = {}
+        if snapshot and snapshot.lang is not None:
+            settings["lang"] = snapshot.lang
+        if snapshot and snapshot.prerequisites is not None:
+            settings["prerequisites"] = snapshot.prerequisites
+
+        # let the next snapshot compact the replayed log
+        self._journal(room).log_bytes += log_bytes
+        self.restored += 1
+        ROOM_RESTORES.inc()
+        return text, version, settings
+
+    def stats(self) -> dict:
+        return {
+            "rooms": len(self.journals),
+            "unflushed_rooms": sum(1 for journal in self.journals.values() if journal.dirty),
+            "pending_edits": sum(len(journal.edits) for journal in self.journals.values()),
+            "snapshots": self.snapshots,
+            "edit_flushes": self.edit_flushes,
+            "restored": self.restored,
+            "errors": self.errors,
+        }
+
+
+room_persistence = (
+    RoomPersistence(
+        state_backend,
+        ROOM_FLUSH_INTERVAL,
+        ROOM_FLUSH_MAX_BYTES,
+        ROOM_SNAPSHOT_INTERVAL,
+        ROOM_SNAPSHOT_MAX_LOG_BYTES,
+    )
+    if ROOM_PERSISTENCE_ENABLED
+    else None
+)
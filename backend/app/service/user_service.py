@@ -1,20 +1,20 @@
 from app.auth.jwt_handler import create_access_token
-from app.auth.security import hash_password, is_valid_password, verify_password
+from app.auth.security import PasswordHasherBusy, hash_password, is_valid_password, verify_password
 from app.repositories import user_repo
 from fastapi import HTTPException, status
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
-def signup_user(db: Session, username: str, email: str, password: str, role: str):
-    existing_user = user_repo.get_user_by_username(db, username)
+async def signup_user(db: AsyncSession, username: str, email: str, password: str, role: str):
+    existing_user = await user_repo.get_user_by_username(db, username)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already exists"
         )
 
-    if not user_repo.is_valid_role(db, role):
+    if not await user_repo.is_valid_role(db, role):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Role '{role}' is not valid"
@@ -28,30 +28,55 @@ def signup_user(db: Session, username: str, email: str, password: str, role: str
         )
 
     try:
-        hashed_pw = hash_password(password)
-        user_repo.create_user(db, username, email, hashed_pw, role)
+        hashed_pw = await hash_password(password)
+        await user_repo.create_user(db, username, email, hashed_pw, role)
         return {"message": "User created successfully"}
 
+    except PasswordHasherBusy:
+        raise_busy()
+
     except IntegrityError:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Integrity error: Possible duplicate email"
         )
 
     except SQLAlchemyError:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Database error occurred. Please try again later."
         )
 
 
-def login_user(db: Session, username: str, password: str):
-    user = user_repo.get_user_by_username(db, username)
+async def login_user(db: AsyncSession, username: str, password: str):
+    user = await user_repo.get_user_by_username(db, username)
     # print("in login")
-    if not user or not verify_password(password, user.hashed_password):
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+
+    try:
+        valid, new_hash = await verify_password(password, user.hashed_password)
+    except PasswordHasherBusy:
+        raise_busy()
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    token = create_access_token(data={"sub": user.username})
+    # the bcrypt cost was changed since the password was stored, upgrade the hash
+    if new_hash:
+        try:
+            await user_repo.update_password_hash(db, user, new_hash)
+        except SQLAlchemyError:
+            await db.rollback()
+
+    token = create_access_token(data={"sub": user.username, "role": user.role_of_user})
     return {"access_token": token, "token_type": "bearer"}
+
+
+def raise_busy():
+    raise HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-ins in progress, please retry shortly",
+        headers={"Retry-After": "1"},
+    )
@@ -0,0 +1,198 @@
+import asyncio
+import io
+import logging
+import os
+import shutil
+import tarfile
+import time
+import uuid
+
+from ..constants import SANDBOX_USER, USER_SCRIPT_FILE_NAME, WORKSPACE_REAP_INTERVAL
+from .execution_engine import OWNER_LABEL, kill_container, run_process
+
+logger = logging.getLogger(__name__)
+
+DOCKER_COMMAND_TIMEOUT = 30
+LEGACY_SANDBOX_ROOT = "/tmp"
+
+
+"""
+The files of a single sandbox run, kept in memory.
+They are delivered into the container as a tar archive on stdin, so nothing
+is written to the host disk; the archive unpacks into a `<name>/` directory
+owned by the unprivileged sandbox user.
+"""
+class Workspace:
+    __slots__ = ("name", "files", "bytes_in", "bytes_out")
+
+    def __init__(self, name: str):
+        self.name = name
+        # relative path -> (content, mode)
+        self.files: dict[str, tuple[bytes, int]] = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def add(self, path: str, data: str | bytes, mode: int = 0o644):
+        self.files[path] = (data.encode() if isinstance(data, str) else data, mode)
+
+    def archive(self) -> bytes:
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w") as tar:
+            tar.addfile(self._member(self.name, tarfile.DIRTYPE, 0o777))
+            for path, (data, mode) in self.files.items():
+                member = self._member(f"{self.name}/{path}", tarfile.REGTYPE, mode)
+                member.size = len(data)
+                tar.addfile(member, io.BytesIO(data))
+
+        archive = buffer.getvalue()
+        self.bytes_in = len(archive)
+        return archive
+
+    """
+    Write the files into a `<name>/` directory under `directory` instead of
+    archiving them, for sandboxes that share the host's file system. The
+    files are handed to `owner` (uid, gid) when one is given.
+    """
+    def write(self, directory: str, owner: tuple[int, int] | None = None):
+        root = os.path.join(directory, self.name)
+        os.mkdir(root, 0o755)
+        paths = [root]
+        for path, (data, mode) in self.files.items():
+            path = os.path.join(root, path)
+            with open(path, "wb") as f:
+                f.write(data)
+            os.chmod(path, mode)
+            paths.append(path)
+            self.bytes_in += len(data)
+        if owner is not None:
+            for path in paths:
+                os.chown(path, *owner)
+
+    @staticmethod
+    def _member(name: str, kind: bytes, mode: int) -> tarfile.TarInfo:
+        uid, gid = SANDBOX_USER.split(":")
+        member = tarfile.TarInfo(name)
+        member.type = kind
+        member.mode = mode
+        member.uid, member.gid = int(uid), int(gid)
+        member.mtime = int(time.time())
+        return member
+
+
+"""
+Keeps track of the workspaces in use and removes what crashed runs leave
+behind: containers labelled with the pid of a server process that is no
+longer alive, and sandbox directories that older versions of the server
+wrote to /tmp. The reaper runs at start-up and then periodically.
+"""
+class WorkspaceManager:
+    def __init__(self, reap_interval: float):
+        self.reap_interval = reap_interval
+        self.created = 0
+        self.active = 0
+        self.cleaned_up = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.reaped_containers = 0
+        self.reaped_dirs = 0
+        self.reaped_bytes = 0
+        self._reaper_task = None
+
+    def create(self, name: str) -> Workspace:
+        self.created += 1
+        self.active += 1
+        return Workspace(name)
+
+    def release(self, workspace: Workspace):
+        self.active -= 1
+        self.cleaned_up += 1
+        self.bytes_in += workspace.bytes_in
+        self.bytes_out += workspace.bytes_out
+
+    async def start(self):
+        await self.reap()
+        await asyncio.to_thread(self._reap_legacy_dirs)
+        self._reaper_task = asyncio.create_task(self._reaper_loop())
+
+    async def stop(self):
+        if self._reaper_task:
+            self._reaper_task.cancel()
+            self._reaper_task = None
+
+    async def _reaper_loop(self):
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            try:
+                await self.reap()
+            except Exception as err:
+                logger.warning("Sandbox reaper failed: %r", err)
+
+    """
+    Remove containers whose owning server process has exited
+    """
+    async def reap(self):
+        # hosts running every language in the process sandbox may not have Docker
+        if shutil.which("docker") is None:
+            return
+        returncode, stdout, _ = await run_process(
+            ["docker", "ps", "-a", "--filter", f"label={OWNER_LABEL}", "--format", "{{.Names}} {{.Labels}}"],
+            timeout=DOCKER_COMMAND_TIMEOUT,
+        )
+        if returncode:
+            return
+
+        for line in stdout.splitlines():
+            name, _, labels = line.partition(" ")
+            owner = dict(label.partition("=")[::2] for label in labels.split(",")).get(OWNER_LABEL, "")
+            if owner.isdigit() and _process_alive(int(owner)):
+                continue
+            await kill_container(name)
+            self.reaped_containers += 1
+
+    def _reap_legacy_dirs(self):
+        for name in os.listdir(LEGACY_SANDBOX_ROOT):
+            path = os.path.join(LEGACY_SANDBOX_ROOT, name)
+            if not _is_uuid(name) or not os.path.isfile(os.path.join(path, USER_SCRIPT_FILE_NAME)):
+                continue
+            size = sum(
+                os.path.getsize(os.path.join(root, file))
+                for root, _, files in os.walk(path)
+                for file in files
+            )
+            shutil.rmtree(path, ignore_errors=True)
+            self.reaped_dirs += 1
+            self.reaped_bytes += size
+
+    def stats(self) -> dict:
+        return {
+            "created": self.created,
+            "active": self.active,
+            "cleaned_up": self.cleaned_up,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "avg_bytes_in": self.bytes_in // self.cleaned_up if self.cleaned_up else 0,
+            "reaped_containers": self.reaped_containers,
+            "reaped_dirs": self.reaped_dirs,
+            "reaped_bytes": self.reaped_bytes,
+        }
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _is_uuid(name: str) -> bool:
+    try:
+        uuid.UUID(name)
+    except ValueError:
+        return False
+    return True
+
+
+workspace_manager = WorkspaceManager(WORKSPACE_REAP_INTERVAL)
@@ -0,0 +1,101 @@
+import asyncio
+
+
+"""
+Per-room outbound scheduler for editor events.
+Events published for a room within `window` seconds are flushed together
+and a room is flushed at most `max_rate` times per second. Full-state events
+(code, prerequisites, language) are latest-wins: a newer event of the same
+kind supersedes the pending one. Deltas are batched into a single emit.
+Pending events keep their publication order, so a full-state event is never
+overtaken by a delta that was published before or after it.
+"""
+class RoomBroadcaster:
+    def __init__(self, sio, window: float, max_rate: float):
+        self.sio = sio
+        self.window = window
+        self.min_interval = 1 / max_rate if max_rate > 0 else 0
+        self.published = 0
+        self.emitted = 0
+        self.coalesced = 0
+        self.batched = 0
+        # room -> [[kind, event, payload, skip_sid]] in publication order
+        self._pending: dict[str, list[list]] = {}
+        # room -> timer of the scheduled flush or of the cool-down after one
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+        self._sending: dict[str, asyncio.Task] = {}
+
+    """
+    Publish a full-state event, superseding any pending event of the same kind
+    """
+    def publish_latest(self, room: str, event: str, payload: dict, skip_sid: str | None = None):
+        self.published += 1
+        pending = self._pending.setdefault(room, [])
+        for index, entry in enumerate(pending):
+            if entry[0] == "latest" and entry[1] == event:
+                del pending[index]
+                self.coalesced += 1
+                break
+        pending.append(["latest", event, payload, skip_sid])
+        self._schedule(room)
+
+    """
+    Publish a delta; consecutive deltas are sent to the room as one
+    `<event>_batch` event
+    """
+    def publish_batched(self, room: str, event: str, payload: dict, skip_sid: str | None = None):
+        self.published += 1
+        pending = self._pending.setdefault(room, [])
+        if pending and pending[-1][0] == "batch" and pending[-1][1] == event:
+            pending[-1][2].append(payload)
+            self.batched += 1
+        else:
+            pending.append(["batch", event, [payload], skip_sid])
+        self._schedule(room)
+
+    def _schedule(self, room: str):
+        if room not in self._timers:
+            loop = asyncio.get_running_loop()
+            self._timers[room] = loop.call_later(self.window, self._flush, room)
+
+    def _flush(self, room: str):
+        entries = self._pending.pop(room, None)
+        if not entries:
+            self._timers.pop(room, None)
+            return
+
+        previous = self._sending.get(room)
+        task = asyncio.ensure_future(self._emit(room, entries, previous))
+        self._sending[room] = task
+        task.add_done_callback(lambda done: self._sending.pop(room, None) if self._sending.get(room) is done else None)
+
+        # cool down before the next flush, anything published meanwhile waits for it
+        loop = asyncio.get_running_loop()
+        self._timers[room] = loop.call_later(self.min_interval, self._flush, room)
+
+    async def _emit(self, room: str, entries: list[list], previous: asyncio.Task | None):
+        if previous is not None:
+            await asyncio.wait([previous])
+
+        for kind, event, payload, skip_sid in entries:
+            if kind == "batch" and len(payload) > 1:
+                # members skip the items carrying their own socketId
+                await self.sio.emit(f"{event}_batch", {"batch": payload}, room=room)
+            else:
+                await self.sio.emit(event, payload[0] if kind == "batch" else payload, room=room, skip_sid=skip_sid)
+            self.emitted += 1
+
+    async def stop(self):
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        self._pending.clear()
+
+    def stats(self) -> dict:
+        return {
+            "published": self.published,
+            "emitted": self.emitted,
+            "coalesced": self.coalesced,
+            "batched": self.batched,
+            "pending_rooms": len(self._pending),
+        }
@@ -1,75 +1,231 @@
-from ..constants import ACTION_CODE_CHANGE, ACTION_LANG_CHANGE, ACTION_CODE_EXECUTED, ACTION_PREREQ_CHANGE
+import json
+import logging
+
+from ..constants import (
+    ACTION_CODE_CHANGE,
+    ACTION_CODE_EXECUTED,
+    ACTION_CODE_OP,
+    ACTION_CODE_OP_ACK,
+    ACTION_CODE_SYNC,
+    ACTION_LANG_CHANGE,
+    ACTION_PREREQ_CHANGE,
+    EDITOR_ONLY_LANGUAGES,
+    ENV_IMAGE_BUILD_DELAY,
+    LANG_CONFIG_MAP,
+)
+from ..backends import state_backend
+from ..jobs import job_queue
+from ..service.image_cache import image_cache
+from ..service.document_service import StaleVersionError, parse_ops, serialize_ops
+from ..service.execution_service import get_error_response
+from ..service.room_persistence import room_persistence
+
+from .roles import editors_room, socket_roles
+from .room_runs import RunRejected, room_runs
+from .socket_manager import broadcaster, instrumented, sio, viewer_stream
+
+logger = logging.getLogger(__name__)
+
+"""
+Whether the socket may change the room; viewers' edits are dropped
+"""
+def can_edit(sid, room) -> bool:
+    if socket_roles.can_edit(sid, room):
+        return True
+    logger.debug("Dropped edit of sid=%s in room=%s, which is not an editor there", sid, room)
+    return False
 
-from .socket_manager import sio
 
 """
 Code change event handler
 """
 @sio.event
+@instrumented
 async def code_change(sid, data):
     room = data.get("roomId", "")
     code = data.get("code", "")
-    print(f"CODE CHANGE event from {sid} in room {room}")
+    logger.debug("event=code_change sid=%s room=%s", sid, room)
 
-    # send updated code to all clients
-    if room:
-        await sio.emit(ACTION_CODE_CHANGE, {"code": code}, room=room, skip_sid=sid)
+    # send updated code to all editors, viewers get it with the next snapshot
+    if room and can_edit(sid, room):
+        _, version = await state_backend.replace_document(room, code)
+        if room_persistence:
+            room_persistence.record_snapshot_change(room, replaced=True)
+        broadcaster.publish_latest(
+            editors_room(room), ACTION_CODE_CHANGE, {"code": code, "version": version}, skip_sid=sid
+        )
+        viewer_stream.mark(room)
 
 
 """
-Code sync event handler
+Code delta event handler.
+Clients send insert/delete ops against the document version they last saw.
+The ops are transformed over any concurrent changes, applied to the room's
+canonical document, acknowledged to the sender with the new version and
+broadcast to everybody else as a delta.
 """
 @sio.event
-async def sync_code(sid, data):
-    socket_id = data.get("socketId", "")
-    prereq = data.get("prerequisites", "")
-    code = data.get("code", "")
-    lang = data.get("lang", "")
-    print(f"SYNC CODE event from {sid} to {socket_id}")
+@instrumented
+async def code_op(sid, data):
+    room = data.get("roomId")
+    if not room:
+        return
+    if not can_edit(sid, room):
+        # undo the change the client made locally
+        text, version = await state_backend.get_document(room) or ("", 0)
+        await sio.emit(ACTION_CODE_SYNC, {"code": text, "version": version}, to=sid)
+        return
 
-    # send the latest code to the newly-joined socket
-    if socket_id:
-        await sio.emit(ACTION_PREREQ_CHANGE, {"prereq": prereq}, to=socket_id)
-        await sio.emit(ACTION_CODE_CHANGE, {"code": code}, to=socket_id)
-        await sio.emit(ACTION_LANG_CHANGE, {"lang": lang}, to=socket_id)
+    try:
+        ops, version = await state_backend.apply_ops(room, data.get("version", 0), parse_ops(data.get("ops")))
+    except (StaleVersionError, ValueError, TypeError):
+        # the client cannot be reconciled, resend the full document
+        text, version = await state_backend.get_document(room) or ("", 0)
+        await sio.emit(ACTION_CODE_SYNC, {"code": text, "version": version}, to=sid)
+        return
+
+    if room_persistence:
+        room_persistence.record_edits(room, version, ops)
+    await sio.emit(ACTION_CODE_OP_ACK, {"version": version}, to=sid)
+    broadcaster.publish_batched(
+        editors_room(room),
+        ACTION_CODE_OP,
+        {"ops": serialize_ops(ops), "version": version, "socketId": sid},
+        skip_sid=sid,
+    )
+    viewer_stream.mark(room)
+
+
+"""
+Resync request handler. A client that lost track of the room's document,
+for example because a version it waits for never arrived, is sent the
+whole document.
+"""
+@sio.event
+@instrumented
+async def code_sync(sid, data):
+    room = data.get("roomId")
+    if room and socket_roles.get(sid, room) is not None:
+        text, version = await state_backend.get_document(room) or ("", 0)
+        await sio.emit(ACTION_CODE_SYNC, {"code": text, "version": version}, to=sid)
 
 
 """
-Prerequisite change event handler
+Prerequisite change event handler. Prerequisites that are not a string are
+dropped, and the sender gets the room's current ones back.
 """
 @sio.event
+@instrumented
 async def prereq_change(sid, data):
     room = data.get("roomId")
     prereq = data.get("prerequisites")
-    print(f"PREREQ CHANGE event from {sid} in room {room}")
+    logger.debug("event=prereq_change sid=%s room=%s", sid, room)
+    if not room or not can_edit(sid, room):
+        return
+
+    settings = await state_backend.get_settings(room)
+    if not isinstance(prereq, str):
+        # undo the change the client made locally
+        await sio.emit(ACTION_PREREQ_CHANGE, {"prereq": settings.get("prerequisites", "")}, to=sid)
+        return
 
-    # send updated prereqs to all clients
-    if room:
-        await sio.emit(ACTION_PREREQ_CHANGE, {"prereq": prereq}, room=room, skip_sid=sid)
+    # send updated prereqs to all editors
+    broadcaster.publish_latest(editors_room(room), ACTION_PREREQ_CHANGE, {"prereq": prereq}, skip_sid=sid)
+    await state_backend.update_settings(room, prerequisites=prereq)
+    if room_persistence:
+        room_persistence.record_snapshot_change(room)
+    viewer_stream.mark(room)
+
+    # prepare the environment once the prerequisites stop changing
+    lang = settings.get("lang") or data.get("lang")
+    if image_cache and lang in LANG_CONFIG_MAP:
+        image_cache.schedule_build(lang, prereq, group=room, delay=ENV_IMAGE_BUILD_DELAY)
 
 
 """
-Code editor language change handler
+Code editor language change handler. Languages that are neither run (see
+LANG_CONFIG_MAP) nor editor-only are dropped, and the sender gets the
+room's current language back.
 """
 @sio.event
+@instrumented
 async def lang_change(sid, data):
     room = data.get("roomId")
     lang = data.get("lang")
-    print(f"LANG CHANGE event from {sid} in room {room} for language {lang}")
+    logger.debug("event=lang_change sid=%s room=%s lang=%s", sid, room, lang)
+    if not room or not can_edit(sid, room):
+        return
+
+    if not isinstance(lang, str) or (lang not in LANG_CONFIG_MAP and lang not in EDITOR_ONLY_LANGUAGES):
+        # undo the change the client made locally
+        current = (await state_backend.get_settings(room)).get("lang")
+        if current:
+            await sio.emit(ACTION_LANG_CHANGE, {"lang": current}, to=sid)
+        return
 
-    if room and lang:
-        await sio.emit(ACTION_LANG_CHANGE, {"lang": lang}, room=room)
+    broadcaster.publish_latest(editors_room(room), ACTION_LANG_CHANGE, {"lang": lang})
+    await state_backend.update_settings(room, lang=lang)
+    if room_persistence:
+        room_persistence.record_snapshot_change(room)
+    viewer_stream.mark(room)
 
 
 """
-Code execution handler
+Run event handler. Editors and hosts run the room's code as kept on the
+server, so the code is not uploaded again. The output is streamed to every
+member of the room (`execution_started`, `execution_stdout`,
+`execution_stderr`, `execution_exit`). A request made while the same code
+is already running attaches to that run. The acknowledgement carries the
+execution id and whether the request was attached, or an `error`.
 """
 @sio.event
+@instrumented
+async def run(sid, data):
+    room = data.get("roomId")
+    logger.debug("event=run sid=%s room=%s", sid, room)
+    if not room or not can_edit(sid, room):
+        return {"error": {"message": "Only editors can run the room's code"}}
+
+    try:
+        # the run is attributed to the user of the socket's token, not to a name sent along
+        username = (await sio.get_session(sid)).get("username")
+        job, attached = await room_runs.run(room, username, data.get("lang"))
+    except RunRejected as err:
+        return {"error": {"message": str(err)}}
+    except Exception as err:
+        response = get_error_response(err)
+        return {"error": {"status_code": response.status_code, **json.loads(response.body)}}
+    return {"executionId": job["jobId"], "attached": attached}
+
+
+"""
+Code execution handler, relaying the output of an editor's run to the room.
+Superseded by the `run` event, which does not need the output uploaded.
+"""
+@sio.event
+@instrumented
 async def code_executed(sid, data):
     room = data.get("roomId")
     stdout = data.get("stdout")
     stderr = data.get("stderr")
-    print(f"CODE EXECUTED event from {sid} in room {room}")
+    logger.debug("event=code_executed sid=%s room=%s", sid, room)
 
-    if room:
+    if room and can_edit(sid, room):
         await sio.emit(ACTION_CODE_EXECUTED, {"stdout": stdout, "stderr": stderr}, room=room, skip_sid=sid)
+
+
+"""
+Execution cancel handler. Members of a room may cancel the room's
+executions by id (the job id); the acknowledgement tells whether the
+execution was still running.
+"""
+@sio.event
+@instrumented
+async def cancel_execution(sid, data):
+    execution_id = data.get("executionId")
+    logger.debug("event=cancel_execution sid=%s execution=%s", sid, execution_id)
+
+    job = await job_queue.get(execution_id) if execution_id else None
+    if job is None or job["roomId"] not in await state_backend.rooms_of(sid):
+        return {"cancelled": False}
+    return {"cancelled": await job_queue.cancel(execution_id) is not None}
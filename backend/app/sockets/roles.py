@@ -0,0 +1,80 @@
+from ..constants import DEFAULT_ROOM_ROLE, EDITING_ROLES, ROOM_ROLES
+
+EDITORS_SUFFIX = ":editors"
+VIEWERS_SUFFIX = ":viewers"
+
+
+"""
+Socket.IO room of the members of `room` that may edit (editors and hosts).
+Edits are broadcast there, while every member is also in `room` itself for
+membership and execution events.
+"""
+def editors_room(room: str) -> str:
+    return room + EDITORS_SUFFIX
+
+
+"""
+Socket.IO room of the viewers of `room`, served by the viewer stream
+"""
+def viewers_room(room: str) -> str:
+    return room + VIEWERS_SUFFIX
+
+
+def audience_room(room: str, role: str) -> str:
+    return editors_room(room) if role in EDITING_ROLES else viewers_room(room)
+
+
+"""
+The room a Socket.IO room belongs to, and the audience (`editors`,
+`viewers` or None for all members) it is for
+"""
+def split_room(name: str) -> tuple[str, str | None]:
+    for suffix, audience in ((EDITORS_SUFFIX, "editors"), (VIEWERS_SUFFIX, "viewers")):
+        if name.endswith(suffix):
+            return name[: -len(suffix)], audience
+    return name, None
+
+
+"""
+The role a socket joins a room with: the role it asks for, as long as that
+does not exceed the role of its user (DEFAULT_ROOM_ROLE without one)
+"""
+def resolve_role(user_role: str | None, requested: str | None) -> str:
+    allowed = user_role if user_role in ROOM_ROLES else DEFAULT_ROOM_ROLE
+    if requested in ROOM_ROLES and ROOM_ROLES.index(requested) < ROOM_ROLES.index(allowed):
+        return requested
+    return allowed
+
+
+"""
+Roles of the sockets connected to this process in the rooms they joined.
+The events of a socket are always handled by the process it is connected
+to, so checking the rights of its events needs no shared state.
+"""
+class SocketRoles:
+    def __init__(self):
+        self._roles: dict[str, dict[str, str]] = {}
+
+    def set(self, sid: str, room: str, role: str):
+        self._roles.setdefault(sid, {})[room] = role
+
+    def get(self, sid: str, room: str) -> str | None:
+        return self._roles.get(sid, {}).get(room)
+
+    """
+    Forget the socket's role in a room and return it
+    """
+    def discard(self, sid: str, room: str) -> str | None:
+        rooms = self._roles.get(sid)
+        if rooms is None:
+            return None
+        role = rooms.pop(room, None)
+        if not rooms:
+            del self._roles[sid]
+        return role
+
+    def can_edit(self, sid: str, room: str) -> bool:
+        return self.get(sid, room) in EDITING_ROLES
+
+
+socket_roles = SocketRoles()
@@ -1,60 +1,158 @@
-from ..constants import ACTION_DISCONNECTED, ACTION_JOINED
+import logging
+from urllib.parse import parse_qs
 
-from .socket_manager import connected_room_socket_mapping, sio
+from ..auth.jwt_handler import decode_access_token
+from ..backends import state_backend
+from ..constants import ACTION_DISCONNECTED, ACTION_JOINED, ACTION_ROOM_STATE, EDITING_ROLES, SOCKET_AUTH_REQUIRED
+from ..jobs import job_queue
+from ..jobs.base import CANCEL_ROOM_EMPTY
+from ..service.room_persistence import room_persistence
+
+from .roles import audience_room, editors_room, resolve_role, socket_roles
+from .socket_manager import instrumented, sio
+from .viewer_stream import room_state_payload
+
+logger = logging.getLogger(__name__)
 
 """
-New client join event handler
+Connection handler. A client presenting an access token (as `token` in the
+Socket.IO auth payload or the query string) is authenticated with it and its
+username and role are kept in the socket session; clients without a token are only
+accepted when SOCKET_AUTH_REQUIRED is off.
 """
 @sio.event
-async def join(sid, data):
-    global connected_room_socket_mapping
+@instrumented
+async def connect(sid, environ, auth=None):
+    token = auth.get("token") if isinstance(auth, dict) else None
+    if token is None:
+        token = parse_qs(environ.get("QUERY_STRING", "")).get("token", [None])[0]
+
+    if token is None:
+        if SOCKET_AUTH_REQUIRED:
+            raise ConnectionRefusedError("Authentication required")
+        return
+
+    claims = decode_access_token(token)
+    if claims is None:
+        raise ConnectionRefusedError("Invalid or expired token")
+    await sio.save_session(sid, {"username": claims.get("sub"), "role": claims.get("role")})
+
+
+"""
+The room's code, version and settings, as payload of a room state event.
+A room that is not active on the server is first restored from the database.
+Returns None for a room without any state.
+"""
+async def get_room_state(room: str) -> dict | None:
+    document = await state_backend.get_document(room)
+    if document is None and room_persistence:
+        restored = await room_persistence.load(room)
+        if restored:
+            text, version, saved_settings = restored
+            if await state_backend.restore_document(room, text, version):
+                # settings changed while the room was loading take precedence
+                settings = await state_backend.get_settings(room)
+                saved_settings = {key: value for key, value in saved_settings.items() if key not in settings}
+                if saved_settings:
+                    await state_backend.update_settings(room, **saved_settings)
+            document = await state_backend.get_document(room)
 
+    settings = await state_backend.get_settings(room)
+    if document is None and not settings:
+        return None
+    text, version = document or ("", 0)
+    return room_state_payload(text, version, settings)
+
+
+"""
+New client join event handler.
+The socket joins as the user of its token, or with the `username` it sends
+when it has none, and with the role it asks for (`role`), limited to the
+role of its user. Editors and hosts join the room's editor audience and receive
+every edit; viewers join its viewer audience, which only gets throttled
+snapshots of the room. Joins and leaves of viewers are only announced to the
+editors, so that a large audience does not flood the room.
+"""
+@sio.event
+@instrumented
+async def join(sid, data):
     room = data.get("roomId")
-    username = data.get("username")
-    print(f"[INFO] JOIN event from {sid} with username {username} in room {room}")
+    session = await sio.get_session(sid)
+    # an authenticated socket joins as the user of its token
+    username = session.get("username") or data.get("username")
+    logger.debug("event=join sid=%s username=%s room=%s", sid, username, room)
     if room and username:
-        # add socket and username to current client list
-        new_client = {"socketId": sid, "username": username}
-        connected_room_socket_mapping.setdefault(room, []).append(new_client)
+        role = resolve_role(session.get("role"), data.get("role"))
 
-        # add sid to room
+        # add socket, username and role to the room membership
+        await state_backend.join(room, sid, username, role)
+        previous = socket_roles.get(sid, room)
+        socket_roles.set(sid, room, role)
+
+        # add sid to room and to the audience of its role
         await sio.enter_room(sid, room)
+        if previous is not None and audience_room(room, previous) != audience_room(room, role):
+            await sio.leave_room(sid, audience_room(room, previous))
+        await sio.enter_room(sid, audience_room(room, role))
 
-        # let all clients know about new joiner
-        current_room = connected_room_socket_mapping.get(room, [])
-        await sio.emit(
-            ACTION_JOINED,
-            {"clients": current_room, "username": username, "socketId": sid},
-            room=room,
-        )
+        # let the clients know about new joiner
+        joined = {"clients": await state_backend.members(room), "username": username, "socketId": sid, "role": role}
+        if role in EDITING_ROLES:
+            await sio.emit(ACTION_JOINED, joined, room=room)
+        else:
+            await sio.emit(ACTION_JOINED, joined, room=editors_room(room))
+            await sio.emit(ACTION_JOINED, joined, to=sid)
+
+        # serve the joiner the server's copy of the room in one message
+        state = await get_room_state(room)
+        if state:
+            await sio.emit(ACTION_ROOM_STATE, state, to=sid)
 
 
 """
-Client disconnect event handler
+Remove a socket from all of its rooms and notify the remaining members
 """
-@sio.event
-async def leave(sid, data):
-    # fetch all rooms
-    rooms = sio.rooms(sid)
-    print(f"LEAVE event from {sid} in rooms {rooms}")
+async def remove_from_rooms(sid):
+    for room, username in await state_backend.leave_all(sid):
+        role = socket_roles.discard(sid, room)
+        await sio.leave_room(sid, room)
+        if role is not None:
+            await sio.leave_room(sid, audience_room(room, role))
 
-    # for each room that the client is in
-    for room in rooms:
-        if room == sid:
+        # the last member is gone: stop its executions, save the room and release its document
+        if not await state_backend.member_count(room):
+            await job_queue.cancel_room(room, CANCEL_ROOM_EMPTY)
+            if room_persistence:
+                await room_persistence.close(room)
+            # somebody may have joined while the room was being saved
+            if not await state_backend.member_count(room):
+                await state_backend.drop_document(room)
             continue
 
-        clients = connected_room_socket_mapping.get(room, [])
-        client = next((c for c in clients if c.get("socketId") == sid), None)
-
-        # If the client is found, remove it and update the mapping
-        if client:
-            username = client.get("username")
-            clients.remove(client)
-
         # let all other clients in that room know that this particular client has left
         await sio.emit(
             ACTION_DISCONNECTED,
             {"socketId": sid, "username": username},
-            room=room,
+            room=room if role in EDITING_ROLES else editors_room(room),
             skip_sid=sid,
         )
+
+
+"""
+Client leave event handler
+"""
+@sio.event
+@instrumented
+async def leave(sid, data):
+    logger.debug("event=leave sid=%s", sid)
+    await remove_from_rooms(sid)
+
+
+"""
+Transport disconnect handler, so that sockets which drop without a leave
+event do not stay in their rooms
+"""
+@sio.event
+@instrumented
+async def disconnect(sid, reason=None):
+    await remove_from_rooms(sid)
@@ -0,0 +1,88 @@
+import asyncio
+import hashlib
+import json
+
+from ..backends import state_backend
+from ..constants import LANG_CONFIG_MAP
+from ..jobs import job_queue, submit_execution
+from ..jobs.base import FINISHED_STATES
+from ..models.code import Code
+
+
+class RunRejected(Exception):
+    pass
+
+
+"""
+Single-flight runs of the rooms' code.
+A run executes the room's current code, language and prerequisites as kept
+on the server, and streams the output to all members of the room. While a
+run of the same code, language and prerequisites is in flight, further
+requests from the room attach to it instead of starting another execution.
+A request for code that has changed since starts a new run, which preempts
+the one in flight (unless preemption is off). The runs in flight are found
+through the job queue, so requests handled by different workers coalesce
+as well; requests within this process are serialized per room.
+"""
+class RoomRuns:
+    def __init__(self):
+        self.started = 0
+        self.attached = 0
+        # room -> [lock, number of requests using it]
+        self._locks: dict[str, list] = {}
+
+    """
+    Run the room's code, or attach to the run of it in flight.
+    Returns the job record of the run and whether the request was attached.
+    Raises RunRejected when there is nothing the room can run, and
+    ExecutionQueueFull when too many jobs are pending.
+    """
+    async def run(self, room: str, username: str | None, lang: str | None) -> tuple[dict, bool]:
+        entry = self._locks.setdefault(room, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                return await self._run(room, username, lang)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[room]
+
+    async def _run(self, room: str, username: str | None, lang: str | None) -> tuple[dict, bool]:
+        text, _ = await state_backend.get_document(room) or ("", 0)
+        settings = await state_backend.get_settings(room)
+        code = Code(
+            # the room's language, or the requester's while nobody has changed it
+            language=settings.get("lang") or lang or "",
+            prerequisites=settings.get("prerequisites") or "",
+            code=text,
+            roomId=room,
+            username=username,
+            stream=True,
+        )
+        if code.language not in LANG_CONFIG_MAP:
+            raise RunRejected("Language not supported")
+        if not code.code.strip() and not code.prerequisites.strip():
+            raise RunRejected("Please enter code or pre-requisites")
+
+        key = self.source_key(code)
+        for job_id in await job_queue.room_jobs(room):
+            job = await job_queue.get(job_id)
+            if job is not None and job["status"] not in FINISHED_STATES and job.get("sourceKey") == key:
+                self.attached += 1
+                return job, True
+
+        job = await submit_execution({**code.model_dump(), "sourceKey": key})
+        self.started += 1
+        return job, False
+
+    @staticmethod
+    def source_key(code: Code) -> str:
+        payload = json.dumps([code.language, code.prerequisites, code.code])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def stats(self) -> dict:
+        return {"started": self.started, "attached": self.attached, "rooms": len(self._locks)}
+
+
+room_runs = RoomRuns()
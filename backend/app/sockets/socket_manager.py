@@ -1,8 +1,121 @@
+import functools
+import inspect
+import time
+from collections import Counter
+
 import socketio
 
-from ..constants import FRONTEND_URL
+from ..backends import state_backend
+from ..constants import BROADCAST_MAX_RATE, BROADCAST_WINDOW, FRONTEND_URL, VIEWER_SNAPSHOT_INTERVAL
+from ..metrics import metrics
+from .broadcaster import RoomBroadcaster
+from .roles import socket_roles, split_room
+from .viewer_stream import ViewerStream
+
+SOCKET_EVENTS = metrics.counter(
+    "simcode_socket_events_total", "Socket.IO events received, by event", ("event",)
+)
+SOCKET_EVENT_ERRORS = metrics.counter(
+    "simcode_socket_event_errors_total", "Socket.IO event handlers that raised, by event", ("event",)
+)
+SOCKET_EVENT_SECONDS = metrics.histogram(
+    "simcode_socket_event_seconds", "Time spent in Socket.IO event handlers, by event", ("event",)
+)
+SOCKET_EMITS = metrics.counter(
+    "simcode_socket_emits_total", "Socket.IO events sent, by event", ("event",)
+)
+SOCKET_FANOUT = metrics.histogram(
+    "simcode_socket_fanout_size",
+    "Sockets of this process a room broadcast was sent to, by event",
+    ("event",),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+SOCKET_DELIVERIES = metrics.counter(
+    "simcode_socket_deliveries_total",
+    "Room broadcast events delivered to sockets of this process, by event and role of the recipient",
+    ("event", "role"),
+)
+
+
+"""
+Socket.IO server that counts the events it sends and records the number of
+recipients of every room broadcast, in total and by the recipients' role
+"""
+class InstrumentedServer(socketio.AsyncServer):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.deliveries = Counter()
+
+    async def emit(self, event, data=None, to=None, room=None, skip_sid=None, namespace=None, **kwargs):
+        SOCKET_EMITS.inc(event=event)
+        target = to if to is not None else room
+        if isinstance(target, str):
+            participants = self.manager.rooms.get(namespace or "/", {}).get(target)
+            # a socket's own room only contains itself, that is not a broadcast
+            if participants and target not in participants:
+                skip = {skip_sid} if isinstance(skip_sid, str) else set(skip_sid or ())
+                base, audience = split_room(target)
+                if audience == "viewers":
+                    roles = Counter({"viewer": sum(1 for sid in participants if sid not in skip)})
+                else:
+                    roles = Counter(socket_roles.get(sid, base) or "none" for sid in participants if sid not in skip)
+                SOCKET_FANOUT.observe(sum(roles.values()), event=event)
+                for role, count in roles.items():
+                    SOCKET_DELIVERIES.inc(count, event=event, role=role)
+                self.deliveries.update(roles)
+        return await super().emit(event, data, to=to, room=room, skip_sid=skip_sid, namespace=namespace, **kwargs)
+
+
+"""
+Decorator for event handlers, counting the events and timing the handler.
+The wrapper keeps the handler's signature: a call the handler does not
+accept raises TypeError before it is counted, as it would for the handler
+itself (python-socketio retries some events with fewer arguments).
+"""
+def instrumented(handler):
+    event = handler.__name__
+    signature = inspect.signature(handler)
+
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        signature.bind(*args, **kwargs)
+        SOCKET_EVENTS.inc(event=event)
+        started = time.perf_counter()
+        try:
+            return await handler(*args, **kwargs)
+        except Exception:
+            SOCKET_EVENT_ERRORS.inc(event=event)
+            raise
+        finally:
+            SOCKET_EVENT_SECONDS.observe(time.perf_counter() - started, event=event)
+
+    return wrapper
+
+
+"""
+Rooms with members connected to this process and the number of those
+members, in total and by role
+"""
+def local_room_stats() -> dict:
+    rooms = [
+        (room, members)
+        for room, members in sio.manager.rooms.get("/", {}).items()
+        if room is not None and room not in members and split_room(room)[1] is None
+    ]
+    roles = Counter(socket_roles.get(sid, room) for room, members in rooms for sid in members)
+    return {
+        "rooms": len(rooms),
+        "members": sum(len(members) for _, members in rooms),
+        "roles": {role: count for role, count in roles.items() if role},
+    }
+
 
-sio = socketio.AsyncServer(async_mode="asgi", cors_allowed_origins=FRONTEND_URL)
-connected_room_socket_mapping = {}
+sio = InstrumentedServer(
+    async_mode="asgi",
+    cors_allowed_origins=FRONTEND_URL,
+    client_manager=state_backend.client_manager(),
+)
+broadcaster = RoomBroadcaster(sio, BROADCAST_WINDOW, BROADCAST_MAX_RATE)
+viewer_stream = ViewerStream(sio, VIEWER_SNAPSHOT_INTERVAL)
 from .code_events import *
 from .room_events import *
@@ -0,0 +1,90 @@
+import asyncio
+
+from ..backends import state_backend
+from ..constants import ACTION_ROOM_STATE
+from .roles import viewers_room
+
+
+"""
+The room's code, version and settings as payload of a room state event
+"""
+def room_state_payload(text: str, version: int, settings: dict) -> dict:
+    return {
+        "code": text,
+        "version": version,
+        "lang": settings.get("lang"),
+        "prerequisites": settings.get("prerequisites"),
+    }
+
+
+"""
+Throttled stream of room snapshots for viewers.
+Viewers do not receive the edits of a room one by one. An edit only marks
+the room as changed, and at most once per `interval` the room's current
+state is sent to all of its viewers as one `room_state` event. The work per
+edit is therefore the same however many viewers a room has; a room with
+hundreds of viewers costs one snapshot per interval while it is edited.
+"""
+class ViewerStream:
+    def __init__(self, sio, interval: float):
+        self.sio = sio
+        self.interval = interval
+        self.marked = 0
+        self.sent = 0
+        self.skipped = 0
+        self._changed: set[str] = set()
+        # room -> timer of the next snapshot, kept while the room is being edited
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+        self._sending: dict[str, asyncio.Task] = {}
+
+    """
+    Note that the room's code or settings changed
+    """
+    def mark(self, room: str):
+        self.marked += 1
+        self._changed.add(room)
+        if room not in self._timers:
+            loop = asyncio.get_running_loop()
+            self._timers[room] = loop.call_later(self.interval, self._flush, room)
+
+    def _flush(self, room: str):
+        # a snapshot that is still being sent covers this interval's changes only in part
+        if room not in self._changed or room in self._sending:
+            if room in self._changed:
+                self._timers[room] = asyncio.get_running_loop().call_later(self.interval, self._flush, room)
+            else:
+                self._timers.pop(room, None)
+            return
+
+        self._changed.discard(room)
+        task = asyncio.ensure_future(self._send(room))
+        self._sending[room] = task
+        task.add_done_callback(lambda _: self._sending.pop(room, None))
+        self._timers[room] = asyncio.get_running_loop().call_later(self.interval, self._flush, room)
+
+    async def _send(self, room: str):
+        document = None
+        if (await state_backend.role_counts(room)).get("viewer"):
+            document = await state_backend.get_document(room)
+        if document is None:
+            self.skipped += 1
+            return
+
+        text, version = document
+        settings = await state_backend.get_settings(room)
+        await self.sio.emit(ACTION_ROOM_STATE, room_state_payload(text, version, settings), room=viewers_room(room))
+        self.sent += 1
+
+    async def stop(self):
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        self._changed.clear()
+
+    def stats(self) -> dict:
+        return {
+            "marked": self.marked,
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "streaming_rooms": len(self._timers),
+        }
@@ -0,0 +1,120 @@
+"""
+Count the SQL statements issued per /signup and /login request, before and
+after role seeding was moved to start-up and role lookups were cached.
+
+The "before" numbers replay the old request path (seeding the default roles
+in `get_db` and querying the roles table in `is_valid_role`) against the
+same database. Runs against an in-memory SQLite database, so no Postgres is
+needed:
+
+    cd backend
+    python -m benchmarks.auth_queries
+"""
+import asyncio
+import os
+import sys
+from contextlib import contextmanager
+
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.base import Base
+from app.models.role_model import Role
+from app.models.user_model import User
+from app.repositories import user_repo
+from app.service import user_service
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+REQUESTS = 50
+PASSWORD = "Passw0rd!"
+
+engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+SessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+statements = []
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    statements.append(statement)
+
+
+@event.listens_for(engine.sync_engine, "commit")
+def count_commit(conn):
+    statements.append("COMMIT")
+
+
+# The request path before the change
+
+async def legacy_create_default_roles(db):
+    for role_name in ["viewer", "editor", "host"]:
+        result = await db.execute(select(Role).where(Role.role_type == role_name))
+        if not result.scalars().first():
+            db.add(Role(role_type=role_name))
+    await db.commit()
+
+
+async def legacy_is_valid_role(db, role_name):
+    result = await db.execute(select(Role).where(Role.role_type == role_name))
+    return result.scalars().first() is not None
+
+
+@contextmanager
+def legacy_patches():
+    is_valid_role = user_repo.is_valid_role
+    user_repo.is_valid_role = legacy_is_valid_role
+    try:
+        yield
+    finally:
+        user_repo.is_valid_role = is_valid_role
+
+
+async def legacy_get_db():
+    db = SessionLocal()
+    await legacy_create_default_roles(db)
+    return db
+
+
+async def get_db():
+    return SessionLocal()
+
+
+async def measure(label: str, get_session, prefix: str) -> dict:
+    counts = {}
+    for endpoint in ("signup", "login"):
+        statements.clear()
+        for i in range(REQUESTS):
+            db = await get_session()
+            try:
+                if endpoint == "signup":
+                    await user_service.signup_user(db, f"{prefix}{i}", f"{prefix}{i}@example.com", PASSWORD, "editor")
+                else:
+                    await user_service.login_user(db, f"{prefix}{i}", PASSWORD)
+            finally:
+                await db.close()
+        counts[endpoint] = len(statements) / REQUESTS
+    print(f"{label:<8} signup: {counts['signup']:5.2f} statements/request   login: {counts['login']:5.2f} statements/request")
+    return counts
+
+
+async def main():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with SessionLocal() as db:
+        await user_repo.create_default_roles(db)
+
+    with legacy_patches():
+        before = await measure("before", legacy_get_db, "legacy")
+    user_repo.role_cache.invalidate()
+    after = await measure("after", get_db, "user")
+
+    async with SessionLocal() as db:
+        assert await db.scalar(select(func.count()).select_from(User)) == 2 * REQUESTS
+
+    for endpoint in ("signup", "login"):
+        print(f"{endpoint}: {before[endpoint] - after[endpoint]:.2f} fewer statements per request")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,24 +1,111 @@
 import os
+import time
 
+from app.models.base import Base
+from app.models.room_model import RoomEdit, RoomSnapshot  # registers the room tables
 from app.repositories.user_repo import create_default_roles
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
 load_dotenv("backend/.env")
 DATABASE_USER = os.getenv("DB_USER", "postgres")
 DATABASE_PASSWORD = os.getenv("DB_PASS", "jain254p*")
 DATABASE_NAME = os.getenv("DB_NAME", "mydb")
 DATABASE_SOCKET = os.getenv("DB_SOCKET", "localhost:5432")
-DATABASE_URL = f"postgresql://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_SOCKET}/{DATABASE_NAME}"
+# any async SQLAlchemy URL, e.g. sqlite+aiosqlite:///./simcode.db for local runs and tests
+DATABASE_URL = os.getenv(
+    "DATABASE_URL",
+    f"postgresql+asyncpg://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_SOCKET}/{DATABASE_NAME}",
+)
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 10))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 500))
+
+
+"""
+Create the async engine for `url`. Connection pool settings only apply to
+server databases; asyncpg additionally keeps a per-connection cache of
+prepared statements.
+"""
+def create_engine(url: str):
+    url = make_url(url)
+    options = {"pool_pre_ping": DB_POOL_PRE_PING, "query_cache_size": DB_STATEMENT_CACHE_SIZE}
+    if url.get_backend_name() != "sqlite":
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    if url.get_driver_name() == "asyncpg":
+        url = url.update_query_dict({"prepared_statement_cache_size": str(DB_STATEMENT_CACHE_SIZE)})
+    return create_async_engine(url, **options)
+
+
+"""
+Connection pool checkout wait and query latency of an engine
+"""
+class DatabaseStats:
+    def __init__(self, engine):
+        self.engine = engine
+        self.checkouts = 0
+        self.checkout_wait = 0.0
+        self.max_checkout_wait = 0.0
+        self.queries = 0
+        self.query_time = 0.0
+        self.max_query_time = 0.0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._before_query)
+        event.listen(engine.sync_engine, "after_cursor_execute", self._after_query)
+
+    def _before_query(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    def _after_query(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        self.queries += 1
+        self.query_time += elapsed
+        self.max_query_time = max(self.max_query_time, elapsed)
+
+    def record_checkout(self, wait: float):
+        self.checkouts += 1
+        self.checkout_wait += wait
+        self.max_checkout_wait = max(self.max_checkout_wait, wait)
+
+    def stats(self) -> dict:
+        pool = self.engine.pool
+        return {
+            "pool": pool.status(),
+            "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+            "checkouts": self.checkouts,
+            "avg_checkout_wait_ms": round(1000 * self.checkout_wait / self.checkouts, 3) if self.checkouts else 0,
+            "max_checkout_wait_ms": round(1000 * self.max_checkout_wait, 3),
+            "queries": self.queries,
+            "avg_query_ms": round(1000 * self.query_time / self.queries, 3) if self.queries else 0,
+            "max_query_ms": round(1000 * self.max_query_time, 3),
+        }
+
 
 engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+SessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+db_stats = DatabaseStats(engine)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        create_default_roles(db)
+async def get_db():
+    async with SessionLocal() as db:
+        # check the connection out up front, so that the wait for it is measured
+        started = time.perf_counter()
+        await db.connection()
+        db_stats.record_checkout(time.perf_counter() - started)
         yield db
-    finally:
-        db.close()
+
+# Create the tables and seed the default roles, once at start-up
+async def init_db():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with SessionLocal() as db:
+        await create_default_roles(db)
@@ -1,24 +1,74 @@
+import logging
+from contextlib import asynccontextmanager
+
 import socketio
 from app.api import user_routes
 from app.api.code import router as code_router
+from app.api.metrics import router as metrics_router
 from app.api.room import router as room_router
-from app.constants import FRONTEND_URL
-from app.models.base import Base
-from app.models.user_model import Base
-from app.sockets.socket_manager import sio
-from db import engine
+from app.backends import state_backend
+from app.constants import FRONTEND_URL, JOB_QUEUE, JOB_WORKERS, LOG_FORMAT, LOG_LEVEL
+from app.jobs import job_queue
+from app.jobs.worker import ExecutionWorker
+from app.service.container_pool import container_pool
+from app.service.image_cache import image_cache
+from app.service.local_sandbox import local_sandbox
+from app.service.room_persistence import room_persistence
+from app.service.workspace import workspace_manager
+from app.sockets.socket_manager import broadcaster, sio, viewer_stream
+from db import SessionLocal, init_db
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from db import engine
-from app.models.user_model import Base
-from app.api import user_routes
-from app.models.base import Base
+
+logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_db()
+    await state_backend.start()
+    if room_persistence:
+        await room_persistence.start(SessionLocal)
+    await job_queue.start()
+    # With the local queue the executions run in this process; otherwise
+    # they are consumed by separate workers (see worker.py)
+    execution_worker = ExecutionWorker(job_queue, sio.emit, JOB_WORKERS) if JOB_QUEUE == "local" else None
+    if execution_worker:
+        # Remove sandboxes left behind by a previous, crashed server
+        await workspace_manager.start()
+        # Warm up the sandbox container pool before accepting executions
+        if container_pool:
+            await container_pool.start()
+        # Check which isolation the host offers the local process sandbox
+        if local_sandbox:
+            await local_sandbox.start()
+        await execution_worker.start()
+    if image_cache and execution_worker:
+        await image_cache.load()
+    elif image_cache:
+        # the images are built and used where the workers run
+        image_cache.delegate_builds(job_queue)
+    yield
+    if execution_worker:
+        await execution_worker.stop()
+        await workspace_manager.stop()
+        if container_pool:
+            await container_pool.stop()
+        if local_sandbox:
+            await local_sandbox.stop()
+    if image_cache:
+        await image_cache.stop()
+    await broadcaster.stop()
+    await viewer_stream.stop()
+    await job_queue.stop()
+    # save the rooms before their state goes away
+    if room_persistence:
+        await room_persistence.stop()
+    await state_backend.stop()
 
 # Wrap FastAPI with the Socket.IO ASGI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
-# Create tables
-Base.metadata.create_all(bind=engine)
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -32,6 +82,7 @@ app.add_middleware(
 app.include_router(code_router, prefix="/api")
 app.include_router(room_router, prefix="/api")
 app.include_router(user_routes.router)
+app.include_router(metrics_router)
 
 # Setup Socket Routes
 simcode = socketio.ASGIApp(sio, other_asgi_app=app)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the backend is run from its own directory, with `app` as a top-level package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
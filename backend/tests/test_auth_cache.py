@@ -0,0 +1,75 @@
+import asyncio
+
+from app.auth import jwt_handler
+from app.auth.jwt_handler import VerifiedTokenCache, create_access_token, decode_access_token
+from app.auth.security import PasswordHasher, PasswordHasherBusy, pwd_context
+
+PASSWORD = "Secret1!pass"
+
+
+class FakeClock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+def test_cached_tokens_expire_with_the_token(monkeypatch):
+    clock = FakeClock(1000.0)
+    monkeypatch.setattr(jwt_handler, "time", clock)
+    cache = VerifiedTokenCache(8)
+    cache.put("token", {"sub": "alice", "exp": 1060})
+
+    assert cache.get("token")["sub"] == "alice"
+    clock.now = 1060.0
+    assert cache.get("token") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 0}
+
+
+def test_the_least_recently_used_tokens_are_dropped():
+    cache = VerifiedTokenCache(2)
+    for token in ("a", "b"):
+        cache.put(token, {"exp": float("inf")})
+    cache.get("a")
+    cache.put("c", {"exp": float("inf")})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_verified_tokens_are_served_from_the_cache(monkeypatch):
+    cache = VerifiedTokenCache(8)
+    monkeypatch.setattr(jwt_handler, "token_cache", cache)
+    token = create_access_token({"sub": "alice", "role": "editor"})
+
+    assert decode_access_token(token)["sub"] == "alice"
+    assert decode_access_token(token)["role"] == "editor"
+    assert decode_access_token(token + "x") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["entries"] == 1
+
+
+def test_hashes_made_with_another_cost_are_replaced_on_login():
+    hasher = PasswordHasher(1, 4)
+    old_hash = pwd_context.using(bcrypt__rounds=4).hash(PASSWORD)
+
+    async def scenario():
+        valid, new_hash = await hasher.verify_and_update(PASSWORD, old_hash)
+        again = await hasher.verify_and_update(PASSWORD, new_hash)
+        wrong = await hasher.verify_and_update("Wrong1!pass", old_hash)
+        return valid, new_hash, again, wrong
+
+    valid, new_hash, again, wrong = asyncio.run(scenario())
+    assert valid and new_hash and new_hash != old_hash
+    assert again == (True, None)
+    assert wrong == (False, None)
+
+
+def test_hashing_is_refused_when_too_many_operations_wait():
+    hasher = PasswordHasher(1, 1)
+
+    async def scenario():
+        return await asyncio.gather(*(hasher.hash(PASSWORD) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert sum(isinstance(result, PasswordHasherBusy) for result in results) == 1
+    assert hasher.stats()["rejected"] == 1 and hasher.stats()["pending"] == 0
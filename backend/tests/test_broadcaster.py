@@ -0,0 +1,65 @@
+import asyncio
+
+from app.sockets.broadcaster import RoomBroadcaster
+
+WINDOW = 0.01
+
+
+class FakeServer:
+    def __init__(self):
+        self.emitted = []
+
+    async def emit(self, event, data=None, room=None, skip_sid=None, **kwargs):
+        self.emitted.append((event, data, skip_sid))
+
+
+def broadcast(publish, max_rate: float = 1000, wait: float = 0.05):
+    async def scenario():
+        sio = FakeServer()
+        broadcaster = RoomBroadcaster(sio, WINDOW, max_rate)
+        await publish(broadcaster)
+        await asyncio.sleep(wait)
+        await broadcaster.stop()
+        return sio.emitted, broadcaster.stats()
+
+    return asyncio.run(scenario())
+
+
+def test_the_latest_full_state_event_wins():
+    async def publish(broadcaster):
+        for code in ("a", "ab", "abc"):
+            broadcaster.publish_latest("r", "code_change", {"code": code}, skip_sid="sid-1")
+        broadcaster.publish_latest("r", "lang_change", {"lang": "java"})
+
+    emitted, stats = broadcast(publish)
+    assert emitted == [("code_change", {"code": "abc"}, "sid-1"), ("lang_change", {"lang": "java"}, None)]
+    assert stats["published"] == 4 and stats["coalesced"] == 2 and stats["emitted"] == 2
+
+
+def test_events_keep_their_publication_order():
+    async def publish(broadcaster):
+        broadcaster.publish_batched("r", "code_op", {"version": 1}, skip_sid="sid-1")
+        broadcaster.publish_latest("r", "prereq_change", {"prerequisites": "pip install x"})
+        broadcaster.publish_batched("r", "code_op", {"version": 2})
+        broadcaster.publish_batched("r", "code_op", {"version": 3})
+
+    emitted, stats = broadcast(publish)
+    assert emitted == [
+        ("code_op", {"version": 1}, "sid-1"),
+        ("prereq_change", {"prerequisites": "pip install x"}, None),
+        ("code_op_batch", {"batch": [{"version": 2}, {"version": 3}]}, None),
+    ]
+    assert stats["batched"] == 1
+
+
+def test_rooms_are_flushed_at_most_max_rate_times_per_second():
+    async def publish(broadcaster):
+        broadcaster.publish_latest("r", "code_change", {"code": "a"})
+        await asyncio.sleep(WINDOW * 3)
+        # published during the cool-down after the first flush
+        for code in ("ab", "abc"):
+            broadcaster.publish_latest("r", "code_change", {"code": code})
+            await asyncio.sleep(WINDOW * 3)
+
+    emitted, _ = broadcast(publish, max_rate=5, wait=0.3)
+    assert [data["code"] for _, data, _ in emitted] == ["a", "abc"]
@@ -0,0 +1,60 @@
+import asyncio
+
+from app.api import code as code_api
+from app.backends import state_backend
+from app.jobs.local import LocalJobQueue
+from app.models.code import Code
+
+
+def use_queue(monkeypatch) -> LocalJobQueue:
+    queue = LocalJobQueue(16, 60)
+    monkeypatch.setattr(code_api, "job_queue", queue)
+    monkeypatch.setattr("app.jobs.job_queue", queue)
+    return queue
+
+
+def room_code(room: str) -> Code:
+    return Code(language="python", code="print(1)", roomId=room, stream=True)
+
+
+def test_runs_in_a_room_need_an_editor_of_the_room(monkeypatch):
+    use_queue(monkeypatch)
+
+    async def scenario():
+        await state_backend.join("api-room", "api-sid-1", "alice", "editor")
+        await state_backend.join("api-room", "api-sid-2", "bob", "viewer")
+        try:
+            return [
+                (await code_api.run_code(room_code("api-room"), username)).status_code
+                for username in (None, "mallory", "bob", "alice")
+            ]
+        finally:
+            await state_backend.leave("api-room", "api-sid-1")
+            await state_backend.leave("api-room", "api-sid-2")
+
+    assert asyncio.run(scenario()) == [401, 403, 403, 202]
+
+
+def test_jobs_are_cancelled_by_their_user_or_room_members(monkeypatch):
+    queue = use_queue(monkeypatch)
+
+    async def scenario():
+        await state_backend.join("api-room", "api-sid-1", "alice", "editor")
+        await state_backend.join("api-room", "api-sid-2", "bob", "viewer")
+        try:
+            anonymous = await queue.submit({"language": "python"})
+            own = await queue.submit({"language": "python", "username": "carol"})
+            in_room = await queue.submit({"language": "python", "roomId": "api-room", "username": "alice"})
+            return [
+                (await code_api.cancel_job(anonymous["jobId"], None)).status_code,
+                (await code_api.cancel_job(anonymous["jobId"], "mallory")).status_code,
+                (await code_api.cancel_job(own["jobId"], "mallory")).status_code,
+                (await code_api.cancel_job(own["jobId"], "carol")).status_code,
+                (await code_api.cancel_job(in_room["jobId"], "mallory")).status_code,
+                (await code_api.cancel_job(in_room["jobId"], "bob")).status_code,
+            ]
+        finally:
+            await state_backend.leave("api-room", "api-sid-1")
+            await state_backend.leave("api-room", "api-sid-2")
+
+    assert asyncio.run(scenario()) == [401, 403, 403, 202, 403, 202]
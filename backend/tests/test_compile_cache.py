@@ -0,0 +1,70 @@
+import io
+import tarfile
+
+from app.service.compile_cache import CompileCache
+
+IMAGE = "gcc:latest"
+COMPILE = "g++ main.cpp -o main"
+SOURCE = "int main() { return 0; }"
+
+
+def workspace(tmp_path, files: dict[str, bytes]) -> str:
+    directory = tmp_path / "workspace"
+    directory.mkdir()
+    for name, content in files.items():
+        (directory / name).write_bytes(content)
+    return str(directory)
+
+
+def test_keys_cover_every_input_of_the_compilation():
+    key = CompileCache.make_key(IMAGE, COMPILE, SOURCE, "")
+    assert CompileCache.make_key(IMAGE, COMPILE, SOURCE, None) == key
+    assert CompileCache.make_key("gcc:13", COMPILE, SOURCE, "") != key
+    assert CompileCache.make_key(IMAGE, COMPILE + " -O2", SOURCE, "") != key
+    assert CompileCache.make_key(IMAGE, COMPILE, SOURCE + "\n", "") != key
+    assert CompileCache.make_key(IMAGE, COMPILE, SOURCE, "apt-get install -y libgmp-dev") != key
+    # parts are length-prefixed, so moving text between them changes the key
+    assert CompileCache.make_key("ab", "c", SOURCE, "") != CompileCache.make_key("a", "bc", SOURCE, "")
+
+
+def test_stored_artifacts_are_restored_on_a_hit(tmp_path):
+    cache = CompileCache(str(tmp_path / "cache"), 10**6)
+    key = CompileCache.make_key(IMAGE, COMPILE, SOURCE, "")
+    assert cache.restore(key) is None
+
+    directory = workspace(tmp_path, {"main": b"binary", "main.cpp": SOURCE.encode()})
+    cache.store_from_dir(key, directory, ["main"])
+    files = cache.restore(key)
+
+    assert set(files) == {"main"}
+    assert files["main"][0] == b"binary"
+    assert cache.restore(CompileCache.make_key(IMAGE, COMPILE, "int main() {}", "")) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_artifacts_are_stored_from_the_top_level_of_a_workspace_archive(tmp_path):
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode="w") as tar:
+        for name, content in (("sandbox/Main.class", b"class"), ("sandbox/lib/Other.class", b"nested")):
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+
+    cache = CompileCache(str(tmp_path / "cache"), 10**6)
+    cache.store_from_tar("key", archive.getvalue(), ["*.class"])
+    assert {name: content for name, (content, _) in cache.restore("key").items()} == {"Main.class": b"class"}
+
+
+def test_least_recently_used_entries_are_evicted_and_entries_survive_a_restart(tmp_path):
+    root = str(tmp_path / "cache")
+    cache = CompileCache(root, 10)
+    directory = workspace(tmp_path, {"main": b"12345"})
+    cache.store_from_dir("old", directory, ["main"])
+    cache.store_from_dir("recent", directory, ["main"])
+    cache.restore("old")
+    cache.store_from_dir("new", directory, ["main"])
+
+    reloaded = CompileCache(root, 10)
+    assert cache.stats()["evictions"] == 1
+    assert cache.restore("recent") is None
+    assert reloaded.restore("old") is not None and reloaded.restore("new") is not None
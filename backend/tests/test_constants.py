@@ -0,0 +1,30 @@
+import pytest
+
+from app.constants import LANG_CONFIG_MAP, parse_executor_backends
+
+
+def test_executor_backends_are_parsed_per_language():
+    backends = parse_executor_backends("docker", " python = process ,, bash=process ")
+    assert backends["python"] == "process"
+    assert backends["bash"] == "process"
+    assert backends["java"] == "docker"
+    assert set(backends) == set(LANG_CONFIG_MAP)
+
+
+@pytest.mark.parametrize(
+    "entries, message",
+    [
+        ("python", "expected language=backend"),
+        ("python=", "expected language=backend"),
+        ("cobol=process", "unknown language 'cobol'"),
+        ("python=vm", "unknown backend 'vm' for python"),
+    ],
+)
+def test_invalid_executor_backends_are_reported(entries, message):
+    with pytest.raises(ValueError, match=message):
+        parse_executor_backends("docker", entries)
+
+
+def test_invalid_default_executor_backend_is_reported():
+    with pytest.raises(ValueError, match="DEFAULT_EXECUTOR_BACKEND"):
+        parse_executor_backends("vm", "")
@@ -0,0 +1,97 @@
+import asyncio
+
+from app.service import container_pool as container_pool_module
+from app.service.container_pool import ContainerPool
+
+
+def fake_docker(monkeypatch, reset_returncode: int = 0):
+    calls = []
+    killed = []
+
+    async def run_process(args, timeout=None, on_timeout=None, **kwargs):
+        calls.append(args[:2])
+        return (reset_returncode if args[1] == "exec" else 0), "", ""
+
+    async def kill_container(name):
+        killed.append(name)
+
+    monkeypatch.setattr(container_pool_module, "run_process", run_process)
+    monkeypatch.setattr(container_pool_module, "kill_container", kill_container)
+    return calls, killed
+
+
+def make_pool(max_size: int = 2, max_uses: int = 10) -> ContainerPool:
+    return ContainerPool("python:3.10-slim", "python", 0, max_size, max_uses, 300)
+
+
+def test_containers_are_reset_and_reused(monkeypatch):
+    calls, killed = fake_docker(monkeypatch)
+
+    async def scenario():
+        pool = make_pool()
+        first = await pool.checkout()
+        await pool.checkin(first)
+        second = await pool.checkout()
+        stats = pool.stats()
+        await pool.checkin(second)
+        return first, second, stats, pool.stats()
+
+    first, second, stats, after = asyncio.run(scenario())
+    assert second is first and second.uses == 2
+    assert calls == [["docker", "run"], ["docker", "exec"], ["docker", "exec"]]
+    assert killed == []
+    assert stats == {"size": 1, "idle": 0, "in_use": 1}
+    assert after == {"size": 1, "idle": 1, "in_use": 0}
+
+
+def test_containers_are_replaced_after_their_last_use_or_a_failed_run(monkeypatch):
+    calls, killed = fake_docker(monkeypatch)
+
+    async def scenario():
+        pool = make_pool(max_uses=2)
+        first = await pool.checkout()
+        await pool.checkin(first)
+        await pool.checkin(await pool.checkout())
+        # used twice, the next run gets a new container
+        second = await pool.checkout()
+        # a run that left the container in an unknown state
+        await pool.checkin(second, recycle=True)
+        third = await pool.checkout()
+        return first, second, third, pool.stats()
+
+    first, second, third, stats = asyncio.run(scenario())
+    assert killed == [first.name, second.name]
+    assert len({first.name, second.name, third.name}) == 3
+    assert calls.count(["docker", "run"]) == 3
+    assert stats == {"size": 1, "idle": 0, "in_use": 1}
+
+
+def test_containers_that_cannot_be_reset_are_replaced(monkeypatch):
+    _, killed = fake_docker(monkeypatch, reset_returncode=1)
+
+    async def scenario():
+        pool = make_pool()
+        container = await pool.checkout()
+        await pool.checkin(container)
+        return container, pool.stats()
+
+    container, stats = asyncio.run(scenario())
+    assert killed == [container.name]
+    assert stats == {"size": 0, "idle": 0, "in_use": 0}
+
+
+def test_checkout_waits_for_a_container_when_the_pool_is_full(monkeypatch):
+    fake_docker(monkeypatch)
+
+    async def scenario():
+        pool = make_pool(max_size=1)
+        container = await pool.checkout()
+        waiting = asyncio.ensure_future(pool.checkout())
+        await asyncio.sleep(0)
+        done_before = waiting.done()
+        await pool.checkin(container)
+        return container, done_before, await waiting
+
+    container, done_before, reused = asyncio.run(scenario())
+    assert not done_before
+    assert reused is container
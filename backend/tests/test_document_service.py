@@ -0,0 +1,114 @@
+import random
+
+import pytest
+
+from app.service.document_service import (
+    DELETE,
+    INSERT,
+    RoomDocument,
+    StaleVersionError,
+    apply_ops,
+    parse_ops,
+    serialize_ops,
+    transform,
+    transform_sequences,
+)
+
+
+def test_ops_round_trip_through_the_wire_format():
+    raw = [{"pos": 3, "delete": 2}, {"pos": 3, "insert": "ab"}]
+    assert serialize_ops(parse_ops(raw)) == raw
+
+
+@pytest.mark.parametrize(
+    "raw",
+    [None, [{"pos": -1, "insert": "a"}], [{"pos": 0, "insert": ""}], [{"pos": 0, "delete": 0}], ["op"]],
+)
+def test_invalid_ops_are_rejected(raw):
+    with pytest.raises(ValueError):
+        parse_ops(raw)
+
+
+def test_apply_ops_checks_the_range():
+    assert apply_ops("hello", [(DELETE, 0, 1), (INSERT, 0, "j")]) == "jello"
+    with pytest.raises(ValueError):
+        apply_ops("hello", [(DELETE, 3, 5)])
+    with pytest.raises(ValueError):
+        apply_ops("hello", [(INSERT, 6, "!")])
+
+
+def test_concurrent_inserts_at_the_same_position_keep_a_stable_order():
+    first, second = (INSERT, 2, "A"), (INSERT, 2, "B")
+    text = "abcd"
+    one = apply_ops(apply_ops(text, [first]), transform(second, first, False))
+    other = apply_ops(apply_ops(text, [second]), transform(first, second, True))
+    assert one == other == "abABcd"
+
+
+def test_delete_around_a_concurrent_insert_keeps_the_insert():
+    delete, insert = (DELETE, 1, 4), (INSERT, 3, "XY")
+    text = "abcdefg"
+    one = apply_ops(apply_ops(text, [insert]), transform(delete, insert, False))
+    other = apply_ops(apply_ops(text, [delete]), transform(insert, delete, True))
+    assert one == other == "aXYfg"
+
+
+def test_overlapping_deletes_remove_the_text_once():
+    first, second = (DELETE, 1, 3), (DELETE, 2, 3)
+    text = "abcdefg"
+    one = apply_ops(apply_ops(text, [first]), transform(second, first, False))
+    other = apply_ops(apply_ops(text, [second]), transform(first, second, True))
+    assert one == other == "afg"
+
+
+def random_ops(rng: random.Random, text: str, count: int) -> list[tuple]:
+    ops = []
+    for _ in range(count):
+        if text and rng.random() < 0.4:
+            pos = rng.randrange(len(text))
+            op = (DELETE, pos, rng.randint(1, len(text) - pos))
+        else:
+            op = (INSERT, rng.randint(0, len(text)), rng.choice(["a", "bc", "def"]))
+        text = apply_ops(text, [op])
+        ops.append(op)
+    return ops
+
+
+def test_transformed_sequences_converge():
+    rng = random.Random(7)
+    for _ in range(500):
+        text = "".join(rng.choice("xyz") for _ in range(rng.randint(0, 12)))
+        ops = random_ops(rng, text, rng.randint(1, 4))
+        against = random_ops(rng, text, rng.randint(1, 4))
+        ops_after, against_after = transform_sequences(ops, against)
+        assert apply_ops(apply_ops(text, against), ops_after) == apply_ops(apply_ops(text, ops), against_after)
+
+
+def test_ops_based_on_a_stale_version_are_rebased():
+    document = RoomDocument("hello world")
+    # two clients edit version 0 concurrently
+    document.apply(0, [(INSERT, 0, ">> ")])
+    applied = document.apply(0, [(DELETE, 6, 5), (INSERT, 6, "there")])
+    assert applied == [(DELETE, 9, 5), (INSERT, 9, "there")]
+    assert document.text == ">> hello there"
+    assert document.version == 2
+
+
+def test_versions_outside_the_history_are_stale():
+    document = RoomDocument("abc")
+    with pytest.raises(StaleVersionError):
+        document.apply(1, [(INSERT, 0, "x")])
+
+    for _ in range(document.history.maxlen + 1):
+        document.apply(document.version, [(INSERT, 0, "x")])
+    with pytest.raises(StaleVersionError):
+        document.apply(0, [(INSERT, 0, "y")])
+
+
+def test_replace_is_recorded_so_that_concurrent_ops_still_apply():
+    document = RoomDocument("abc")
+    document.replace("new text")
+    # an insert based on the old text ends up next to the replacement
+    document.apply(0, [(INSERT, 3, "!")])
+    assert document.text == "new text!"
+    assert document.version == 2
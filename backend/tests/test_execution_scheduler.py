@@ -0,0 +1,194 @@
+import asyncio
+
+import pytest
+
+from app.service.execution_engine import ExecutionQueueFull, ExecutionScheduler
+
+LANGUAGES = {
+    "python": {"cpus": 1.0, "memory": 256, "max_concurrent": 2},
+    "java": {"cpus": 2.0, "memory": 1024, "max_concurrent": 1},
+}
+
+
+def make_scheduler(**overrides) -> ExecutionScheduler:
+    options = dict(
+        max_concurrent=4,
+        max_queued=8,
+        cpu_budget=8.0,
+        memory_budget=4096,
+        max_running_per_room=4,
+        max_queued_per_room=8,
+    )
+    options.update(overrides)
+    return ExecutionScheduler(LANGUAGES, **options)
+
+
+"""
+Holds runs in their scheduler slots until they are released, recording the
+order in which they were admitted
+"""
+class Runs:
+    def __init__(self, scheduler: ExecutionScheduler):
+        self.scheduler = scheduler
+        self.admitted: list[str] = []
+        self._releases: dict[str, asyncio.Event] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    async def start(self, name: str, language: str = "python", room: str | None = None, user: str | None = None):
+        release = self._releases[name] = asyncio.Event()
+
+        async def run():
+            async with self.scheduler.slot(language, room, user):
+                self.admitted.append(name)
+                await release.wait()
+
+        self._tasks[name] = asyncio.ensure_future(run())
+        await asyncio.sleep(0)
+
+    async def finish(self, name: str):
+        self._releases[name].set()
+        await self._tasks[name]
+        await asyncio.sleep(0)
+
+    async def finish_all(self):
+        for release in self._releases.values():
+            release.set()
+        await asyncio.gather(*self._tasks.values())
+
+
+def test_language_slots_limit_concurrent_runs():
+    async def scenario():
+        scheduler = make_scheduler()
+        runs = Runs(scheduler)
+        for name in ("a", "b", "c"):
+            await runs.start(name)
+        admitted_before = list(runs.admitted)
+        await runs.finish("a")
+        admitted_after = list(runs.admitted)
+        await runs.finish_all()
+        return admitted_before, admitted_after, scheduler.stats()
+
+    before, after, stats = asyncio.run(scenario())
+    assert before == ["a", "b"]
+    assert after == ["a", "b", "c"]
+    assert stats["running"] == 0 and stats["waiting"] == 0
+    assert stats["languages"]["python"]["admitted"] == 3
+
+
+def test_runs_wait_for_cpu_and_memory_budget():
+    async def scenario():
+        scheduler = make_scheduler(cpu_budget=2.5, memory_budget=4096)
+        runs = Runs(scheduler)
+        await runs.start("py", "python")
+        # a java run needs 2 CPUs, only 1.5 are left
+        await runs.start("java", "java")
+        before = list(runs.admitted)
+        await runs.finish("py")
+        after = list(runs.admitted)
+        await runs.finish_all()
+        return before, after
+
+    before, after = asyncio.run(scenario())
+    assert before == ["py"]
+    assert after == ["py", "java"]
+
+
+def test_a_run_larger_than_the_budget_is_admitted_on_an_idle_host():
+    async def scenario():
+        scheduler = make_scheduler(cpu_budget=1.0, memory_budget=512)
+        runs = Runs(scheduler)
+        await runs.start("java", "java")
+        admitted = list(runs.admitted)
+        await runs.finish_all()
+        return admitted
+
+    assert asyncio.run(scenario()) == ["java"]
+
+
+def test_rooms_served_longest_ago_are_admitted_first():
+    async def scenario():
+        scheduler = make_scheduler(max_concurrent=1)
+        runs = Runs(scheduler)
+        await runs.start("busy-1", room="busy")
+        await runs.start("busy-2", room="busy")
+        await runs.start("busy-3", room="busy")
+        await runs.start("quiet-1", room="quiet")
+        for name in ("busy-1", "quiet-1", "busy-2"):
+            await runs.finish(name)
+        await runs.finish_all()
+        return runs.admitted
+
+    # the quiet room goes ahead of the burst that was queued before it
+    assert asyncio.run(scenario()) == ["busy-1", "quiet-1", "busy-2", "busy-3"]
+
+
+def test_users_of_a_room_take_turns():
+    async def scenario():
+        scheduler = make_scheduler(max_concurrent=1)
+        runs = Runs(scheduler)
+        await runs.start("alice-1", room="r", user="alice")
+        await runs.start("alice-2", room="r", user="alice")
+        await runs.start("bob-1", room="r", user="bob")
+        for name in ("alice-1", "bob-1"):
+            await runs.finish(name)
+        await runs.finish_all()
+        return runs.admitted
+
+    assert asyncio.run(scenario()) == ["alice-1", "bob-1", "alice-2"]
+
+
+def test_runs_are_rejected_when_the_queues_are_full():
+    async def scenario():
+        scheduler = make_scheduler(max_concurrent=1, max_queued=2, max_queued_per_room=1)
+        runs = Runs(scheduler)
+        await runs.start("running", room="a")
+        await runs.start("queued-a", room="a")
+
+        rejected = []
+        # the room already has a run waiting
+        try:
+            async with scheduler.slot("python", "a"):
+                pass
+        except ExecutionQueueFull:
+            rejected.append("room")
+
+        await runs.start("queued-b", room="b")
+        # two runs wait in total
+        try:
+            async with scheduler.slot("python", "c"):
+                pass
+        except ExecutionQueueFull:
+            rejected.append("total")
+
+        await runs.finish_all()
+        return rejected, scheduler.stats()
+
+    rejected, stats = asyncio.run(scenario())
+    assert rejected == ["room", "total"]
+    assert stats["languages"]["python"]["rejected"] == 2
+    assert stats["languages"]["python"]["admitted"] == 3
+
+
+def test_cancelled_waiters_leave_the_queue():
+    async def scenario():
+        scheduler = make_scheduler(max_concurrent=1)
+        runs = Runs(scheduler)
+        await runs.start("running")
+
+        async def wait():
+            async with scheduler.slot("python"):
+                pass
+
+        waiter = asyncio.ensure_future(wait())
+        await asyncio.sleep(0)
+        waiting = scheduler.stats()["waiting"]
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        stats = scheduler.stats()
+        await runs.finish_all()
+        return waiting, stats
+
+    waiting, stats = asyncio.run(scenario())
+    assert waiting == 1
+    assert stats["waiting"] == 0 and stats["rooms_waiting"] == 0
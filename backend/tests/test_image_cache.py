@@ -0,0 +1,114 @@
+import asyncio
+
+from app.jobs.local import LocalJobQueue
+from app.jobs.worker import ExecutionWorker
+from app.service import image_cache as image_cache_module
+from app.service.execution_engine import execution_scheduler, get_resource_args
+from app.service.image_cache import EnvironmentImageCache
+
+
+def fake_docker(monkeypatch, images_output: str = "", hold: asyncio.Event | None = None):
+    calls = []
+
+    async def run_process(args, timeout=None, on_timeout=None, **kwargs):
+        calls.append((args, timeout))
+        if args[:2] == ["docker", "run"] and hold is not None:
+            await hold.wait()
+        if args[:2] == ["docker", "images"]:
+            return 0, images_output, ""
+        if args[:3] == ["docker", "image", "inspect"]:
+            return 0, "100\n", ""
+        return 0, "", ""
+
+    async def kill_container(name):
+        pass
+
+    monkeypatch.setattr(image_cache_module, "run_process", run_process)
+    monkeypatch.setattr(image_cache_module, "kill_container", kill_container)
+    return calls
+
+
+def make_cache(max_pending_builds: int = 4) -> EnvironmentImageCache:
+    return EnvironmentImageCache("simcode-env", 10, 10**9, 2, max_pending_builds)
+
+
+def test_build_runs_with_the_limits_and_admission_of_a_sandbox_run(monkeypatch):
+    calls = fake_docker(monkeypatch)
+    admitted = []
+    slot = execution_scheduler.slot
+
+    def tracked_slot(language, room=None, user=None):
+        admitted.append(language)
+        return slot(language, room, user)
+
+    monkeypatch.setattr(execution_scheduler, "slot", tracked_slot)
+
+    async def scenario():
+        cache = make_cache()
+        cache.schedule_build("python", "pip install requests")
+        await asyncio.gather(*cache._builds.values())
+        return cache
+
+    cache = asyncio.run(scenario())
+
+    args, timeout = next(call for call in calls if call[0][:2] == ["docker", "run"])
+    resource_args = get_resource_args("python")
+    assert any(args[i : i + len(resource_args)] == resource_args for i in range(len(args)))
+    assert "--pids-limit" in args
+    assert timeout == cache.build_timeout("python")
+    assert admitted == ["python"]
+    assert cache.stats()["builds"] == 1
+    assert cache.lookup("python", "pip install requests") is not None
+
+
+def test_pending_builds_are_capped(monkeypatch):
+    hold = asyncio.Event()
+    fake_docker(monkeypatch, hold=hold)
+
+    async def scenario():
+        cache = make_cache(max_pending_builds=2)
+        results = [cache.schedule_build("python", f"pip install package{i}") for i in range(4)]
+        hold.set()
+        await asyncio.gather(*cache._builds.values())
+        return cache, results
+
+    cache, results = asyncio.run(scenario())
+    assert results == [True, True, False, False]
+    assert cache.stats()["rejected_builds"] == 2
+    assert cache.stats()["builds"] == 2
+
+
+def test_load_skips_dangling_images(monkeypatch):
+    key = EnvironmentImageCache.make_key("python:3.10-slim", "pip install requests")
+    fake_docker(monkeypatch, images_output=f"<none> 100MB\n{key} 100MB\n")
+    monkeypatch.setattr(image_cache_module.shutil, "which", lambda _: "/usr/bin/docker")
+
+    cache = make_cache()
+    asyncio.run(cache.load())
+    assert cache.stats()["images"] == 1
+
+
+def test_delegated_builds_run_in_the_worker(monkeypatch):
+    calls = fake_docker(monkeypatch)
+    worker_cache = make_cache()
+    monkeypatch.setattr("app.jobs.worker.image_cache", worker_cache)
+
+    async def scenario():
+        queue = LocalJobQueue(16, 60)
+        web_cache = make_cache()
+        web_cache.delegate_builds(queue)
+        web_cache.schedule_build("python", "pip install requests")
+        # the web process runs nothing itself until a worker takes the job
+        await asyncio.sleep(0)
+        assert not calls
+
+        worker = ExecutionWorker(queue, None, 1)
+        await worker.start()
+        await asyncio.gather(*web_cache._builds.values())
+        await worker.stop()
+        return web_cache
+
+    web_cache = asyncio.run(scenario())
+    assert any(call[0][:2] == ["docker", "run"] for call in calls)
+    assert worker_cache.lookup("python", "pip install requests") is not None
+    assert web_cache.stats()["builds"] == 0
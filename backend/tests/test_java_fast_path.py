@@ -0,0 +1,31 @@
+from app.models.code import Code
+from app.service import execution_service
+from app.service.execution_service import SandboxRun, create_sandbox_env, get_docker_command
+
+SOURCE = 'class Main { public static void main(String[] a) { System.out.println("one"); } }'
+
+
+def prepare(monkeypatch, fast_path: bool) -> SandboxRun:
+    monkeypatch.setattr(execution_service, "JAVA_FAST_PATH_ENABLED", fast_path)
+    run = SandboxRun(Code(language="java", code=SOURCE))
+    run.backend = "docker"
+    create_sandbox_env(run)
+    return run
+
+
+def test_fast_path_runs_do_not_collect_artifacts(monkeypatch):
+    first = prepare(monkeypatch, fast_path=True)
+    assert first.compile_key and first.fast_path
+    assert not first.stores_artifacts
+    # nothing is copied out of the container, so the sandbox stays on a tmpfs
+    assert "--tmpfs" in get_docker_command("simcode-test", first)
+
+    # with nothing cached, an identical run takes the fast path again
+    second = prepare(monkeypatch, fast_path=True)
+    assert second.fast_path and not second.precompiled
+
+
+def test_compiled_runs_collect_artifacts(monkeypatch):
+    run = prepare(monkeypatch, fast_path=False)
+    assert not run.fast_path and run.stores_artifacts
+    assert "--tmpfs" not in get_docker_command("simcode-test", run)
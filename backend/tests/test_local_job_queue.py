@@ -0,0 +1,26 @@
+import asyncio
+
+from app.jobs.local import LocalJobQueue
+
+
+def test_cancelled_queued_jobs_do_not_count_as_pending():
+    async def scenario():
+        queue = LocalJobQueue(2, 60)
+        first = await queue.submit({"language": "python"})
+        second = await queue.submit({"language": "python"})
+        await queue.cancel(first["jobId"])
+        await queue.cancel(second["jobId"])
+
+        # the cancelled jobs no longer take up room in the queue
+        third = await queue.submit({"language": "python"})
+        await queue.submit({"language": "python"})
+        stats = await queue.stats()
+
+        job_id, _ = await queue.consume()
+        return third, job_id, stats, await queue.stats()
+
+    third, consumed, stats, after = asyncio.run(scenario())
+    assert stats["pending"] == 2
+    assert stats["rejected"] == 0
+    assert consumed == third["jobId"]
+    assert after["pending"] == 1
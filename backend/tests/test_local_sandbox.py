@@ -0,0 +1,85 @@
+import asyncio
+import os
+
+from app.service import local_sandbox as local_sandbox_module
+from app.service.local_sandbox import ISOLATION_FAILED, LocalSandbox
+
+
+def make_sandbox(tmp_path, require_namespaces: bool = True) -> LocalSandbox:
+    sandbox = LocalSandbox(str(tmp_path / "sandbox"), "", require_namespaces, ["/home"], "/usr/bin:/bin", 64, 1024)
+    # run as the current user, whether or not the tests run as root
+    sandbox.owner = None
+    return sandbox
+
+
+def fake_probe(monkeypatch, returncode: int):
+    probes = []
+
+    async def run_process(args, timeout, **kwargs):
+        probes.append(args)
+        return returncode, "", "unshare: Operation not permitted"
+
+    monkeypatch.setattr(local_sandbox_module, "run_process", run_process)
+    return probes
+
+
+def test_the_backend_is_only_available_with_namespaces_unless_they_are_optional(monkeypatch, tmp_path):
+    probes = fake_probe(monkeypatch, ISOLATION_FAILED)
+
+    required = make_sandbox(tmp_path / "required")
+    optional = make_sandbox(tmp_path / "optional", require_namespaces=False)
+    asyncio.run(required.start())
+    asyncio.run(optional.start())
+
+    assert "unshare" in probes[0]
+    assert not required.available and not required.isolated
+    assert optional.available and not optional.isolated
+
+
+def test_start_removes_the_directories_of_exited_servers(monkeypatch, tmp_path):
+    fake_probe(monkeypatch, 0)
+    sandbox = make_sandbox(tmp_path)
+    # above the largest pid Linux hands out
+    os.makedirs(os.path.join(sandbox.root, "4194305", "leftover"))
+    asyncio.run(sandbox.start())
+
+    assert sandbox.available and sandbox.isolated
+    assert os.listdir(sandbox.root) == [str(os.getpid())]
+    assert sandbox.stats()["reaped_dirs"] == 1
+
+
+def test_sessions_get_a_private_directory_that_is_removed_afterwards(monkeypatch, tmp_path):
+    fake_probe(monkeypatch, 0)
+    sandbox = make_sandbox(tmp_path)
+
+    async def scenario():
+        await sandbox.start()
+        async with sandbox.session("run-1", "python") as session:
+            with open(os.path.join(session.directory, "main.py"), "w") as f:
+                f.write("print(1)")
+            active = sandbox.stats()["active"]
+        return session, active
+
+    session, active = asyncio.run(scenario())
+    assert active == 1
+    assert session.directory == os.path.join(sandbox.directory, "run-1")
+    assert not os.path.exists(session.directory)
+    assert sandbox.stats()["started"] == 2 and sandbox.stats()["active"] == 0
+
+
+def test_commands_run_isolated_with_limits_and_a_clean_environment(monkeypatch, tmp_path):
+    fake_probe(monkeypatch, 0)
+    sandbox = make_sandbox(tmp_path)
+
+    async def scenario():
+        await sandbox.start()
+        async with sandbox.session("run-1", "python") as session:
+            return sandbox.command(session, ["python3", "main.py"], session.directory, 2.5)
+
+    args, options = asyncio.run(scenario())
+    assert args[0] == "unshare" and "--net" in args and "--pid" in args
+    prlimit = args.index("prlimit")
+    assert args[prlimit + 1] == "--cpu=3"
+    assert args[-2:] == ["python3", "main.py"]
+    assert options["env"] == {"PATH": "/usr/bin:/bin", "HOME": "/tmp", "TMPDIR": "/tmp", "LANG": "C.UTF-8"}
+    assert options["new_session"]
@@ -0,0 +1,66 @@
+import asyncio
+
+from app.service.output_capture import OutputCapture, OutputStore
+
+
+def capture(chunks: list[str], limit: int, store: OutputStore | None = None, forward: bool = False):
+    forwarded = []
+
+    async def on_chunk(text):
+        forwarded.append(text)
+
+    async def scenario():
+        output = OutputCapture(
+            "stdout", limit, on_chunk if forward else None, store, store.new_id() if store else None
+        )
+        for chunk in chunks:
+            await output.write(chunk)
+        await output.close()
+        return output
+
+    return asyncio.run(scenario()), forwarded
+
+
+def test_output_within_the_limit_is_kept_whole():
+    output, forwarded = capture(["hello ", "world"], 16, forward=True)
+    assert not output.truncated
+    assert output.text() == "hello world"
+    assert "".join(forwarded) == "hello world"
+
+
+def test_the_head_and_tail_of_long_output_are_kept():
+    output, _ = capture(["0123456789", "abcdefghij", "ABCDEFGHIJ"], 10)
+    assert output.truncated and output.omitted == 20
+    assert output.text() == "01234\n[... 20 bytes of output omitted ...]\nFGHIJ"
+
+
+def test_forwarded_output_sends_the_head_as_it_comes_and_the_tail_at_the_end():
+    output, forwarded = capture(["0123", "4567", "89ab"], 8, forward=True)
+    assert forwarded == ["0123", "\n[... 4 bytes of output omitted ...]\n89ab"]
+    assert output.text() == "0123\n[... 4 bytes of output omitted ...]\n89ab"
+
+
+def test_characters_split_at_the_end_of_the_head_are_forwarded_whole():
+    # the head ends in the middle of the second "é"
+    output, forwarded = capture(["aéé"], 8, forward=True)
+    assert forwarded == ["aé", "é"]
+    assert not output.truncated
+
+
+def test_full_output_is_spilled_up_to_the_store_limit(tmp_path):
+    store = OutputStore(str(tmp_path), 25, 60)
+    output, _ = capture(["0123456789"] * 4, 10, store)
+
+    assert output.spilled
+    path = store.lookup(output.output_id, "stdout")
+    with open(path, "rb") as spill:
+        assert spill.read() == b"0123456789" * 2 + b"01234"
+    assert store.lookup(output.output_id, "stderr") is None
+    assert store.stats()["spilled"] == 1
+
+
+def test_output_within_the_limit_is_not_spilled(tmp_path):
+    store = OutputStore(str(tmp_path), 25, 60)
+    output, _ = capture(["0123456789"], 10, store)
+    assert not output.spilled
+    assert store.lookup(output.output_id, "stdout") is None
@@ -0,0 +1,30 @@
+import asyncio
+
+from fakeredis import FakeAsyncRedis
+
+from app.jobs.redis_queue import RedisJobQueue
+
+
+def test_cancelled_queued_jobs_do_not_count_as_pending():
+    async def scenario():
+        queue = RedisJobQueue(FakeAsyncRedis(decode_responses=True), 2, 60)
+        first = await queue.submit({"language": "python"})
+        second = await queue.submit({"language": "python"})
+        await queue.cancel(first["jobId"])
+        await queue.cancel(second["jobId"])
+
+        # the cancelled jobs stay in the list, but no longer count against the limit
+        third = await queue.submit({"language": "python"})
+        await queue.submit({"language": "python"})
+        stats = await queue.stats()
+
+        # the worker skips the cancelled jobs without counting them twice
+        job_id, _ = await queue.consume()
+        return third, job_id, stats, await queue.stats(), await queue.get(first["jobId"])
+
+    third, consumed, stats, after, cancelled = asyncio.run(scenario())
+    assert stats["pending"] == 2
+    assert stats["rejected"] == 0
+    assert consumed == third["jobId"]
+    assert after["pending"] == 1
+    assert cancelled["status"] == "cancelled"
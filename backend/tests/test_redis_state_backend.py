@@ -0,0 +1,85 @@
+import asyncio
+
+from fakeredis import FakeAsyncRedis, FakeRedis, FakeServer
+
+from app.backends.redis_backend import RedisStateBackend
+from app.service.document_service import INSERT
+
+
+def make_backend(server: FakeServer) -> RedisStateBackend:
+    return RedisStateBackend(FakeAsyncRedis(server=server, decode_responses=True))
+
+
+def test_members_join_and_leave_all_their_rooms():
+    async def scenario():
+        backend = make_backend(FakeServer())
+        await backend.join("a", "sid-1", "alice", "editor")
+        await backend.join("b", "sid-1", "alice", "editor")
+        await backend.join("a", "sid-2", "bob", "viewer")
+        members = await backend.members("a")
+        roles = await backend.role_counts("a")
+
+        left = await backend.leave_all("sid-1")
+        return members, roles, left, await backend.members("a"), await backend.member_count("b")
+
+    members, roles, left, remaining, count_b = asyncio.run(scenario())
+    assert sorted(members, key=lambda member: member["socketId"]) == [
+        {"socketId": "sid-1", "username": "alice", "role": "editor"},
+        {"socketId": "sid-2", "username": "bob", "role": "viewer"},
+    ]
+    assert roles == {"editor": 1, "viewer": 1}
+    assert sorted(left) == [("a", "alice"), ("b", "alice")]
+    assert remaining == [{"socketId": "sid-2", "username": "bob", "role": "viewer"}]
+    assert count_b == 0
+
+
+def test_document_updates_retry_when_another_worker_wrote_first():
+    server = FakeServer()
+    other_worker = FakeRedis(server=server, decode_responses=True)
+    attempts = []
+
+    def update(document):
+        attempts.append(document.version)
+        if len(attempts) == 1:
+            # another worker replaces the document between WATCH and MULTI
+            other_worker.hset("simcode:doc:r", mapping={"text": "theirs", "version": 1})
+            other_worker.rpush("simcode:doc:r:history", '[["insert", 0, "theirs"]]')
+        return document.apply(document.version, [(INSERT, 0, "mine ")])
+
+    async def scenario():
+        backend = make_backend(server)
+        result = await backend._update_document("r", None, update)
+        return result, await backend.get_document("r")
+
+    (ops, version), document = asyncio.run(scenario())
+    assert attempts == [0, 1]
+    assert ops == [(INSERT, 0, "mine ")]
+    assert version == 2
+    assert document == ("mine theirs", 2)
+
+
+def test_members_of_a_dead_worker_are_removed():
+    async def scenario():
+        server = FakeServer()
+        crashed = make_backend(server)
+        await crashed.heartbeat()
+        await crashed.join("r", "ghost", "alice", "editor")
+
+        alive = make_backend(server)
+        await alive.start()
+        await alive.join("r", "live", "bob", "editor")
+        # the crashed worker's heartbeat is still fresh
+        kept = await alive.remove_dead_workers()
+
+        await alive.redis.delete(crashed._worker_key(crashed.worker_id))
+        removed = await alive.remove_dead_workers()
+        members = await alive.members("r")
+        await alive.stop()
+        return kept, removed, members, await crashed.members("r")
+
+    kept, removed, members, after_stop = asyncio.run(scenario())
+    assert kept == 0
+    assert removed == 1
+    assert members == [{"socketId": "live", "username": "bob", "role": "editor"}]
+    # a worker that stops takes its members along
+    assert after_stop == []
@@ -0,0 +1,56 @@
+import asyncio
+
+from app.service.result_cache import ResultCache
+
+
+def test_cancelling_the_last_waiter_cancels_the_run():
+    async def scenario():
+        cache = ResultCache(10, 60)
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def run():
+            started.set()
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        first = asyncio.create_task(cache.get_or_run("key", run))
+        second = asyncio.create_task(cache.get_or_run("key", run))
+        await started.wait()
+
+        first.cancel()
+        await asyncio.sleep(0.01)
+        assert not cancelled.is_set()
+
+        second.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        await asyncio.sleep(0)
+        return cache.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["in_flight"] == 0
+    assert stats["entries"] == 0
+
+
+def test_remaining_waiters_get_the_result():
+    async def scenario():
+        cache = ResultCache(10, 60)
+        release = asyncio.Event()
+
+        async def run():
+            await release.wait()
+            return {"stdout": "done"}
+
+        first = asyncio.create_task(cache.get_or_run("key", run))
+        second = asyncio.create_task(cache.get_or_run("key", run))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+        return await second, cache.stats()
+
+    result, stats = asyncio.run(scenario())
+    assert result == {"stdout": "done"}
+    assert stats["entries"] == 1
@@ -0,0 +1,87 @@
+import asyncio
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.backends.memory import InMemoryStateBackend
+from app.models.base import Base
+from app.models.room_model import RoomEdit, RoomSnapshot  # registers the room tables
+from app.repositories import room_repo
+from app.service.document_service import DELETE, INSERT
+from app.service.room_persistence import RoomPersistence
+
+
+def make_persistence(backend, session_factory) -> RoomPersistence:
+    persistence = RoomPersistence(backend, 60, 10**6, 3600, 10**6)
+    persistence.session_factory = session_factory
+    return persistence
+
+
+"""
+Run `scenario(session_factory)` against a fresh SQLite database
+"""
+def with_database(tmp_path, scenario):
+    async def run():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'rooms.db'}")
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        try:
+            return await scenario(async_sessionmaker(bind=engine, expire_on_commit=False))
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+
+def test_rooms_are_restored_from_the_snapshot_and_the_edit_log(tmp_path):
+    async def scenario(session_factory):
+        backend = InMemoryStateBackend()
+        persistence = make_persistence(backend, session_factory)
+        await backend.restore_document("r", "hello", 0)
+        await backend.update_settings("r", lang="python")
+        persistence.record_snapshot_change("r")
+        await persistence.flush("r")
+
+        for ops in ([(INSERT, 5, " world")], [(DELETE, 0, 1), (INSERT, 0, "H")]):
+            _, version = await backend.apply_ops("r", (await backend.get_document("r"))[1], ops)
+            persistence.record_edits("r", version, ops)
+        await persistence.flush("r")
+
+        async with session_factory() as db:
+            snapshot = await room_repo.get_snapshot(db, "r")
+            edits = await room_repo.get_edits(db, "r", snapshot.version)
+        restored = await make_persistence(InMemoryStateBackend(), session_factory).load("r")
+        return snapshot.version, len(edits), persistence.stats(), restored
+
+    snapshot_version, edits, stats, restored = with_database(tmp_path, scenario)
+    # the edits went to the log, not into a new snapshot
+    assert snapshot_version == 0
+    assert edits == 2
+    assert stats["snapshots"] == 1 and stats["edit_flushes"] == 1
+    assert restored == ("Hello world", 2, {"lang": "python"})
+
+
+def test_replay_stops_at_a_gap_in_the_edit_log(tmp_path):
+    async def scenario(session_factory):
+        async with session_factory() as db:
+            await room_repo.save_snapshot(db, "r", "abc", None, None, 2)
+            await room_repo.append_edits(db, "r", [(3, [(INSERT, 3, "d")]), (5, [(INSERT, 5, "f")])])
+        return await make_persistence(InMemoryStateBackend(), session_factory).load("r")
+
+    assert with_database(tmp_path, scenario) == ("abcd", 3, {})
+
+
+def test_edits_that_do_not_apply_are_counted_as_errors(tmp_path):
+    async def scenario(session_factory):
+        persistence = make_persistence(InMemoryStateBackend(), session_factory)
+        async with session_factory() as db:
+            await room_repo.save_snapshot(db, "saved", "abc", None, None, 1)
+            await room_repo.append_edits(db, "saved", [(2, [(INSERT, 3, "d")]), (3, [(DELETE, 9, 1)])])
+            await room_repo.append_edits(db, "unsaved", [(1, [(DELETE, 0, 1)])])
+        saved = await persistence.load("saved")
+        unsaved = await persistence.load("unsaved")
+        return saved, unsaved, persistence.stats()
+
+    saved, unsaved, stats = with_database(tmp_path, scenario)
+    assert saved == ("abcd", 2, {})
+    assert unsaved is None
+    assert stats["errors"] == 2
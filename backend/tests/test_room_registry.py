@@ -0,0 +1,50 @@
+from app.backends.room_registry import RoomRegistry
+
+
+def test_join_lists_members_with_their_roles():
+    registry = RoomRegistry()
+    registry.join("r", "sid-1", "alice", "host")
+    registry.join("r", "sid-2", "bob", "viewer")
+    registry.join("other", "sid-1", "alice", "editor")
+
+    assert registry.members("r") == [
+        {"socketId": "sid-1", "username": "alice", "role": "host"},
+        {"socketId": "sid-2", "username": "bob", "role": "viewer"},
+    ]
+    assert registry.member_count("r") == 2
+    assert registry.role_counts("r") == {"host": 1, "viewer": 1}
+    assert registry.rooms_of("sid-1") == {"r", "other"}
+
+
+def test_joining_again_updates_the_role():
+    registry = RoomRegistry()
+    registry.join("r", "sid-1", "alice", "editor")
+    registry.join("r", "sid-1", "alice", "viewer")
+    assert registry.members("r") == [{"socketId": "sid-1", "username": "alice", "role": "viewer"}]
+
+
+def test_leave_returns_the_username_only_for_members():
+    registry = RoomRegistry()
+    registry.join("r", "sid-1", "alice", "editor")
+    registry.join("r", "sid-2", "bob", "editor")
+
+    assert registry.leave("r", "sid-1") == "alice"
+    assert registry.leave("r", "sid-1") is None
+    assert registry.leave("missing", "sid-2") is None
+    assert registry.members("r") == [{"socketId": "sid-2", "username": "bob", "role": "editor"}]
+    assert registry.rooms_of("sid-1") == set()
+
+
+def test_rooms_and_sockets_are_evicted_with_their_last_member():
+    registry = RoomRegistry()
+    registry.join("a", "sid-1", "alice", "editor")
+    registry.join("b", "sid-1", "alice", "editor")
+    registry.join("b", "sid-2", "bob", "viewer")
+
+    assert sorted(registry.leave_all("sid-1")) == [("a", "alice"), ("b", "alice")]
+    assert registry.leave_all("sid-1") == []
+    assert registry.stats() == {"rooms": 1, "members": 1, "roles": {"viewer": 1}}
+
+    registry.leave("b", "sid-2")
+    assert registry.stats() == {"rooms": 0, "members": 0, "roles": {}}
+    assert registry.members("b") == [] and registry.member_count("b") == 0
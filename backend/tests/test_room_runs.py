@@ -0,0 +1,28 @@
+import asyncio
+
+from app.sockets import code_events
+from app.sockets.roles import socket_roles
+from app.sockets.socket_manager import sio
+
+
+def test_runs_are_attributed_to_the_user_of_the_token(monkeypatch):
+    requests = []
+
+    class FakeRoomRuns:
+        async def run(self, room, username, lang):
+            requests.append((room, username, lang))
+            return {"jobId": "job-1"}, False
+
+    async def get_session(sid, namespace=None):
+        return {"username": "alice", "role": "editor"}
+
+    monkeypatch.setattr(code_events, "room_runs", FakeRoomRuns())
+    monkeypatch.setattr(sio, "get_session", get_session)
+    socket_roles.set("runs-sid", "runs-room", "editor")
+    try:
+        ack = asyncio.run(code_events.run("runs-sid", {"roomId": "runs-room", "username": "mallory", "lang": "python"}))
+    finally:
+        socket_roles.discard("runs-sid", "runs-room")
+
+    assert ack == {"executionId": "job-1", "attached": False}
+    assert requests == [("runs-room", "alice", "python")]
@@ -0,0 +1,86 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from app.constants import CASE_SCRIPT_FILE_NAME
+from app.models import code as code_models
+from app.service import execution_service
+from app.service.execution_service import CASE_MARK, run_test_cases
+
+
+class FakeSession:
+    async def upload(self):
+        pass
+
+    def command(self, argv, stdin=False):
+        return argv, {}
+
+
+class FakeExecutor:
+    @asynccontextmanager
+    async def session(self, run):
+        yield FakeSession()
+
+
+"""
+Sandbox whose setup exits with `setup_status` and whose program prints the
+sum of the numbers on its input; "sleep" makes it run into the time limit
+"""
+def fake_sandbox(monkeypatch, setup_status: int = 0):
+    async def run_process(args, timeout, on_stdout=None, on_stderr=None, input=None, **kwargs):
+        if args[0] != f"./{CASE_SCRIPT_FILE_NAME}":
+            if setup_status:
+                await on_stderr("main.py: syntax error\n")
+            return setup_status, "", ""
+
+        time_limit = float(args[1])
+        stdin = input.decode()
+        if stdin == "sleep":
+            await on_stderr(f"{CASE_MARK}100.0 {100.0 + time_limit}\n")
+            return 124, "", ""
+        await on_stdout(f"{sum(int(value) for value in stdin.split())}\n")
+        await on_stderr(f"{CASE_MARK}100.0 100.25\n")
+        return 0, "", ""
+
+    monkeypatch.setattr(execution_service, "run_process", run_process)
+    monkeypatch.setitem(execution_service.EXECUTORS, "docker", FakeExecutor())
+    monkeypatch.setitem(execution_service.EXECUTORS, "process", FakeExecutor())
+
+
+def make_batch(*cases: code_models.TestCase) -> code_models.TestCaseBatch:
+    return code_models.TestCaseBatch(language="python", code="print(sum(map(int, input().split())))", testCases=list(cases))
+
+
+def test_every_case_gets_its_own_result(monkeypatch):
+    fake_sandbox(monkeypatch)
+    batch = make_batch(
+        code_models.TestCase(stdin="2 3", expectedOutput="5"),
+        code_models.TestCase(stdin="1 1", expectedOutput="3"),
+        code_models.TestCase(stdin="4"),
+        code_models.TestCase(stdin="sleep", expectedOutput="0", timeLimit=1),
+    )
+    streamed = []
+
+    async def on_case(index, result):
+        streamed.append(index)
+
+    result = asyncio.run(run_test_cases(batch, on_case=on_case))
+    cases = result["cases"]
+
+    assert streamed == [0, 1, 2, 3]
+    assert [case["passed"] for case in cases] == [True, False, None, False]
+    assert [case["stdout"] for case in cases[:3]] == ["5\n", "2\n", "4\n"]
+    # the wall time comes from the case script's mark, which is not part of the output
+    assert cases[0]["wall_time"] == 0.25 and cases[0]["stderr"] == ""
+    assert cases[3]["timed_out"] and not cases[0]["timed_out"]
+    assert result["passed"] == 1 and result["failed"] == 2
+    assert result["setup"]["exit_code"] == 0
+
+
+def test_no_case_runs_when_the_setup_fails(monkeypatch):
+    fake_sandbox(monkeypatch, setup_status=1)
+    result = asyncio.run(run_test_cases(make_batch(code_models.TestCase(stdin="1", expectedOutput="1"))))
+
+    assert result["cases"] == []
+    assert result["setup"]["exit_code"] == 1
+    assert "syntax error" in result["setup"]["stderr"]
+    assert result["passed"] == 0 and result["failed"] == 0
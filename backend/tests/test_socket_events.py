@@ -0,0 +1,91 @@
+import asyncio
+
+from app.sockets import code_events, room_events
+from app.sockets.socket_manager import SOCKET_EVENT_ERRORS, SOCKET_EVENTS, sio
+
+
+def test_disconnect_is_counted_once_without_errors():
+    events = SOCKET_EVENTS._values.get(("disconnect",), 0)
+    errors = SOCKET_EVENT_ERRORS._values.get(("disconnect",), 0)
+
+    # python-socketio 5 passes the disconnect reason
+    asyncio.run(sio._trigger_event("disconnect", "/", "test-sid", sio.reason.CLIENT_DISCONNECT))
+
+    assert SOCKET_EVENTS._values.get(("disconnect",), 0) - events == 1
+    assert SOCKET_EVENT_ERRORS._values.get(("disconnect",), 0) - errors == 0
+
+
+def test_join_uses_the_user_of_the_token_and_anonymous_sockets_only_watch(monkeypatch):
+    sessions = {"token-sid": {"username": "alice", "role": "editor"}, "anonymous-sid": {}}
+    emitted = []
+
+    async def get_session(sid, namespace=None):
+        return sessions[sid]
+
+    async def enter_room(sid, room, namespace=None):
+        pass
+
+    async def emit(event, data=None, **kwargs):
+        emitted.append((event, data))
+
+    async def get_room_state(room):
+        return None
+
+    monkeypatch.setattr(sio, "get_session", get_session)
+    monkeypatch.setattr(sio, "enter_room", enter_room)
+    monkeypatch.setattr(sio, "emit", emit)
+    monkeypatch.setattr(room_events, "get_room_state", get_room_state)
+
+    async def scenario():
+        await room_events.join("token-sid", {"roomId": "join-room", "username": "mallory"})
+        await room_events.join("anonymous-sid", {"roomId": "join-room", "username": "guest"})
+        members = await room_events.state_backend.members("join-room")
+        for sid in sessions:
+            await room_events.state_backend.leave_all(sid)
+            room_events.socket_roles.discard(sid, "join-room")
+        return members
+
+    members = asyncio.run(scenario())
+    assert sorted((member["username"], member["role"]) for member in members) == [
+        ("alice", "editor"),
+        ("guest", "viewer"),
+    ]
+
+
+def test_invalid_language_and_prerequisite_changes_are_sent_back(monkeypatch):
+    emitted, published = [], []
+
+    async def emit(event, data=None, to=None, **kwargs):
+        emitted.append((event, data, to))
+
+    def publish_latest(room, event, payload, skip_sid=None):
+        published.append((event, payload))
+
+    monkeypatch.setattr(sio, "emit", emit)
+    monkeypatch.setattr(code_events.broadcaster, "publish_latest", publish_latest)
+    monkeypatch.setattr(code_events, "image_cache", None)
+    monkeypatch.setattr(code_events, "room_persistence", None)
+    code_events.socket_roles.set("editor-sid", "settings-room", "editor")
+
+    async def scenario():
+        await code_events.lang_change("editor-sid", {"roomId": "settings-room", "lang": "python"})
+        await code_events.lang_change("editor-sid", {"roomId": "settings-room", "lang": "cobol"})
+        await code_events.lang_change("editor-sid", {"roomId": "settings-room", "lang": ["python"]})
+        await code_events.prereq_change("editor-sid", {"roomId": "settings-room", "prerequisites": {"pip": "x"}})
+        await code_events.lang_change("editor-sid", {"roomId": "settings-room", "lang": "markdown"})
+        settings = await code_events.state_backend.get_settings("settings-room")
+        await code_events.state_backend.drop_document("settings-room")
+        return settings
+
+    try:
+        settings = asyncio.run(scenario())
+    finally:
+        code_events.socket_roles.discard("editor-sid", "settings-room")
+
+    assert published == [("lang_change", {"lang": "python"}), ("lang_change", {"lang": "markdown"})]
+    assert emitted == [
+        ("lang_change", {"lang": "python"}, "editor-sid"),
+        ("lang_change", {"lang": "python"}, "editor-sid"),
+        ("prereq_change", {"prereq": ""}, "editor-sid"),
+    ]
+    assert settings == {"lang": "markdown"}
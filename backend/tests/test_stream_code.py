@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from app.constants import (
+    ACTION_EXECUTION_EXIT,
+    ACTION_EXECUTION_STARTED,
+    ACTION_EXECUTION_STDERR,
+    ACTION_EXECUTION_STDOUT,
+)
+from app.models.code import Code
+from app.service import execution_service
+from app.service.execution_engine import ExecutionQueueFull
+from app.service.execution_service import stream_code
+
+
+def fake_run(monkeypatch, run):
+    async def run_sandboxed(code, on_start=None, on_stdout=None, on_stderr=None):
+        return await run(on_start, on_stdout, on_stderr)
+
+    monkeypatch.setattr(execution_service, "run_sandboxed", run_sandboxed)
+
+
+def collect(events: list):
+    async def emit(event, payload):
+        events.append((event, payload))
+
+    return emit
+
+
+def test_output_is_streamed_in_order_as_it_is_produced(monkeypatch):
+    events = []
+
+    async def run(on_start, on_stdout, on_stderr):
+        await on_start()
+        await on_stdout("one\n")
+        # the caller has seen the first chunk before the run goes on
+        assert events[-1][1]["data"] == "one\n"
+        await on_stderr("warning\n")
+        await on_stdout("two\n")
+        return {"stdout": "", "stderr": "", "exit_code": 0, "truncated": False, "output_id": None}
+
+    fake_run(monkeypatch, run)
+    result = asyncio.run(stream_code(Code(language="python", code=""), collect(events), execution_id="exec-1"))
+
+    assert result == {"executionId": "exec-1", "exit_code": 0, "truncated": False, "output_id": None}
+    assert [event for event, _ in events] == [
+        ACTION_EXECUTION_STARTED,
+        ACTION_EXECUTION_STDOUT,
+        ACTION_EXECUTION_STDERR,
+        ACTION_EXECUTION_STDOUT,
+        ACTION_EXECUTION_EXIT,
+    ]
+    assert [payload["seq"] for _, payload in events] == [0, 1, 2, 3, 4]
+    assert all(payload["executionId"] == "exec-1" for _, payload in events)
+    assert events[0][1]["language"] == "python"
+    assert events[-1][1]["exit_code"] == 0
+
+
+def test_failed_and_cancelled_runs_still_send_an_exit_event(monkeypatch):
+    async def rejected(on_start, on_stdout, on_stderr):
+        raise ExecutionQueueFull()
+
+    async def cancelled(on_start, on_stdout, on_stderr):
+        await on_start()
+        raise asyncio.CancelledError()
+
+    events = []
+    fake_run(monkeypatch, rejected)
+    with pytest.raises(ExecutionQueueFull):
+        asyncio.run(stream_code(Code(language="python", code=""), collect(events)))
+    assert [event for event, _ in events] == [ACTION_EXECUTION_EXIT]
+    assert events[0][1]["exit_code"] is None and "retry" in events[0][1]["message"]
+
+    events.clear()
+    fake_run(monkeypatch, cancelled)
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(stream_code(Code(language="python", code=""), collect(events)))
+    assert [event for event, _ in events] == [ACTION_EXECUTION_STARTED, ACTION_EXECUTION_EXIT]
+    assert events[-1][1]["cancelled"] is True
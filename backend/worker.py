@@ -0,0 +1,60 @@
+import asyncio
+import logging
+import signal
+
+import socketio
+from app.backends.redis_backend import SOCKETIO_CHANNEL
+from app.constants import JOB_QUEUE, JOB_WORKERS, LOG_FORMAT, LOG_LEVEL, REDIS_URL
+from app.jobs import job_queue
+from app.jobs.worker import ExecutionWorker
+from app.service.container_pool import container_pool
+from app.service.image_cache import image_cache
+from app.service.local_sandbox import local_sandbox
+from app.service.workspace import workspace_manager
+
+logger = logging.getLogger("worker")
+
+"""
+Standalone execution worker: consumes jobs from the shared Redis job queue
+and runs them in sandboxes on this host. Room events are published through
+Redis, so the web processes (running with STATE_BACKEND=redis) deliver them
+to the sockets in the room.
+"""
+async def main():
+    if JOB_QUEUE != "redis":
+        raise SystemExit("Separate execution workers need JOB_QUEUE=redis")
+
+    emitter = socketio.AsyncRedisManager(REDIS_URL, channel=SOCKETIO_CHANNEL, write_only=True)
+    worker = ExecutionWorker(job_queue, emitter.emit, JOB_WORKERS)
+
+    await job_queue.start()
+    await workspace_manager.start()
+    if container_pool:
+        await container_pool.start()
+    if local_sandbox:
+        await local_sandbox.start()
+    if image_cache:
+        await image_cache.load()
+    await worker.start()
+    logger.info("Execution worker started with %s slots", JOB_WORKERS)
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+    await stopping.wait()
+
+    await worker.stop()
+    if image_cache:
+        await image_cache.stop()
+    if container_pool:
+        await container_pool.stop()
+    if local_sandbox:
+        await local_sandbox.stop()
+    await workspace_manager.stop()
+    await job_queue.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+    asyncio.run(main())
@@ -3,11 +3,20 @@ const ACTIONS = {
     JOINED: 'joined',
     DISCONNECTED: 'disconnected',
     CODE_CHANGE: 'code_change',
-    SYNC_CODE: 'sync_code',
+    CODE_OP: 'code_op',
+    CODE_OP_BATCH: 'code_op_batch',
+    CODE_OP_ACK: 'code_op_ack',
+    CODE_SYNC: 'code_sync',
+    ROOM_STATE: 'room_state',
     LEAVE: 'leave',
     LANG_CHANGE: 'lang_change',
     PREREQ_CHANGE: 'prereq_change',
-    CODE_EXECUTED: 'code_executed'
+    CODE_EXECUTED: 'code_executed',
+    RUN: 'run',
+    EXECUTION_STARTED: 'execution_started',
+    EXECUTION_STDOUT: 'execution_stdout',
+    EXECUTION_STDERR: 'execution_stderr',
+    EXECUTION_EXIT: 'execution_exit'
 };
 
 module.exports = ACTIONS;
\ No newline at end of file
@@ -0,0 +1,204 @@
+// Client side of the delta-based document sync (see "Delta-based document
+// sync" in the README). Ops use the wire format of the server,
+// {pos, insert: text} or {pos, delete: length}, and transform exactly like
+// backend/app/service/document_service.py, so that every client converges
+// on the server's text.
+
+// how long remote ops may wait for a missing version before the client asks
+// the server for the whole document
+const GAP_TIMEOUT_MS = 2000;
+
+const isInsert = (op) => op.insert !== undefined;
+
+// Transform `op` so that it applies after `against` has been applied. When
+// both insert at the same position, the op that `wins` is placed first.
+// Returns a list, since a delete can be split in two or vanish entirely.
+export const transform = (op, against, wins) => {
+    if (isInsert(against)) {
+        const length = against.insert.length;
+        if (isInsert(op)) {
+            if (against.pos < op.pos || (against.pos === op.pos && !wins)) {
+                return [{ pos: op.pos + length, insert: op.insert }];
+            }
+            return [op];
+        }
+
+        // delete against insert: an insert inside the deleted range survives
+        if (against.pos <= op.pos) {
+            return [{ pos: op.pos + length, delete: op.delete }];
+        }
+        if (against.pos >= op.pos + op.delete) {
+            return [op];
+        }
+        const before = against.pos - op.pos;
+        return [
+            { pos: op.pos, delete: before },
+            { pos: op.pos + length, delete: op.delete - before },
+        ];
+    }
+
+    const otherEnd = against.pos + against.delete;
+    if (isInsert(op)) {
+        if (op.pos <= against.pos) return [op];
+        if (op.pos >= otherEnd) return [{ pos: op.pos - against.delete, insert: op.insert }];
+        return [{ pos: against.pos, insert: op.insert }];
+    }
+
+    // delete against delete: drop the part that is already gone
+    const end = op.pos + op.delete;
+    if (end <= against.pos) return [op];
+    if (op.pos >= otherEnd) return [{ pos: op.pos - against.delete, delete: op.delete }];
+    const overlap = Math.min(end, otherEnd) - Math.max(op.pos, against.pos);
+    const remaining = op.delete - overlap;
+    return remaining ? [{ pos: Math.min(op.pos, against.pos), delete: remaining }] : [];
+};
+
+// Transform two concurrent op sequences against each other. Returns
+// [ops', against'] where ops' applies after `against` and against' applies
+// after `ops`; `against` wins ties.
+export const transformSequences = (ops, against) => {
+    if (!ops.length || !against.length) return [ops, against];
+
+    if (ops.length > 1) {
+        const [head, afterHead] = transformSequences(ops.slice(0, 1), against);
+        const [tail, afterTail] = transformSequences(ops.slice(1), afterHead);
+        return [head.concat(tail), afterTail];
+    }
+
+    if (against.length > 1) {
+        const [afterHead, head] = transformSequences(ops, against.slice(0, 1));
+        const [afterTail, tail] = transformSequences(afterHead, against.slice(1));
+        return [afterTail, head.concat(tail)];
+    }
+
+    return [transform(ops[0], against[0], false), transform(against[0], ops[0], true)];
+};
+
+// Ops equivalent to a CodeMirror change object. The editor has already
+// applied the change, but the text before `from` is unchanged by it.
+export const opsFromChange = (editor, change) => {
+    const pos = editor.indexFromPos(change.from);
+    const removed = change.removed.join('\n').length;
+    const inserted = change.text.join('\n');
+    const ops = [];
+    if (removed) ops.push({ pos, delete: removed });
+    if (inserted) ops.push({ pos, insert: inserted });
+    return ops;
+};
+
+// Apply remote ops to a CodeMirror editor, with `origin` so that the
+// editor's change handler does not send them back
+export const applyToEditor = (editor, ops, origin) => {
+    editor.operation(() => {
+        for (const op of ops) {
+            const from = editor.posFromIndex(op.pos);
+            if (isInsert(op)) {
+                editor.replaceRange(op.insert, from, undefined, origin);
+            } else {
+                editor.replaceRange('', from, editor.posFromIndex(op.pos + op.delete), origin);
+            }
+        }
+    });
+};
+
+// Keeps the local copy of a room's document in step with the server.
+// Local edits are sent against the last server version the client has
+// integrated, one batch at a time: while a batch waits for its
+// `code_op_ack`, further edits are buffered. Acks and remote ops are
+// integrated strictly in version order, because the broadcast of remote ops
+// may arrive after the ack of a later local batch. Remote ops are
+// transformed over the local ops the server has not seen yet.
+export class CodeSync {
+    constructor({ send, applyRemote, requestSync }) {
+        this.send = send;
+        this.applyRemote = applyRemote;
+        this.requestSync = requestSync;
+        this.version = 0;
+        this.inflight = null;
+        this.buffer = [];
+        // version -> remote ops, or null for the ack of the batch in flight
+        this.received = new Map();
+        this.gapTimer = null;
+    }
+
+    // Start over from the server's whole document at `version`; local edits
+    // that were not acknowledged are dropped
+    reset(version) {
+        this.version = version;
+        this.inflight = null;
+        this.buffer = [];
+        for (const received of this.received.keys()) {
+            if (received <= version) this.received.delete(received);
+        }
+        this.drain();
+    }
+
+    local(ops) {
+        if (!ops.length) return;
+        this.buffer = this.buffer.concat(ops);
+        this.flush();
+    }
+
+    ack(version) {
+        this.receive(version, null);
+    }
+
+    remote(version, ops) {
+        this.receive(version, ops);
+    }
+
+    flush() {
+        if (this.inflight || !this.buffer.length) return;
+        this.inflight = this.buffer;
+        this.buffer = [];
+        this.send(this.inflight, this.version);
+    }
+
+    receive(version, ops) {
+        if (version > this.version) {
+            this.received.set(version, ops);
+            this.drain();
+        }
+    }
+
+    drain() {
+        while (this.received.has(this.version + 1)) {
+            const ops = this.received.get(this.version + 1);
+            this.received.delete(this.version + 1);
+            this.version += 1;
+
+            if (ops !== null) {
+                this.integrate(ops);
+            } else if (this.inflight) {
+                this.inflight = null;
+                this.flush();
+            } else {
+                // the batch was dropped by a reset, but the server applied it
+                this.requestSync();
+            }
+        }
+
+        if (!this.received.size) {
+            clearTimeout(this.gapTimer);
+            this.gapTimer = null;
+        } else if (!this.gapTimer) {
+            this.gapTimer = setTimeout(() => {
+                this.gapTimer = null;
+                if (this.received.size) this.requestSync();
+            }, GAP_TIMEOUT_MS);
+        }
+    }
+
+    integrate(ops) {
+        if (this.inflight) {
+            [this.inflight, ops] = transformSequences(this.inflight, ops);
+        }
+        [this.buffer, ops] = transformSequences(this.buffer, ops);
+        this.applyRemote(ops);
+    }
+
+    stop() {
+        clearTimeout(this.gapTimer);
+        this.gapTimer = null;
+    }
+}
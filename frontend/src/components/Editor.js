@@ -2,6 +2,7 @@ import React, { useEffect, useRef } from 'react';
 import { useRecoilValue } from 'recoil';
 import { cmtheme, mode } from '../../src/atoms';
 import ACTIONS from '../actions/Actions';
+import { CodeSync, applyToEditor, opsFromChange } from '../codeSync';
 
 // CODE MIRROR
 import Codemirror from 'codemirror';
@@ -44,12 +45,29 @@ import 'codemirror/addon/hint/show-hint';
 import 'codemirror/addon/hint/show-hint.css';
 
 
+// origin of the changes made by other members, which are not sent back
+const REMOTE_ORIGIN = 'remote';
+
 const Editor = ({ socketRef, roomId, onCodeChange }) => {
 
     const editorRef = useRef(null);
+    const syncRef = useRef(null);
     const editorMode = useRecoilValue(mode);
     const editorTheme = useRecoilValue(cmtheme);
 
+    // edits are exchanged as ops, so a keystroke costs the same in any file size
+    if (!syncRef.current) {
+        syncRef.current = new CodeSync({
+            send: (ops, version) => {
+                socketRef.current.emit(ACTIONS.CODE_OP, { roomId, version, ops });
+            },
+            applyRemote: (ops) => applyToEditor(editorRef.current, ops, REMOTE_ORIGIN),
+            requestSync: () => {
+                socketRef.current.emit(ACTIONS.CODE_SYNC, { roomId });
+            },
+        });
+    }
+
     useEffect(() => {
         async function init() {
             if (!editorRef.current) {
@@ -70,15 +88,10 @@ const Editor = ({ socketRef, roomId, onCodeChange }) => {
                     }
                 );
 
-                editorRef.current.on('change', (instance, changes) => {
-                    const { origin } = changes;
-                    const code = instance.getValue();
-                    onCodeChange(code);
-                    if (origin !== 'setValue') {
-                        socketRef.current.emit(ACTIONS.CODE_CHANGE, {
-                            roomId,
-                            code,
-                        });
+                editorRef.current.on('change', (instance, change) => {
+                    onCodeChange(instance.getValue());
+                    if (change.origin !== 'setValue' && change.origin !== REMOTE_ORIGIN) {
+                        syncRef.current.local(opsFromChange(instance, change));
                     }
                 });
             }
@@ -91,16 +104,42 @@ const Editor = ({ socketRef, roomId, onCodeChange }) => {
     }, [editorMode]);
 
     useEffect(() => {
+        // the whole document, on join, in viewer snapshots and when the
+        // server could not reconcile this client's edits
+        const handleCode = ({ code, version }) => {
+            if (code === null || code === undefined) return;
+            if (editorRef.current.getValue() !== code) {
+                editorRef.current.setValue(code);
+            }
+            syncRef.current.reset(version || 0);
+        };
+        const handleOp = ({ ops, version, socketId }) => {
+            // this client's own ops are covered by their ack
+            if (socketId !== socketRef.current.id) {
+                syncRef.current.remote(version, ops);
+            }
+        };
+        const handleOpBatch = ({ batch }) => batch.forEach(handleOp);
+        const handleAck = ({ version }) => syncRef.current.ack(version);
+
         if (socketRef.current) {
-            socketRef.current.on(ACTIONS.CODE_CHANGE, ({ code }) => {
-                if (code !== null) {
-                    editorRef.current.setValue(code);
-                }
-            });
+            socketRef.current.on(ACTIONS.CODE_CHANGE, handleCode);
+            socketRef.current.on(ACTIONS.ROOM_STATE, handleCode);
+            socketRef.current.on(ACTIONS.CODE_SYNC, handleCode);
+            socketRef.current.on(ACTIONS.CODE_OP, handleOp);
+            socketRef.current.on(ACTIONS.CODE_OP_BATCH, handleOpBatch);
+            socketRef.current.on(ACTIONS.CODE_OP_ACK, handleAck);
         }
 
         return () => {
-            socketRef.current.off(ACTIONS.CODE_CHANGE);
+            syncRef.current.stop();
+            if (!socketRef.current) return;
+            socketRef.current.off(ACTIONS.CODE_CHANGE, handleCode);
+            socketRef.current.off(ACTIONS.ROOM_STATE, handleCode);
+            socketRef.current.off(ACTIONS.CODE_SYNC, handleCode);
+            socketRef.current.off(ACTIONS.CODE_OP, handleOp);
+            socketRef.current.off(ACTIONS.CODE_OP_BATCH, handleOpBatch);
+            socketRef.current.off(ACTIONS.CODE_OP_ACK, handleAck);
         };
     }, [socketRef.current]);
 
@@ -6,17 +6,23 @@ const PrerequisitesInput = ({ socketRef, roomId, onPrerequisitesChange }) => {
     const [prerequisites, setPrerequisites] = useState("");
 
     useEffect(() => {
+        const handlePrerequisites = (prereq) => {
+            if (prereq !== null && prereq !== undefined) {
+                setPrerequisites(prereq);
+                onPrerequisitesChange(prereq);
+            }
+        };
+        const handlePrereqChange = ({prereq}) => handlePrerequisites(prereq);
+        const handleRoomState = ({prerequisites}) => handlePrerequisites(prerequisites);
+
         if (socketRef.current) {
-            socketRef.current.on(ACTIONS.PREREQ_CHANGE, ({prereq}) => {
-                if (prereq !== null) {
-                    setPrerequisites(prereq);
-                    onPrerequisitesChange(prereq);
-                }
-            });
+            socketRef.current.on(ACTIONS.PREREQ_CHANGE, handlePrereqChange);
+            socketRef.current.on(ACTIONS.ROOM_STATE, handleRoomState);
         }
 
         return () => {
             socketRef.current.off(ACTIONS.PREREQ_CHANGE);
+            socketRef.current.off(ACTIONS.ROOM_STATE, handleRoomState);
         };
     }, [socketRef.current]);
 
@@ -4,7 +4,7 @@ import { useNavigate } from "react-router-dom";
 import ACTIONS from "../actions/Actions";
 import { initSocket } from "../socket";
 
-const useSocket = (roomId, username, setClients, setLang, setStdout, setStderr, codeRef, prereqRef, lang) => {
+const useSocket = (roomId, username, setClients, setLang, setStdout, setStderr) => {
     const socketRef = useRef(null);
     const navigate = useNavigate();
 
@@ -33,16 +33,17 @@ const useSocket = (roomId, username, setClients, setLang, setStdout, setStderr,
                     toast.success(`${username} joined the room.`);
                 }
                 setClients(clients);
-
-                // Sync code with the newly joined client
-                socketRef.current.emit(ACTIONS.SYNC_CODE, {
-                    code: codeRef.current,
-                    prerequisites: prereqRef.current,
-                    lang,
-                    socketId,
-                });
             });
 
+            // The server sends the room's language (and code) on join
+            socketRef.current.on(ACTIONS.ROOM_STATE, handleRoomState);
+
+            function handleRoomState({ lang }) {
+                if (lang) {
+                    setLang(lang);
+                }
+            }
+
             // Listen for disconnected event
             socketRef.current.on(ACTIONS.DISCONNECTED, ({ socketId, username }) => {
                 toast.success(`${username} left the room.`);
@@ -54,11 +55,31 @@ const useSocket = (roomId, username, setClients, setLang, setStdout, setStderr,
                 setLang(lang);
             });
 
-            // Listen for code execution results
+            // Listen for code execution results relayed by older clients
             socketRef.current.on(ACTIONS.CODE_EXECUTED, ({ stdout, stderr }) => {
                 setStdout(stdout);
                 setStderr(stderr);
             });
+
+            // Output of the room's runs is streamed to every member; only the
+            // latest run is shown, events of runs it preempted are ignored
+            let executionId = null;
+            socketRef.current.on(ACTIONS.EXECUTION_STARTED, (event) => {
+                executionId = event.executionId;
+                setStdout("");
+                setStderr("");
+            });
+            socketRef.current.on(ACTIONS.EXECUTION_STDOUT, (event) => {
+                if (event.executionId === executionId) setStdout((prev) => prev + event.data);
+            });
+            socketRef.current.on(ACTIONS.EXECUTION_STDERR, (event) => {
+                if (event.executionId === executionId) setStderr((prev) => prev + event.data);
+            });
+            socketRef.current.on(ACTIONS.EXECUTION_EXIT, (event) => {
+                if (event.executionId === executionId && event.message && !event.cancelled) {
+                    toast.error(event.message);
+                }
+            });
         };
 
         init();
@@ -67,9 +88,14 @@ const useSocket = (roomId, username, setClients, setLang, setStdout, setStderr,
             // Cleanup socket listeners and disconnect
             if (socketRef.current) {
                 socketRef.current.off(ACTIONS.JOINED);
+                socketRef.current.off(ACTIONS.ROOM_STATE);
                 socketRef.current.off(ACTIONS.DISCONNECTED);
                 socketRef.current.off(ACTIONS.LANG_CHANGE);
                 socketRef.current.off(ACTIONS.CODE_EXECUTED);
+                socketRef.current.off(ACTIONS.EXECUTION_STARTED);
+                socketRef.current.off(ACTIONS.EXECUTION_STDOUT);
+                socketRef.current.off(ACTIONS.EXECUTION_STDERR);
+                socketRef.current.off(ACTIONS.EXECUTION_EXIT);
                 socketRef.current.disconnect();
             }
         };
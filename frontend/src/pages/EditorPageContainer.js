@@ -8,8 +8,6 @@ import EditorPage from "../components/EditorPage";
 import useSocket from "../hooks/useSocket";
 
 const EditorPageContainer = () => {
-    const apiUrl = `${process.env.REACT_APP_BACKEND_URL}/api/execute`;
-
     const [, setEditorMode] = useRecoilState(mode);
     const [lang, setLang] = useRecoilState(language);
     const [theme, setTheme] = useRecoilState(cmtheme);
@@ -31,10 +29,7 @@ const EditorPageContainer = () => {
         setClients,
         setLang,
         setStdout,
-        setStderr,
-        codeRef,
-        prereqRef,
-        lang
+        setStderr
     );
 
     async function copyRoomId() {
@@ -68,41 +63,22 @@ const EditorPageContainer = () => {
         }
     }
 
-    const submitCodeHandler = async () => {
-        if (lang === "markdown" || !codeRef.current) return;
+    // The server runs the room's code and streams the output to every member
+    const submitCodeHandler = () => {
+        if (lang === "markdown" || !socketRef.current) return;
 
         if (!prereqRef.current && !codeRef.current) {
             toast.error("Please enter code or pre-requisites");
             return;
         }
 
-        try {
-            const response = await fetch(apiUrl, {
-                method: "POST",
-                headers: {
-                    "Content-Type": "application/json",
-                },
-                body: JSON.stringify({
-                    language: lang,
-                    prerequisites: prereqRef.current,
-                    code: codeRef.current,
-                }),
-            });
-
-            if (!response.ok) throw new Error(`Error during code execution: ${response.status}`);
-            const data = await response.json();
-            setStdout(data.stdout);
-            setStderr(data.stderr);
-
-            socketRef.current.emit(ACTIONS.CODE_EXECUTED, {
-                roomId,
-                stdout: data.stdout,
-                stderr: data.stderr,
-            });
-        } catch (error) {
-            toast.error("Error while trying to execute code");
-            console.log(error);
-        }
+        socketRef.current.emit(
+            ACTIONS.RUN,
+            { roomId, lang, username: location.state?.username },
+            (ack) => {
+                if (ack?.error) toast.error(ack.error.message || "Error while trying to execute code");
+            }
+        );
     };
 
     if (!location.state) {
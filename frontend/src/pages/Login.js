@@ -38,8 +38,8 @@ const Login = () => {
             const data = await response.json();
             console.log('Login success:', data);
 
-            // You can save the token to localStorage if you want
-            // localStorage.setItem('token', data.access_token);
+            // sent with the socket connection to join rooms as this user
+            localStorage.setItem('token', data.access_token);
 
             // Navigate to dashboard or home page
             navigate('/home');
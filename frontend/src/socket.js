@@ -6,6 +6,12 @@ export const initSocket = async () => {
         reconnectionAttempt: 'Infinity',
         timeout: 10000,
         transports: ['websocket'],
+        // the access token from the login, read on every (re)connection;
+        // without one the server gives the socket its default room role
+        auth: (cb) => {
+            const token = localStorage.getItem('token');
+            cb(token ? { token } : {});
+        },
     };
     return io(process.env.REACT_APP_BACKEND_URL, options);
 };
\ No newline at end of file